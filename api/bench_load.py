@@ -0,0 +1,130 @@
+"""
+Teste de carga das rotas de leitura consultadas em polling pelo frontend.
+
+Simula N navegadores (threads, uma sessão HTTP cada) chamando em rodízio
+/dashboard/, /measurements/series, /limits e /alarms/status sem pausa,
+durante --duration segundos para cada nível de concorrência, e mede
+requisições/s, latência (p50/p95/p99) e erros. O teto de concorrência é
+o nível a partir do qual a vazão para de subir e só a latência cresce.
+Em paralelo, uma sonda chama a cada 100 ms uma rota síncrona (--probe,
+padrão /health/db): a latência dela mostra quanto o pool de threads do
+Starlette fica ocupado pelo polling (rotas `def` esperam vaga nele).
+
+Rode contra a API já no ar (um processo uvicorn, para comparar versões):
+  uvicorn main:app --port 8000
+  python bench_load.py --url http://localhost:8000 --concurrency 10,50,100,200 --json carga.json
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import requests
+
+ENDPOINTS = {
+    "dashboard": ("/dashboard/", {}),
+    "series": ("/measurements/series", {"minutes": 60}),
+    "limits": ("/limits", {}),
+    "alarms": ("/alarms/status", {}),
+}
+
+
+def worker(base_url, endpoints, stop_at, out, offset):
+    session = requests.Session()
+    lat, errors, i = [], 0, offset
+    while time.perf_counter() < stop_at:
+        path, params = endpoints[i % len(endpoints)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            ok = session.get(base_url + path, params=params, timeout=60).status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            lat.append((time.perf_counter() - t0) * 1000)
+        else:
+            errors += 1
+    out.append((lat, errors))
+
+
+def probe(base_url, path, stop_at, out):
+    session = requests.Session()
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        try:
+            session.get(base_url + path, timeout=60)
+            out.append((time.perf_counter() - t0) * 1000)
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+
+
+def run_level(base_url, endpoints, concurrency, duration, probe_path):
+    out, threads, probe_lat = [], [], []
+    stop_at = time.perf_counter() + duration
+    if probe_path:
+        t = threading.Thread(target=probe, args=(base_url, probe_path, stop_at, probe_lat), daemon=True)
+        t.start()
+        threads.append(t)
+    for n in range(concurrency):
+        t = threading.Thread(target=worker, args=(base_url, endpoints, stop_at, out, n), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    lat = np.concatenate([np.asarray(l, dtype=np.float64) for l, _ in out]) if out else np.zeros(0)
+    errors = sum(e for _, e in out)
+    result = {"concurrency": concurrency, "requests": int(lat.size), "errors": errors,
+              "rps": lat.size / duration}
+    if lat.size:
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        result.update({"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)})
+    if probe_lat:
+        result.update({"probe_p50_ms": float(np.percentile(probe_lat, 50)),
+                       "probe_p95_ms": float(np.percentile(probe_lat, 95))})
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga nas rotas de leitura da API")
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--tags", default=None, help="tags da série (padrão: as 3 primeiras do /dashboard)")
+    ap.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    ap.add_argument("--concurrency", default="10,50,100,200")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por nível")
+    ap.add_argument("--probe", default="/health/db", help="rota síncrona medida durante a carga (vazio desliga)")
+    ap.add_argument("--json", type=str, default=None, help="grava os resultados neste arquivo")
+    args = ap.parse_args()
+
+    base_url = args.url.rstrip("/")
+    tags = args.tags
+    if tags is None:
+        kpis = requests.get(base_url + "/dashboard/", timeout=30).json()["data"]["eta"]["kpis"]
+        tags = ",".join(k["label"] for k in kpis[:3])
+    endpoints = []
+    for name in args.endpoints.split(","):
+        path, params = ENDPOINTS[name]
+        endpoints.append((path, {**params, "tags": tags} if name == "series" else params))
+
+    results = []
+    for c in (int(x) for x in args.concurrency.split(",")):
+        r = run_level(base_url, endpoints, c, args.duration, args.probe)
+        results.append(r)
+        print(f"[{c:4d} clientes] {r['rps']:8.1f} req/s  p50 {r.get('p50_ms', 0):8.1f} ms  "
+              f"p95 {r.get('p95_ms', 0):8.1f} ms  p99 {r.get('p99_ms', 0):8.1f} ms  erros {r['errors']}  "
+              f"sonda p50 {r.get('probe_p50_ms', 0):7.1f} ms  p95 {r.get('probe_p95_ms', 0):7.1f} ms")
+    try:
+        print("pool:", requests.get(base_url + "/health/db", timeout=10).json())
+    except (requests.RequestException, ValueError):
+        pass
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+        print(f"OK: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,12 +24,27 @@ class Settings:
     PGUSER: str = os.getenv("PGUSER", os.getenv("POSTGRES_USER", "postgres"))
     PGPASSWORD: str = os.getenv("PGPASSWORD", os.getenv("POSTGRES_PASSWORD", "postgres"))
     PGDATABASE: str = os.getenv("PGDATABASE", os.getenv("POSTGRES_DB", "eta"))
+    # Pool de conexões da engine compartilhada (ver database/connection.py)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "60000"))
     
     # Configurações da Aplicação
     LOCAL_TZ: str = os.getenv("LOCAL_TZ", os.getenv("TZ", "America/Fortaleza"))
     FEED_INTERVAL: int = int(os.getenv("FEED_INTERVAL", "5"))
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
-    
+
+    # Séries e relatórios (rollups, ver services/rollup_service.py)
+    SERIES_RAW_MINUTES: int = int(os.getenv("SERIES_RAW_MINUTES", "180"))
+    SERIES_MAX_POINTS: int = int(os.getenv("SERIES_MAX_POINTS", "1500"))
+    REPORT_RAW_MAX_ROWS: int = int(os.getenv("REPORT_RAW_MAX_ROWS", "200000"))
+    # Arquivo frio em Parquet (ver services/archive_service.py)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    # Dias mais recentes que ficam em eta.measurement (o mesmo de worker/pack_blocks.py)
+    BLOCK_KEEP_DAYS: int = int(os.getenv("BLOCK_KEEP_DAYS", "7"))
+
     # Configurações de Email (Brevo)
     BREVO_API_KEY: str = os.getenv("BREVO_API_KEY", "")
     ALERT_SENDER_EMAIL: str = os.getenv("ALERT_SENDER_EMAIL", "admin@aqualink.com")
@@ -1,13 +1,27 @@
 """
 Módulo de conexão com o banco de dados.
 
-Gerencia a criação da engine SQLAlchemy e formatação da URL de conexão.
+Gerencia as engines SQLAlchemy do processo, criadas na partida da API, e a
+formatação da URL de conexão:
+  - get_engine(): síncrona, para rotas `def` e serviços (relatórios, auth);
+  - get_async_engine(): assíncrona (psycopg async), para as rotas `async def`
+    de leitura consultadas em polling pelo frontend.
+Cada uma tem o próprio pool, com os mesmos limites de DB_POOL_*.
 """
 
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Optional
+from sqlalchemy import create_engine, exc
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from core.config import settings
 
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+_engine_lock = threading.Lock()
+
 def to_sqlalchemy_url(url: str) -> str:
     """
     Converte URLs de conexão para o formato suportado pelo SQLAlchemy/Psycopg.
@@ -39,11 +53,154 @@ def get_db_url() -> str:
         return to_sqlalchemy_url(url)
     return f"postgresql+psycopg://{settings.PGUSER}:{settings.PGPASSWORD}@{settings.PGHOST}:{settings.PGPORT}/{settings.PGDATABASE}"
 
+class _CheckoutTimer:
+    """
+    Mede a espera de cada checkout do pool (fila + abertura de conexão nova),
+    para expor saturação em pool_status().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - t0
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total_s += waited
+                self.wait_max_s = max(self.wait_max_s, waited)
+
+class TimedQueuePool(_CheckoutTimer, QueuePool):
+    """QueuePool da engine síncrona, com espera de checkout medida."""
+
+class TimedAsyncQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    """Pool da engine assíncrona, com espera de checkout medida."""
+
+def _engine_options() -> dict:
+    connect_args = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+def create_app_engine() -> Engine:
+    """
+    Cria a engine síncrona com o pool configurado em settings (DB_POOL_*) e o
+    statement_timeout aplicado a cada conexão.
+
+    Returns:
+        Engine: Engine nova; a API usa a compartilhada de get_engine().
+    """
+    return create_engine(get_db_url(), poolclass=TimedQueuePool, **_engine_options())
+
+def create_app_async_engine() -> AsyncEngine:
+    """
+    Cria a engine assíncrona (mesma URL, driver psycopg em modo async) com o
+    mesmo pool e statement_timeout da síncrona.
+
+    Returns:
+        AsyncEngine: Engine nova; a API usa a compartilhada de get_async_engine().
+    """
+    return create_async_engine(get_db_url(), poolclass=TimedAsyncQueuePool, **_engine_options())
+
+def init_engine() -> Engine:
+    """
+    Cria as engines compartilhadas, se ainda não existirem (chamado no lifespan da API).
+
+    Returns:
+        Engine: Engine síncrona do processo.
+    """
+    global _engine, _async_engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_app_engine()
+        if _async_engine is None:
+            _async_engine = create_app_async_engine()
+    return _engine
+
 def get_engine() -> Engine:
     """
-    Cria e retorna uma engine SQLAlchemy.
-    
+    Retorna a engine síncrona compartilhada do processo.
+
+    Criada no lifespan da API; fora dela (scripts, testes) é criada no
+    primeiro uso.
+
+    Returns:
+        Engine: Engine com pool de conexões e pool_pre_ping=True.
+    """
+    return _engine if _engine is not None else init_engine()
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Retorna a engine assíncrona compartilhada do processo.
+
+    Returns:
+        AsyncEngine: Engine com pool de conexões e pool_pre_ping=True.
+    """
+    if _async_engine is None:
+        init_engine()
+    return _async_engine
+
+async def dispose_engine() -> None:
+    """
+    Fecha as conexões dos pools e descarta as engines compartilhadas (fim do lifespan).
+    """
+    global _engine, _async_engine
+    with _engine_lock:
+        engine, async_engine = _engine, _async_engine
+        _engine = _async_engine = None
+    if engine is not None:
+        engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def _pool_status(pool) -> dict:
+    capacity = pool.size() + settings.DB_MAX_OVERFLOW
+    in_use = pool.checkedout()
+    status = {
+        "pool_size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "in_use": in_use,
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "utilization": round(in_use / capacity, 3) if capacity else None,
+    }
+    if isinstance(pool, _CheckoutTimer):
+        with pool._stats_lock:
+            n = pool.checkouts
+            status.update({
+                "checkouts": n,
+                "checkout_wait_avg_ms": round(pool.wait_total_s / n * 1000, 3) if n else 0.0,
+                "checkout_wait_max_ms": round(pool.wait_max_s * 1000, 3),
+                "checkout_timeouts": pool.timeouts,
+            })
+    return status
+
+def pool_status() -> dict:
+    """
+    Estado dos pools das engines compartilhadas.
+
     Returns:
-        Engine: Engine configurada com pool_pre_ping=True.
+        dict: Para "sync" e "async": tamanho configurado, conexões em
+        uso/ociosas/overflow, utilização (em uso / máximo) e espera de
+        checkout (total de checkouts, média e máxima em ms, timeouts).
     """
-    return create_engine(get_db_url(), pool_pre_ping=True)
\ No newline at end of file
+    return {"sync": _pool_status(get_engine().pool), "async": _pool_status(get_async_engine().pool)}
@@ -1,8 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from database.connection import dispose_engine, init_engine, pool_status
 from routers import auth, dashboard, reports, measurements, limits, alarms
 
-app = FastAPI(title="Aqualink API", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Cria as engines (e os pools de conexões) uma vez por processo, na
+    partida, e fecha as conexões no desligamento.
+    """
+    init_engine()
+    yield
+    await dispose_engine()
+
+app = FastAPI(title="Aqualink API", version="0.2.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,4 +39,14 @@ def root():
     Retorna:
         dict: Um dicionário contendo status, nome do serviço e versão.
     """
-    return {"ok": True, "service": "Aqualink API", "version": "0.2.0"}
\ No newline at end of file
+    return {"ok": True, "service": "Aqualink API", "version": "0.2.0"}
+
+@app.get("/health/db")
+def health_db():
+    """
+    Estado dos pools de conexões com o banco (engine síncrona e assíncrona).
+
+    Retorna:
+        dict: Conexões em uso/ociosas, utilização e espera de checkout (ver database.connection.pool_status).
+    """
+    return pool_status()
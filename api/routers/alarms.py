@@ -1,19 +1,19 @@
 from fastapi import APIRouter
 from sqlalchemy import text
-from database.connection import get_engine
+from database.connection import get_async_engine, get_engine
 from schemas.alarms import AlarmsIn 
 
 router = APIRouter()
 
 @router.get("/alarms/status")
-def alarms_status():
+async def alarms_status():
     """
     Verifica o estado global do sistema de alarmes (Ativado/Desativado).
     Se a configuração não existir na base de dados, assume 'True' por omissão.
     """
-    eng = get_engine()
-    with eng.connect() as conn:
-        row = conn.execute(text("SELECT alarms_enabled FROM eta.config_sistema WHERE id=1;")).fetchone()
+    eng = get_async_engine()
+    async with eng.connect() as conn:
+        row = (await conn.execute(text("SELECT alarms_enabled FROM eta.config_sistema WHERE id=1;"))).fetchone()
     
     return {"alarms_enabled": bool(row._mapping["alarms_enabled"]) if row else True}
 
@@ -7,7 +7,7 @@ Fornece dados para a visualização principal do sistema, incluindo KPIs e statu
 from fastapi import APIRouter
 from sqlalchemy import text
 from datetime import datetime
-from database.connection import get_engine
+from database.connection import get_async_engine
 from schemas.dashboard import DashboardOut, DashboardKPI
 
 router = APIRouter()
@@ -22,22 +22,21 @@ def categorize(tag: str) -> str:
     return "default"
 
 @router.get("/", response_model=DashboardOut)
-def get_dashboard():
+async def get_dashboard():
     """
     Retorna os dados consolidados para o dashboard.
     
     Inclui os valores mais recentes dos sensores e seus limites configurados.
+    Assíncrona (consultada em polling): não ocupa thread do pool do Starlette.
     """
-    eng = get_engine()
-    with eng.connect() as conn:
-        last = conn.execute(text("""
-            SELECT m.ts, s.tag, m.value, s.unit
-            FROM eta.measurement m
-            JOIN eta.sensor s ON s.id = m.sensor_id
-            JOIN (SELECT sensor_id, max(ts) as ts FROM eta.measurement GROUP BY sensor_id) l 
-            ON l.sensor_id = m.sensor_id AND l.ts = m.ts
-        """)).fetchall()
-        lim_rows = conn.execute(text("SELECT tag, limite FROM eta.config_limites")).fetchall()
+    eng = get_async_engine()
+    async with eng.connect() as conn:
+        last = (await conn.execute(text("""
+            SELECT l.ts, s.tag, l.value, s.unit
+            FROM eta.sensor_latest l
+            JOIN eta.sensor s ON s.id = l.sensor_id
+        """))).fetchall()
+        lim_rows = (await conn.execute(text("SELECT tag, limite FROM eta.config_limites"))).fetchall()
 
     limits = {r._mapping["tag"]: float(r._mapping["limite"]) for r in lim_rows}
     kpis = []
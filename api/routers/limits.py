@@ -1,20 +1,20 @@
 from typing import Dict
 from fastapi import APIRouter, HTTPException
 from sqlalchemy import text
-from database.connection import get_engine
+from database.connection import get_async_engine, get_engine
 from schemas.limits import LimitsOut, LimitsIn 
 
 router = APIRouter()
 
 @router.get("/limits", response_model=LimitsOut)
-def get_limits():
+async def get_limits():
     """
     Retorna todos os limites configurados no sistema.
     Utilizado para preencher a tabela de configuração de limites no Frontend.
     """
-    eng = get_engine()
-    with eng.connect() as conn:
-        rows = conn.execute(text("SELECT tag, limite FROM eta.config_limites;")).fetchall()
+    eng = get_async_engine()
+    async with eng.connect() as conn:
+        rows = (await conn.execute(text("SELECT tag, limite FROM eta.config_limites;"))).fetchall()
     
     limits: Dict[str, float] = {}
     for r in rows:
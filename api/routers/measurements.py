@@ -1,50 +1,109 @@
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+import pandas as pd
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter
 from sqlalchemy import text
-from database.connection import get_engine
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from database.connection import get_async_engine, get_engine
 from schemas.measurements import SeriesPoint 
+from services.archive_service import read_archived
+from services.block_service import read_blocks
+from services.rollup_service import pick_resolution, rollup_table
 
 router = APIRouter()
 
+
+def read_cold(start_dt: datetime, end_dt: datetime, tags: List[str]) -> List[pd.DataFrame]:
+    """
+    Leituras da janela em meses arquivados (Parquet) e dias compactados (blocos).
+
+    Leitura de arquivos e decodificação NumPy são síncronas e pesadas: roda
+    numa thread do pool (run_in_threadpool) com a engine síncrona, sem
+    segurar o event loop das rotas async.
+    """
+    with get_engine().connect() as conn:
+        frames = (read_archived(conn, start_dt, end_dt, tags, inclusive_end=True),
+                  read_blocks(conn, start_dt, end_dt, tags, inclusive_end=True))
+    return [f for f in frames if not f.empty]
+
+
 @router.get("/measurements/series", response_model=Dict[str, List[SeriesPoint]])
-def series(tags: str, minutes: int = 60):
+async def series(tags: str, minutes: int = 60, end: Optional[datetime] = None):
     """
     Recupera séries temporais de medições para os sensores especificados.
+
+    A janela são os `minutes` minutos até `end` (padrão: agora). Janelas
+    longas vêm dos rollups (média/mín/máx por bucket) na resolução mais fina
+    que cabe em SERIES_MAX_POINTS pontos por tag, qualquer que seja a idade;
+    só janelas de até SERIES_RAW_MINUTES usam leituras brutas. Blocos e
+    Parquet guardam só dias anteriores a BLOCK_KEEP_DAYS, então só uma janela
+    estreita e antiga (com `end` no passado) os lê, depois do banco.
     """
     tag_list = [t.strip() for t in tags.split(",") if t.strip()]
 
     if not tag_list:
         return {}
 
-    end_dt = datetime.utcnow()
+    if end is None:
+        end_dt = datetime.utcnow()
+    else:
+        # naive em UTC, como utcnow()
+        end_dt = end.astimezone(timezone.utc).replace(tzinfo=None) if end.tzinfo else end
     start_dt = end_dt - timedelta(minutes=minutes)
     
-    eng = get_engine() 
-
-    with eng.connect() as conn:
-        q = text(
-            """
-            SELECT m.ts, s.tag, m.value, s.unit
-            FROM eta.measurement m
-            JOIN eta.sensor s ON s.id = m.sensor_id
-            WHERE m.ts >= :start_dt AND m.ts <= :end_dt AND s.tag = ANY(:tags)
-            ORDER BY s.tag, m.ts ASC;
-            """
-        )
-        rows = conn.execute(q, {"start_dt": start_dt, "end_dt": end_dt, "tags": tag_list}).fetchall()
+    eng = get_async_engine()
+
+    resolution = pick_resolution(start_dt, end_dt)
+
+    async with eng.connect() as conn:
+        if resolution is None:
+            q = text(
+                """
+                SELECT m.ts, s.tag, m.value, s.unit
+                FROM eta.measurement m
+                JOIN eta.sensor s ON s.id = m.sensor_id
+                WHERE m.ts >= :start_dt AND m.ts <= :end_dt AND s.tag = ANY(:tags)
+                ORDER BY s.tag, m.ts ASC;
+                """
+            )
+        else:
+            q = text(
+                f"""
+                SELECT r.bucket AS ts, s.tag, r.sum_value / r.n AS value, s.unit,
+                       r.min_value AS min, r.max_value AS max
+                FROM {rollup_table(resolution)} r
+                JOIN eta.sensor s ON s.id = r.sensor_id
+                WHERE r.bucket >= :start_dt AND r.bucket <= :end_dt AND s.tag = ANY(:tags)
+                ORDER BY s.tag, r.bucket ASC;
+                """
+            )
+        rows = [dict(r._mapping) for r in
+                (await conn.execute(q, {"start_dt": start_dt, "end_dt": end_dt, "tags": tag_list})).fetchall()]
+
+    # blocos e arquivos só cobrem dias anteriores a BLOCK_KEEP_DAYS: a janela bruta do painel,
+    # que é recente, nem os consulta
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    cold_before = today - timedelta(days=settings.BLOCK_KEEP_DAYS)
+    if resolution is None and start_dt < cold_before:
+        # meses arquivados em Parquet e dias compactados em blocos entram antes das leituras do banco
+        cold = await run_in_threadpool(read_cold, start_dt, end_dt, tag_list)
+        if cold:
+            rows = sorted(pd.concat(cold).sort_values("ts").to_dict("records") + rows, key=lambda r: r["tag"])
 
     # Dica de tipagem para o editor (opcional, mas bom para dev)
     data: Dict[str, List[SeriesPoint]] = {}
 
     for r in rows:
-        tag = r._mapping["tag"]
-        val = r._mapping["value"]
+        tag = r["tag"]
+        val = r["value"]
 
         data.setdefault(tag, []).append({
-            "ts": r._mapping["ts"],
+            "ts": r["ts"],
             "value": float(val) if val is not None else 0.0,
-            "unit": r._mapping.get("unit"),
+            "unit": r.get("unit"),
+            "min": r.get("min"),
+            "max": r.get("max"),
         })
         # O Pydantic (SeriesPoint) vai validar esse dicionário automaticamente na saída graças ao response_model
 
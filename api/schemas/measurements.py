@@ -6,7 +6,11 @@ class SeriesPoint(BaseModel):
     """
     Esquema otimizado para gráficos (Séries Temporais).
     Não inclui a tag, pois a tag será a chave do dicionário de retorno.
+    Em janelas longas cada ponto é um bucket de rollup: `value` é a média e
+    `min`/`max` o envelope do bucket.
     """
     ts: datetime
     value: float
-    unit: Optional[str] = None
\ No newline at end of file
+    unit: Optional[str] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Módulo de serviço do arquivo frio.
+
+Lê leituras de meses já arquivados em Parquet (worker/archive_measurements.py,
+eta-stack/db/10_measurement_archive.sql) para completar consultas ao banco
+que alcançam períodos fora da janela quente.
+"""
+
+import os
+import pandas as pd
+from datetime import datetime
+from typing import Optional, List
+from sqlalchemy import text
+from core.config import settings
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+COLUMNS = ["ts", "tag", "value", "unit", "quality", "meta"]
+
+def _utc(dt: datetime) -> pd.Timestamp:
+    """Datas sem fuso são tratadas como UTC (como nas consultas da API)."""
+    ts = pd.Timestamp(dt)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def read_archived(conn, start_dt: datetime, end_dt: datetime, tags: Optional[List[str]] = None,
+                  inclusive_end: bool = False) -> pd.DataFrame:
+    """
+    Retorna as leituras arquivadas no período, com as colunas de COLUMNS.
+
+    Consulta eta.measurement_archive para achar os arquivos que cobrem o
+    período e lê só as linhas dele (memory map, filtro por ts no Parquet).
+    Sem arquivos no período, retorna um DataFrame vazio sem abrir nada.
+
+    Args:
+        conn: Conexão SQLAlchemy.
+        start_dt (datetime): Início (inclusivo).
+        end_dt (datetime): Fim (exclusivo, ou inclusivo com inclusive_end).
+        tags (List[str], optional): Restringe às tags informadas.
+    """
+    query_str = """
+        SELECT a.path, s.tag, s.unit
+        FROM eta.measurement_archive a
+        JOIN eta.sensor s ON s.id = a.sensor_id
+        WHERE a.ts_min <= :end_dt AND a.ts_max >= :start_dt
+    """
+    params = {"start_dt": start_dt, "end_dt": end_dt}
+    if tags:
+        query_str += " AND s.tag = ANY(:tags)"
+        params["tags"] = tags
+    files = conn.execute(text(query_str), params).fetchall()
+    if not files:
+        return pd.DataFrame(columns=COLUMNS)
+    if pq is None:
+        raise RuntimeError("pyarrow não instalado: necessário para ler o arquivo Parquet")
+
+    lo, hi = _utc(start_dt), _utc(end_dt)
+    frames = []
+    for f in files:
+        m = f._mapping
+        t = pq.read_table(os.path.join(settings.ARCHIVE_DIR, m["path"]), columns=["ts", "value", "quality", "meta"],
+                          memory_map=True, filters=[("ts", ">=", lo), ("ts", "<=" if inclusive_end else "<", hi)])
+        if t.num_rows:
+            frames.append(t.to_pandas().assign(tag=m["tag"], unit=m["unit"]))
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
@@ -0,0 +1,76 @@
+"""
+Decodificação dos blocos de eta.measurement_block.
+
+Lado de leitura de worker/block_codec.py (a API é empacotada à parte do
+worker): as duas cópias precisam ficar em sincronia com o formato gravado
+por worker/pack_blocks.py.
+"""
+
+import json
+import struct
+import zlib
+
+import numpy as np
+
+_TS_HEADER = struct.Struct("<qqB")
+
+
+def _unzigzag(u):
+    u = u.astype(np.uint64)
+    return ((u >> np.uint64(1)).view(np.int64) ^ -(u & np.uint64(1)).view(np.int64))
+
+
+def _unpack_bits(buf, n, width):
+    if width == 0 or n == 0:
+        return np.zeros(n, dtype=np.uint64)
+    bits = np.unpackbits(np.frombuffer(buf, dtype=np.uint8), count=n * width).reshape(n, width)
+    full = np.zeros((n, 64), dtype=np.uint8)
+    full[:, 64 - width:] = bits
+    return np.packbits(full, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def _span_mask(lead, length):
+    j = np.arange(8)
+    return (j >= lead[:, None]) & (j < (lead + length)[:, None])
+
+
+def decode_ts(buf, n):
+    """bytes -> ts em µs (int64)."""
+    first, delta, width = _TS_HEADER.unpack_from(buf)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    dod = _unzigzag(_unpack_bits(buf[_TS_HEADER.size:], max(n - 2, 0), width))
+    deltas = np.cumsum(np.concatenate(([delta], dod)), dtype=np.int64)[:n - 1]
+    return first + np.concatenate(([0], np.cumsum(deltas, dtype=np.int64)))
+
+
+def decode_values(buf, n):
+    """bytes -> float64."""
+    raw = np.frombuffer(zlib.decompress(buf), dtype=np.uint8)
+    header, payload = raw[:n], raw[n:]
+    lead, length = (header >> 4).astype(np.int64), (header & 0x0F).astype(np.int64)
+    xb = np.zeros((n, 8), dtype=np.uint8)
+    xb[_span_mask(lead, length)] = payload
+    xor = xb.view(">u8").ravel().astype(np.uint64)
+    return np.bitwise_xor.accumulate(xor).view(np.float64)
+
+
+def decode_meta(buf, n):
+    """bytes ou None -> lista de meta (dict ou None)."""
+    out = [None] * n
+    if buf is None:
+        return out
+    runs = json.loads(zlib.decompress(buf))
+    for k, (start, meta) in enumerate(runs):
+        end = runs[k + 1][0] if k + 1 < len(runs) else n
+        out[start:end] = [meta] * (end - start)
+    return out
+
+
+def decode_block(n, ts_data, value_data, quality_data, meta_data=None, with_meta=True):
+    """Colunas de um bloco -> (ts µs, values, quality, metas ou None)."""
+    ts_us = decode_ts(bytes(ts_data), n)
+    values = decode_values(bytes(value_data), n)
+    quality = np.unpackbits(np.frombuffer(bytes(quality_data), dtype=np.uint8), count=n).astype(bool)
+    metas = decode_meta(bytes(meta_data) if meta_data is not None else None, n) if with_meta else None
+    return ts_us, values, quality, metas
@@ -0,0 +1,66 @@
+"""
+Módulo de serviço dos blocos compactados.
+
+Lê leituras de dias já compactados em eta.measurement_block
+(worker/pack_blocks.py, eta-stack/db/11_measurement_block.sql) para completar
+consultas a eta.measurement que alcançam esses dias.
+"""
+
+import pandas as pd
+from datetime import datetime
+from typing import Optional, List
+from sqlalchemy import text
+from services.archive_service import COLUMNS, _utc
+from services.block_codec import decode_block
+
+def read_blocks(conn, start_dt: datetime, end_dt: datetime, tags: Optional[List[str]] = None,
+                inclusive_end: bool = False) -> pd.DataFrame:
+    """
+    Retorna as leituras compactadas do período, com as colunas de COLUMNS.
+
+    Um bloco cobre no máximo um dia UTC, então a busca limita ts_first a
+    [início - 1 dia, fim] e usa o índice de ts_first; só os blocos
+    encontrados são decodificados. Sem blocos no período, retorna um
+    DataFrame vazio.
+
+    Args:
+        conn: Conexão SQLAlchemy.
+        start_dt (datetime): Início (inclusivo).
+        end_dt (datetime): Fim (exclusivo, ou inclusivo com inclusive_end).
+        tags (List[str], optional): Restringe às tags informadas.
+    """
+    query_str = """
+        SELECT b.n, b.ts_data, b.value_data, b.quality_data, b.meta_data, s.tag, s.unit
+        FROM eta.measurement_block b
+        JOIN eta.sensor s ON s.id = b.sensor_id
+        WHERE b.ts_first <= :end_dt AND b.ts_first >= CAST(:start_dt AS timestamptz) - interval '1 day'
+          AND b.ts_last >= :start_dt
+    """
+    params = {"start_dt": start_dt, "end_dt": end_dt}
+    if tags:
+        query_str += " AND s.tag = ANY(:tags)"
+        params["tags"] = tags
+    blocks = conn.execute(text(query_str), params).fetchall()
+    if not blocks:
+        return pd.DataFrame(columns=COLUMNS)
+
+    lo, hi = _utc(start_dt).value // 1000, _utc(end_dt).value // 1000
+    frames = []
+    for b in blocks:
+        m = b._mapping
+        ts_us, values, quality, metas = decode_block(m["n"], m["ts_data"], m["value_data"],
+                                                     m["quality_data"], m["meta_data"])
+        keep = (ts_us >= lo) & ((ts_us <= hi) if inclusive_end else (ts_us < hi))
+        if not keep.any():
+            continue
+        frames.append(pd.DataFrame({
+            "ts": pd.to_datetime(ts_us[keep], unit="us", utc=True),
+            "tag": m["tag"],
+            "value": values[keep],
+            "unit": m["unit"],
+            "quality": quality[keep],
+            "meta": [meta for meta, k in zip(metas, keep) if k],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
@@ -12,6 +12,8 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy import text
 from core.config import settings
 from database.connection import get_engine
+from services.archive_service import read_archived
+from services.block_service import read_blocks
 
 def _sanitize_df(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -34,10 +36,73 @@ def _autosize(ws, data: pd.DataFrame):
             max_len = 18
         ws.set_column(i, i, min(max_len + 2, 40))
 
+def _fetch_hourly(conn, start_dt: datetime, end_dt: datetime, tags: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Lê o rollup horário (eta.measurement_1h) do período.
+    As bordas do período são arredondadas para a hora cheia.
+    """
+    query_str = """
+        SELECT r.bucket AS ts, s.tag, s.unit, r.n, r.sum_value, r.min_value, r.max_value, r.last_ts, r.last_value
+        FROM eta.measurement_1h r
+        JOIN eta.sensor s ON s.id = r.sensor_id
+        WHERE r.bucket >= date_trunc('hour', CAST(:start_dt AS timestamptz)) AND r.bucket < :end_dt
+    """
+    params = {"start_dt": start_dt, "end_dt": end_dt}
+    if tags:
+        query_str += " AND s.tag = ANY(:tags)"
+        params["tags"] = tags
+    rows = conn.execute(text(query_str), params).fetchall()
+    cols = ["ts", "tag", "unit", "n", "sum_value", "min_value", "max_value", "last_ts", "last_value"]
+    df = pd.DataFrame(rows, columns=cols) if rows else pd.DataFrame(columns=cols)
+    if df.empty: return df
+    for col in ("ts", "last_ts"):
+        df[col] = pd.to_datetime(df[col], utc=True).dt.tz_convert(settings.LOCAL_TZ).dt.tz_localize(None)
+    for col in ("n", "sum_value", "min_value", "max_value", "last_value"):
+        df[col] = pd.to_numeric(df[col])
+    return df
+
+def _fetch_raw(conn, start_dt: datetime, end_dt: datetime, tags: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Lê as medições brutas do período (aba "Bruto"), inclusive as já compactadas
+    em blocos ou arquivadas em Parquet.
+    """
+    query_str = """
+        SELECT m.ts, s.tag, m.value, s.unit, m.quality, m.meta
+        FROM eta.measurement m
+        JOIN eta.sensor s ON s.id = m.sensor_id
+        WHERE m.ts >= :start_dt AND m.ts < :end_dt
+    """
+    if tags:
+        query_str += " AND s.tag = ANY(:tags)"
+    query_str += " ORDER BY m.ts ASC;"
+
+    params = {"start_dt": start_dt, "end_dt": end_dt}
+    if tags: params["tags"] = tags
+
+    rows = conn.execute(text(query_str), params).fetchall()
+    df = pd.DataFrame(rows, columns=["ts", "tag", "value", "unit", "quality", "meta"]) if rows else pd.DataFrame(columns=["ts","tag","value","unit","quality","meta"])
+    cold = [f for f in (read_archived(conn, start_dt, end_dt, tags), read_blocks(conn, start_dt, end_dt, tags))
+            if not f.empty]
+    if cold:
+        df = pd.concat(cold + [df], ignore_index=True)
+    return _sanitize_df(df)
+
+def _weighted(df: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Agrega buckets horários: média ponderada pela contagem de leituras.
+    """
+    g = df.groupby(keys, as_index=False).agg(n=("n", "sum"), total=("sum_value", "sum"),
+                                             min=("min_value", "min"), max=("max_value", "max"))
+    g["media"] = g["total"] / g["n"]
+    return g
+
 def generate_excel_report(start_dt: datetime, end_dt: datetime, tags: Optional[List[str]] = None, filename: str = "relatorio.xlsx"):
     """
     Gera um relatório Excel com dados de medições no período especificado.
 
+    Resumo, Diario e Horario vêm do rollup horário; a aba Bruto só traz as
+    leituras quando o período tem até REPORT_RAW_MAX_ROWS delas.
+
     Args:
         start_dt (datetime): Data/hora de início.
         end_dt (datetime): Data/hora de fim.
@@ -49,48 +114,36 @@ def generate_excel_report(start_dt: datetime, end_dt: datetime, tags: Optional[L
     """
     eng = get_engine()
     with eng.connect() as conn:
-        query_str = """
-            SELECT m.ts, s.tag, m.value, s.unit, m.quality, m.meta
-            FROM eta.measurement m
-            JOIN eta.sensor s ON s.id = m.sensor_id
-            WHERE m.ts >= :start_dt AND m.ts < :end_dt
-        """
-        if tags:
-            query_str += " AND s.tag = ANY(:tags)"
-        query_str += " ORDER BY m.ts ASC;"
-        
-        params = {"start_dt": start_dt, "end_dt": end_dt}
-        if tags: params["tags"] = tags
-        
-        rows = conn.execute(text(query_str), params).fetchall()
-        
-    df = pd.DataFrame(rows, columns=["ts", "tag", "value", "unit", "quality", "meta"]) if rows else pd.DataFrame(columns=["ts","tag","value","unit","quality","meta"])
-    df = _sanitize_df(df)
-    
+        hourly = _fetch_hourly(conn, start_dt, end_dt, tags)
+        total = int(hourly["n"].sum()) if not hourly.empty else 0
+        raw = _fetch_raw(conn, start_dt, end_dt, tags) if 0 < total <= settings.REPORT_RAW_MAX_ROWS else None
+
     buf = io.BytesIO()
     with pd.ExcelWriter(buf, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS") as xw:
-        if df.empty:
+        if hourly.empty:
             pd.DataFrame({"aviso": ["Sem dados."]}).to_excel(xw, sheet_name="Resumo", index=False)
         else:
-            df["data"] = df["ts"].dt.date
-            df["hora"] = df["ts"].dt.floor("h")
-
-            # Lógica de agregação (mantida original)
-            last = df.sort_values("ts").groupby("tag", as_index=False).tail(1)
-            resumo = (df.groupby("tag").agg(**{"Qtd": ("value", "count"), "media": ("value", "mean"), "min": ("value", "min"), "max": ("value", "max")})
-                      .reset_index().merge(last[["tag", "value", "ts", "unit"]], on="tag", how="left")
-                      .rename(columns={"value": "ultimo_valor", "ts": "ultimo_ts"}))
+            hourly["data"] = hourly["ts"].dt.date
+            hourly["hora"] = hourly["ts"].dt.floor("h")
+
+            last = hourly.sort_values("last_ts").groupby("tag", as_index=False).tail(1)
+            resumo = (_weighted(hourly, ["tag"]).rename(columns={"n": "Qtd"})[["tag", "Qtd", "media", "min", "max"]]
+                      .merge(last[["tag", "last_value", "last_ts", "unit"]], on="tag", how="left")
+                      .rename(columns={"last_value": "ultimo_valor", "last_ts": "ultimo_ts"}))
             
             seconds = max(0, int((end_dt - start_dt).total_seconds()))
             esperado = max(1, seconds // settings.FEED_INTERVAL)
             resumo["completude_%"] = (resumo["Qtd"] / esperado * 100).clip(upper=100).round(1)
 
             resumo.to_excel(xw, sheet_name="Resumo", index=False)
-            df.groupby(["tag", "data"], as_index=False).agg(media=("value", "mean")).to_excel(xw, sheet_name="Diario", index=False)
-            df.groupby(["tag", "hora"], as_index=False).agg(media=("value", "mean")).to_excel(xw, sheet_name="Horario", index=False)
-            df[["ts", "tag", "unit", "value", "quality", "meta"]].sort_values("ts").to_excel(xw, sheet_name="Bruto", index=False)
+            _weighted(hourly, ["tag", "data"])[["tag", "data", "media"]].to_excel(xw, sheet_name="Diario", index=False)
+            _weighted(hourly, ["tag", "hora"])[["tag", "hora", "media"]].to_excel(xw, sheet_name="Horario", index=False)
+            if raw is not None:
+                raw[["ts", "tag", "unit", "value", "quality", "meta"]].to_excel(xw, sheet_name="Bruto", index=False)
+            else:
+                pd.DataFrame({"aviso": [f"{total} leituras no período; use um intervalo menor para exportar as leituras brutas."]}).to_excel(xw, sheet_name="Bruto", index=False)
 
-            for s in xw.sheets.values(): _autosize(s, df) # Simplificado para exemplo
+            for s in xw.sheets.values(): _autosize(s, resumo) # Simplificado para exemplo
 
     buf.seek(0)
     return StreamingResponse(buf, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": f"attachment; filename={filename}"})
\ No newline at end of file
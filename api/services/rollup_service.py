@@ -0,0 +1,47 @@
+"""
+Módulo de serviço de rollups.
+
+Escolhe a resolução de leitura (bruto, 1 minuto, 1 hora ou 1 dia) para uma
+janela de tempo, usando as tabelas eta.measurement_1m/_1h/_1d mantidas a
+cada gravação (ver eta-stack/db/07_measurement_rollups.sql).
+"""
+
+from datetime import datetime
+from typing import Optional
+from core.config import settings
+
+# (nome, tabela, largura do bucket em segundos), da mais fina para a mais grossa
+RESOLUTIONS = (
+    ("1m", "eta.measurement_1m", 60),
+    ("1h", "eta.measurement_1h", 3600),
+    ("1d", "eta.measurement_1d", 86400),
+)
+
+def pick_resolution(start_dt: datetime, end_dt: datetime, max_points: Optional[int] = None) -> Optional[str]:
+    """
+    Retorna a resolução mais fina que cabe em `max_points` buckets por tag.
+
+    Janelas de até SERIES_RAW_MINUTES minutos usam as leituras brutas (None).
+
+    Args:
+        start_dt (datetime): Início da janela.
+        end_dt (datetime): Fim da janela.
+        max_points (int, optional): Pontos máximos por tag (padrão: SERIES_MAX_POINTS).
+
+    Returns:
+        Optional[str]: '1m', '1h', '1d' ou None para leituras brutas.
+    """
+    seconds = max(0.0, (end_dt - start_dt).total_seconds())
+    if seconds <= settings.SERIES_RAW_MINUTES * 60:
+        return None
+    max_points = max_points or settings.SERIES_MAX_POINTS
+    for name, _, width in RESOLUTIONS:
+        if seconds / width <= max_points:
+            return name
+    return RESOLUTIONS[-1][0]
+
+def rollup_table(resolution: str) -> str:
+    """
+    Retorna a tabela (qualificada) da resolução informada.
+    """
+    return next(table for name, table, _ in RESOLUTIONS if name == resolution)
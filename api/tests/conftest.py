@@ -0,0 +1,5 @@
+import os
+import sys
+
+# os módulos da API são importados a partir de api/, como no uvicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from routers import measurements
+
+
+class Result:
+    def fetchall(self):
+        return []
+
+
+class Conn:
+    def __init__(self, queries):
+        self.queries = queries
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, q, params):
+        self.queries.append((str(q), params))
+        return Result()
+
+
+class Engine:
+    def __init__(self):
+        self.queries = []
+
+    def connect(self):
+        return Conn(self.queries)
+
+
+def run_series(monkeypatch, **kw):
+    engine, cold = Engine(), []
+
+    def read_cold(start_dt, end_dt, tags):
+        cold.append((start_dt, end_dt, tags))
+        return [pd.DataFrame({"ts": [start_dt + timedelta(minutes=1)], "tag": ["a"], "value": [7.5], "unit": ["pH"]})]
+
+    monkeypatch.setattr(measurements, "get_async_engine", lambda: engine)
+    monkeypatch.setattr(measurements, "read_cold", read_cold)
+    return asyncio.run(measurements.series("a", **kw)), engine.queries, cold
+
+
+def test_janela_estreita_antiga_le_blocos_e_parquet(monkeypatch):
+    end = datetime(2025, 3, 10, 12, 0, tzinfo=timezone.utc)
+    data, queries, cold = run_series(monkeypatch, minutes=60, end=end)
+    assert "eta.measurement m" in queries[0][0]
+    assert cold == [(datetime(2025, 3, 10, 11, 0), datetime(2025, 3, 10, 12, 0), ["a"])]
+    assert [p["value"] for p in data["a"]] == [7.5]
+
+
+def test_janela_recente_nao_le_blocos(monkeypatch):
+    data, queries, cold = run_series(monkeypatch, minutes=60)
+    assert "eta.measurement m" in queries[0][0]
+    assert cold == [] and data == {}
+
+
+def test_janela_larga_antiga_usa_rollup(monkeypatch):
+    data, queries, cold = run_series(monkeypatch, minutes=30 * 24 * 60, end=datetime(2025, 3, 10))
+    assert "eta.measurement m" not in queries[0][0]
+    assert cold == []
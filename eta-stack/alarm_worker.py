@@ -120,22 +120,16 @@ def load_config_and_limits(conn) -> tuple[bool, dict]:
 
 def get_last_measurements(conn):
     """
-    Busca a ÚLTIMA leitura de cada sensor na eta.measurement.
+    Busca a ÚLTIMA leitura de cada sensor (eta.sensor_latest, mantida na ingestão).
     """
     query = """
         SELECT
             s.id AS sensor_id,
-            COALESCE(m.tag, m.meta->>'tag', s.tag) AS tag,
-            m.value,
-            m.ts
+            COALESCE(l.meta->>'tag', s.tag) AS tag,
+            l.value,
+            l.ts
         FROM eta.sensor s
-        JOIN LATERAL (
-            SELECT m2.tag, m2.value, m2.ts
-            FROM eta.measurement m2
-            WHERE m2.sensor_id = s.id
-            ORDER BY m2.ts DESC
-            LIMIT 1
-        ) m ON TRUE
+        JOIN eta.sensor_latest l ON l.sensor_id = s.id
         ORDER BY s.id;
     """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
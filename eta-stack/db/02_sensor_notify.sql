@@ -0,0 +1,16 @@
+SET search_path TO eta, public;
+
+-- Avisa os workers de ingestão (LISTEN eta_sensor) quando o cadastro de
+-- sensores muda, para que o cache tag -> id em memória seja atualizado.
+-- payload = operação (INSERT | UPDATE | DELETE)
+CREATE OR REPLACE FUNCTION notify_sensor_change() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('eta_sensor', TG_OP);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sensor_notify ON sensor;
+CREATE TRIGGER trg_sensor_notify
+AFTER INSERT OR DELETE OR UPDATE OF tag ON sensor
+FOR EACH STATEMENT EXECUTE FUNCTION notify_sensor_change();
@@ -0,0 +1,13 @@
+SET search_path TO eta, public;
+
+-- raw_ingest passa a ser escrito uma única vez, já com o status final
+-- (parsed | failed), pelos workers de ingestão. O GIN completo em payload
+-- custava uma entrada de índice por leitura recebida; só as falhas são
+-- consultadas por conteúdo, então o índice fica parcial.
+DROP INDEX IF EXISTS idx_raw_ingest_payload;
+CREATE INDEX IF NOT EXISTS idx_raw_ingest_payload_failed
+  ON raw_ingest USING GIN (payload)
+  WHERE status = 'failed';
+
+-- Para voltar ao GIN completo (ex.: auditoria de payloads aceitos):
+--   CREATE INDEX idx_raw_ingest_payload ON raw_ingest USING GIN (payload);
@@ -0,0 +1,16 @@
+SET search_path TO eta, public;
+
+-- Payloads MQTT em MessagePack/CBOR são guardados como chegaram (bytes),
+-- sem re-encode para JSON. Payloads JSON continuam em `payload` (jsonb),
+-- gravados a partir do texto original recebido.
+ALTER TABLE raw_ingest ADD COLUMN IF NOT EXISTS codec TEXT;           -- json | msgpack | cbor
+ALTER TABLE raw_ingest ADD COLUMN IF NOT EXISTS payload_bin BYTEA;
+ALTER TABLE raw_ingest ALTER COLUMN payload DROP NOT NULL;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'raw_ingest_payload_present') THEN
+    ALTER TABLE raw_ingest
+      ADD CONSTRAINT raw_ingest_payload_present CHECK (payload IS NOT NULL OR payload_bin IS NOT NULL);
+  END IF;
+END$$;
@@ -0,0 +1,9 @@
+SET search_path TO eta, public;
+
+-- O cache de sensores dos workers guarda também meta.compression
+-- (worker/ingest_compress.py): alterações em meta passam a notificar
+-- eta_sensor, o que força a recarga completa do cache.
+DROP TRIGGER IF EXISTS trg_sensor_notify ON sensor;
+CREATE TRIGGER trg_sensor_notify
+AFTER INSERT OR DELETE OR UPDATE OF tag, meta ON sensor
+FOR EACH STATEMENT EXECUTE FUNCTION notify_sensor_change();
@@ -0,0 +1,9 @@
+SET search_path TO eta, public;
+
+-- O cache de sensores dos workers guarda também faixa válida e decimais
+-- (worker/ingest_validate.py): alterações nessas colunas também recarregam
+-- o cache.
+DROP TRIGGER IF EXISTS trg_sensor_notify ON sensor;
+CREATE TRIGGER trg_sensor_notify
+AFTER INSERT OR DELETE OR UPDATE OF tag, meta, min_valid, max_valid, decimals ON sensor
+FOR EACH STATEMENT EXECUTE FUNCTION notify_sensor_change();
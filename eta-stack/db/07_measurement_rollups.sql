@@ -0,0 +1,228 @@
+SET search_path TO eta, public;
+
+-- Rollups de eta.measurement por sensor e bucket (1 minuto, 1 hora, 1 dia,
+-- buckets em UTC): measurement_1m, measurement_1h, measurement_1d com
+--   n, sum_value, min_value, max_value, first_ts/first_value, last_ts/last_value
+-- (média = sum_value / n). Gráficos longos e relatórios leem daqui em vez de
+-- agregar as leituras brutas a cada consulta.
+--
+-- Sem TimescaleDB: tabelas comuns mantidas por triggers de statement com
+-- transition tables. INSERT soma as linhas realmente inseridas (ON CONFLICT
+-- DO NOTHING não conta duas vezes) nos três níveis num único comando;
+-- UPDATE/DELETE recalculam os dias afetados do sensor (rollup_rebuild).
+-- Cargas grandes podem desligar os triggers na sessão com
+--   SET eta.rollup_skip = 'on'
+-- e chamar rollup_rebuild(sensor|NULL, de, até) no fim.
+-- Dias fechados (measurement_day_closed: leituras já compactadas em
+-- measurement_block ou arquivadas em Parquet) não estão mais em measurement:
+-- os rollups são o único agregado deles, e rollup_rebuild os deixa como estão.
+--
+-- Com measurement como hypertable: continuous aggregates com os mesmos nomes
+-- e colunas, com agregação em tempo real (materialized_only = false) e
+-- políticas de refresh. Backfill mais antigo que o start_offset da política
+-- precisa de CALL refresh_continuous_aggregate(...).
+--
+-- As funções fixam search_path: os triggers rodam com o search_path de quem
+-- grava em measurement (workers, API), que normalmente não inclui eta.
+
+-- sem blocos nem arquivo nenhum dia está fechado; 11_measurement_block.sql
+-- redefine (e esta criação não sobrescreve a versão de lá)
+DO $$
+BEGIN
+  IF to_regprocedure('eta.measurement_day_closed(integer, timestamptz)') IS NULL THEN
+    CREATE FUNCTION eta.measurement_day_closed(p_sensor INT, p_ts TIMESTAMPTZ)
+    RETURNS boolean AS 'SELECT false' LANGUAGE sql STABLE;
+  END IF;
+END$$;
+
+CREATE OR REPLACE FUNCTION rollup_rebuild(p_sensor INT, p_from TIMESTAMPTZ, p_to TIMESTAMPTZ)
+RETURNS void AS $$
+DECLARE
+  -- recalcula dias UTC inteiros, para que 1h e 1d saiam completos de 1m
+  d0 TIMESTAMPTZ := date_trunc('day', p_from, 'UTC');
+  d1 TIMESTAMPTZ := CASE WHEN date_trunc('day', p_to, 'UTC') = p_to THEN p_to
+                         ELSE date_trunc('day', p_to, 'UTC') + interval '1 day' END;
+BEGIN
+  -- dias fechados ficam de fora em todos os níveis: recalcular de measurement os apagaria
+  DELETE FROM measurement_1m WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND bucket >= d0 AND bucket < d1
+                               AND NOT measurement_day_closed(sensor_id, bucket);
+  DELETE FROM measurement_1h WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND bucket >= d0 AND bucket < d1
+                               AND NOT measurement_day_closed(sensor_id, bucket);
+  DELETE FROM measurement_1d WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND bucket >= d0 AND bucket < d1
+                               AND NOT measurement_day_closed(sensor_id, bucket);
+
+  INSERT INTO measurement_1m
+  SELECT sensor_id, date_trunc('minute', ts, 'UTC'), count(*), sum(value), min(value), max(value),
+         min(ts), (array_agg(value ORDER BY ts))[1], max(ts), (array_agg(value ORDER BY ts DESC))[1]
+  FROM measurement
+  WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND ts >= d0 AND ts < d1
+  GROUP BY 1, 2
+  HAVING NOT measurement_day_closed(sensor_id, min(ts));
+
+  INSERT INTO measurement_1h
+  SELECT sensor_id, date_trunc('hour', bucket, 'UTC'), sum(n), sum(sum_value), min(min_value), max(max_value),
+         min(first_ts), (array_agg(first_value ORDER BY first_ts))[1],
+         max(last_ts), (array_agg(last_value ORDER BY last_ts DESC))[1]
+  FROM measurement_1m
+  WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND bucket >= d0 AND bucket < d1
+  GROUP BY 1, 2
+  HAVING NOT measurement_day_closed(sensor_id, min(bucket));
+
+  INSERT INTO measurement_1d
+  SELECT sensor_id, date_trunc('day', bucket, 'UTC'), sum(n), sum(sum_value), min(min_value), max(max_value),
+         min(first_ts), (array_agg(first_value ORDER BY first_ts))[1],
+         max(last_ts), (array_agg(last_value ORDER BY last_ts DESC))[1]
+  FROM measurement_1h
+  WHERE (p_sensor IS NULL OR sensor_id = p_sensor) AND bucket >= d0 AND bucket < d1
+  GROUP BY 1, 2
+  HAVING NOT measurement_day_closed(sensor_id, min(bucket));
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+CREATE OR REPLACE FUNCTION rollup_after_insert() RETURNS trigger AS $$
+BEGIN
+  IF current_setting('eta.rollup_skip', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+  -- ORDER BY: writers concorrentes travam as linhas de rollup na mesma ordem
+  WITH m AS (
+    SELECT sensor_id, date_trunc('minute', ts, 'UTC') AS bucket, count(*) AS n, sum(value) AS sum_value,
+           min(value) AS min_value, max(value) AS max_value,
+           min(ts) AS first_ts, (array_agg(value ORDER BY ts))[1] AS first_value,
+           max(ts) AS last_ts, (array_agg(value ORDER BY ts DESC))[1] AS last_value
+    FROM new_rows GROUP BY 1, 2
+  ), h AS (
+    SELECT sensor_id, date_trunc('hour', bucket, 'UTC') AS bucket, sum(n) AS n, sum(sum_value) AS sum_value,
+           min(min_value) AS min_value, max(max_value) AS max_value,
+           min(first_ts) AS first_ts, (array_agg(first_value ORDER BY first_ts))[1] AS first_value,
+           max(last_ts) AS last_ts, (array_agg(last_value ORDER BY last_ts DESC))[1] AS last_value
+    FROM m GROUP BY 1, 2
+  ), ins_m AS (
+    INSERT INTO measurement_1m AS r SELECT * FROM m ORDER BY sensor_id, bucket
+    ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+      n = r.n + EXCLUDED.n, sum_value = r.sum_value + EXCLUDED.sum_value,
+      min_value = LEAST(r.min_value, EXCLUDED.min_value), max_value = GREATEST(r.max_value, EXCLUDED.max_value),
+      first_value = CASE WHEN EXCLUDED.first_ts < r.first_ts THEN EXCLUDED.first_value ELSE r.first_value END,
+      first_ts = LEAST(r.first_ts, EXCLUDED.first_ts),
+      last_value = CASE WHEN EXCLUDED.last_ts >= r.last_ts THEN EXCLUDED.last_value ELSE r.last_value END,
+      last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts)
+  ), ins_h AS (
+    INSERT INTO measurement_1h AS r SELECT * FROM h ORDER BY sensor_id, bucket
+    ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+      n = r.n + EXCLUDED.n, sum_value = r.sum_value + EXCLUDED.sum_value,
+      min_value = LEAST(r.min_value, EXCLUDED.min_value), max_value = GREATEST(r.max_value, EXCLUDED.max_value),
+      first_value = CASE WHEN EXCLUDED.first_ts < r.first_ts THEN EXCLUDED.first_value ELSE r.first_value END,
+      first_ts = LEAST(r.first_ts, EXCLUDED.first_ts),
+      last_value = CASE WHEN EXCLUDED.last_ts >= r.last_ts THEN EXCLUDED.last_value ELSE r.last_value END,
+      last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts)
+  )
+  INSERT INTO measurement_1d AS r
+  SELECT sensor_id, date_trunc('day', bucket, 'UTC'), sum(n), sum(sum_value), min(min_value), max(max_value),
+         min(first_ts), (array_agg(first_value ORDER BY first_ts))[1],
+         max(last_ts), (array_agg(last_value ORDER BY last_ts DESC))[1]
+  FROM h GROUP BY 1, 2 ORDER BY 1, 2
+  ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+    n = r.n + EXCLUDED.n, sum_value = r.sum_value + EXCLUDED.sum_value,
+    min_value = LEAST(r.min_value, EXCLUDED.min_value), max_value = GREATEST(r.max_value, EXCLUDED.max_value),
+    first_value = CASE WHEN EXCLUDED.first_ts < r.first_ts THEN EXCLUDED.first_value ELSE r.first_value END,
+    first_ts = LEAST(r.first_ts, EXCLUDED.first_ts),
+    last_value = CASE WHEN EXCLUDED.last_ts >= r.last_ts THEN EXCLUDED.last_value ELSE r.last_value END,
+    last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+CREATE OR REPLACE FUNCTION rollup_after_change() RETURNS trigger AS $$
+DECLARE
+  k RECORD;
+BEGIN
+  IF current_setting('eta.rollup_skip', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP = 'UPDATE' THEN
+    FOR k IN SELECT sensor_id, date_trunc('day', ts, 'UTC') AS day FROM old_rows
+             UNION SELECT sensor_id, date_trunc('day', ts, 'UTC') FROM new_rows ORDER BY 1, 2 LOOP
+      PERFORM rollup_rebuild(k.sensor_id, k.day, k.day + interval '1 day');
+    END LOOP;
+  ELSE
+    FOR k IN SELECT DISTINCT sensor_id, date_trunc('day', ts, 'UTC') AS day FROM old_rows ORDER BY 1, 2 LOOP
+      PERFORM rollup_rebuild(k.sensor_id, k.day, k.day + interval '1 day');
+    END LOOP;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+DO $$
+DECLARE
+  -- nível, largura do bucket, janela de refresh e intervalo da política (Timescale)
+  lvl RECORD;
+  hyper BOOLEAN := FALSE;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') THEN
+    EXECUTE $q$SELECT EXISTS (SELECT 1 FROM timescaledb_information.hypertables
+                              WHERE hypertable_schema = 'eta' AND hypertable_name = 'measurement')$q$
+      INTO hyper;
+  END IF;
+
+  IF hyper THEN
+    FOR lvl IN SELECT * FROM (VALUES ('1m', '1 minute', '3 hours', '1 minute'),
+                                     ('1h', '1 hour', '3 days', '30 minutes'),
+                                     ('1d', '1 day', '30 days', '1 hour')) v(name, width, lookback, every) LOOP
+      EXECUTE format($f$
+        CREATE MATERIALIZED VIEW IF NOT EXISTS measurement_%s
+        WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+        SELECT sensor_id, time_bucket(%L::interval, ts) AS bucket, count(*) AS n, sum(value) AS sum_value,
+               min(value) AS min_value, max(value) AS max_value,
+               min(ts) AS first_ts, first(value, ts) AS first_value,
+               max(ts) AS last_ts, last(value, ts) AS last_value
+        FROM measurement
+        GROUP BY sensor_id, time_bucket(%L::interval, ts)
+        WITH NO DATA$f$, lvl.name, lvl.width, lvl.width);
+      PERFORM add_continuous_aggregate_policy(format('measurement_%s', lvl.name)::regclass,
+                                              start_offset => lvl.lookback::interval,
+                                              end_offset => lvl.width::interval,
+                                              schedule_interval => lvl.every::interval,
+                                              if_not_exists => true);
+    END LOOP;
+    RETURN;
+  END IF;
+
+  FOR lvl IN SELECT * FROM (VALUES ('1m'), ('1h'), ('1d')) v(name) LOOP
+    EXECUTE format($f$
+      CREATE TABLE IF NOT EXISTS measurement_%s (
+        sensor_id    INT NOT NULL REFERENCES sensor(id) ON DELETE CASCADE,
+        bucket       TIMESTAMPTZ NOT NULL,
+        n            BIGINT NOT NULL,
+        sum_value    DOUBLE PRECISION NOT NULL,
+        min_value    DOUBLE PRECISION NOT NULL,
+        max_value    DOUBLE PRECISION NOT NULL,
+        first_ts     TIMESTAMPTZ NOT NULL,
+        first_value  DOUBLE PRECISION NOT NULL,
+        last_ts      TIMESTAMPTZ NOT NULL,
+        last_value   DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (sensor_id, bucket)
+      )$f$, lvl.name);
+  END LOOP;
+
+  -- primeira instalação: agrega o histórico existente
+  IF NOT EXISTS (SELECT 1 FROM measurement_1m) THEN
+    PERFORM rollup_rebuild(NULL, '-infinity', 'infinity');
+  END IF;
+END$$;
+
+DO $$
+BEGIN
+  IF to_regclass('eta.measurement_1m') IS NOT NULL
+     AND EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'eta' AND tablename = 'measurement_1m') THEN
+    DROP TRIGGER IF EXISTS trg_measurement_rollup_ins ON measurement;
+    CREATE TRIGGER trg_measurement_rollup_ins AFTER INSERT ON measurement
+      REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_insert();
+    DROP TRIGGER IF EXISTS trg_measurement_rollup_upd ON measurement;
+    CREATE TRIGGER trg_measurement_rollup_upd AFTER UPDATE ON measurement
+      REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_change();
+    DROP TRIGGER IF EXISTS trg_measurement_rollup_del ON measurement;
+    CREATE TRIGGER trg_measurement_rollup_del AFTER DELETE ON measurement
+      REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_change();
+  END IF;
+END$$;
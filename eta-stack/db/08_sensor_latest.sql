@@ -0,0 +1,54 @@
+SET search_path TO eta, public;
+
+-- Última leitura de cada sensor: uma linha por sensor, gravada pelos
+-- escritores de eta.measurement (worker/ingest_batch.py, ingest_async.py,
+-- bulk_import.py e make_data.py) na mesma transação das
+-- medições, com um upsert por lote que só anda para frente no tempo:
+--   ON CONFLICT (sensor_id) DO UPDATE ... WHERE EXCLUDED.ts > sensor_latest.ts
+-- Dashboard, alarm worker e v_latest_per_sensor leem daqui, com custo
+-- proporcional ao número de sensores e não ao tamanho do histórico.
+--
+-- Só há UPDATE de colunas sem índice, então fillfactor < 100 deixa espaço
+-- para HOT updates na mesma página.
+--
+-- Quem gravar em measurement por fora desses caminhos (ou apagar leituras)
+-- pode recalcular com sensor_latest_refresh(sensor|NULL).
+
+CREATE TABLE IF NOT EXISTS sensor_latest (
+  sensor_id   INT PRIMARY KEY REFERENCES sensor(id) ON DELETE CASCADE,
+  ts          TIMESTAMPTZ NOT NULL,
+  value       DOUBLE PRECISION NOT NULL,
+  quality     BOOLEAN DEFAULT TRUE,
+  meta        JSONB
+) WITH (fillfactor = 70);
+
+CREATE OR REPLACE FUNCTION sensor_latest_refresh(p_sensor INT)
+RETURNS void AS $$
+BEGIN
+  DELETE FROM sensor_latest WHERE p_sensor IS NULL OR sensor_id = p_sensor;
+
+  INSERT INTO sensor_latest (sensor_id, ts, value, quality, meta)
+  SELECT s.id, m.ts, m.value, m.quality, m.meta
+  FROM sensor s
+  JOIN LATERAL (
+    SELECT m2.ts, m2.value, m2.quality, m2.meta
+    FROM measurement m2
+    WHERE m2.sensor_id = s.id
+    ORDER BY m2.ts DESC
+    LIMIT 1
+  ) m ON TRUE
+  WHERE p_sensor IS NULL OR s.id = p_sensor;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM sensor_latest) THEN
+    PERFORM sensor_latest_refresh(NULL);
+  END IF;
+END$$;
+
+CREATE OR REPLACE VIEW v_latest_per_sensor AS
+SELECT l.sensor_id, s.tag, s.unit, l.value, l.ts, l.quality
+FROM sensor_latest l
+JOIN sensor s ON s.id = l.sensor_id;
@@ -0,0 +1,164 @@
+SET search_path TO eta, public;
+
+-- Sem TimescaleDB, eta.measurement passa a ser particionada por mês (RANGE
+-- em ts, meses UTC) com o particionamento nativo do Postgres:
+--   measurement_AAAA_MM   uma partição por mês
+--   measurement_default   leituras fora dos meses criados (ts muito no futuro)
+-- Consultas com faixa de ts só leem as partições do período (partition
+-- pruning) e cada índice fica do tamanho de um mês.
+--
+-- measurement_partition_maintain(meses) cria as partições do mês corrente
+-- e dos próximos `meses` (o worker chama na partida e a cada
+-- PARTITION_MAINTAIN_H horas; com pg_cron, também fica agendada no banco).
+-- measurement_partition_retire(antes_de, apagar) desanexa as partições
+-- inteiramente anteriores a `antes_de` (nunca a do mês corrente) e, com
+-- apagar = true, faz o DROP.
+-- Descartar partição não dispara os triggers de rollup: measurement_1m/1h/1d
+-- continuam com o histórico agregado.
+--
+-- Conversão de uma measurement já existente: cópia única das linhas para a
+-- tabela particionada, com lock exclusivo durante a migração. A chave passa
+-- a ser (sensor_id, ts) (toda chave única precisa conter ts); id continua
+-- preenchido pela mesma sequência, sem unicidade garantida entre partições.
+
+CREATE OR REPLACE FUNCTION measurement_partition_create(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+  m0   DATE := date_trunc('month', p_month)::date;
+  lo   TIMESTAMPTZ := m0::timestamp AT TIME ZONE 'UTC';
+  hi   TIMESTAMPTZ := (m0 + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+  name TEXT := 'measurement_' || to_char(m0, 'YYYY_MM');
+BEGIN
+  IF to_regclass('eta.' || name) IS NOT NULL THEN
+    RETURN name;
+  END IF;
+  EXECUTE format('CREATE TABLE %I (LIKE measurement INCLUDING DEFAULTS)', name);
+  -- leituras do mês que caíram na default antes da partição existir
+  EXECUTE format('WITH moved AS (DELETE FROM measurement_default WHERE ts >= %L AND ts < %L RETURNING *)
+                  INSERT INTO %I SELECT * FROM moved', lo, hi, name);
+  EXECUTE format('ALTER TABLE measurement ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', name, lo, hi);
+  RETURN name;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+CREATE OR REPLACE FUNCTION measurement_partition_maintain(p_ahead INT DEFAULT 3)
+RETURNS SETOF TEXT AS $$
+DECLARE
+  m DATE;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'eta.measurement'::regclass) THEN
+    RETURN;
+  END IF;
+  -- vários workers chamam ao mesmo tempo: um cria, os outros esperam e acham pronto
+  PERFORM pg_advisory_xact_lock(hashtext('eta.measurement_partition_maintain'));
+  FOR m IN SELECT generate_series(date_trunc('month', now() AT TIME ZONE 'UTC'),
+                                  date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => p_ahead),
+                                  interval '1 month')::date LOOP
+    RETURN NEXT measurement_partition_create(m);
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+CREATE OR REPLACE FUNCTION measurement_partition_retire(p_before TIMESTAMPTZ, p_drop BOOLEAN DEFAULT TRUE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+  p RECORD;
+BEGIN
+  FOR p IN
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'eta.measurement'::regclass
+      AND c.relname ~ '^measurement_[0-9]{4}_[0-9]{2}$'
+      AND (to_date(substr(c.relname, 13), 'YYYY_MM') + interval '1 month')::timestamp AT TIME ZONE 'UTC' <= p_before
+      -- nunca o mês corrente nem os futuros, mesmo com p_before adiante
+      AND to_date(substr(c.relname, 13), 'YYYY_MM') < date_trunc('month', now() AT TIME ZONE 'UTC')
+    ORDER BY c.relname
+  LOOP
+    EXECUTE format('ALTER TABLE measurement DETACH PARTITION %I', p.relname);
+    IF p_drop THEN
+      EXECUTE format('DROP TABLE %I', p.relname);
+    END IF;
+    RETURN NEXT p.relname;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+DO $$
+DECLARE
+  hyper BOOLEAN := FALSE;
+  m     DATE;
+  first DATE;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') THEN
+    EXECUTE $q$SELECT EXISTS (SELECT 1 FROM timescaledb_information.hypertables
+                              WHERE hypertable_schema = 'eta' AND hypertable_name = 'measurement')$q$
+      INTO hyper;
+  END IF;
+  IF hyper OR EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'eta.measurement'::regclass) THEN
+    RETURN;
+  END IF;
+
+  LOCK TABLE measurement IN ACCESS EXCLUSIVE MODE;
+  ALTER TABLE measurement RENAME TO measurement_unpartitioned;
+  ALTER TABLE measurement_unpartitioned RENAME CONSTRAINT measurement_pkey TO measurement_unpartitioned_pkey;
+  ALTER TABLE measurement_unpartitioned RENAME CONSTRAINT measurement_sensor_id_ts_key TO measurement_unpartitioned_sensor_id_ts_key;
+  ALTER TABLE measurement_unpartitioned RENAME CONSTRAINT measurement_sensor_id_fkey TO measurement_unpartitioned_sensor_id_fkey;
+  DROP INDEX IF EXISTS idx_measurement_sensor_ts;
+  DROP INDEX IF EXISTS idx_measurement_ts;
+
+  CREATE TABLE measurement (
+    id          BIGINT NOT NULL DEFAULT nextval('measurement_id_seq'),
+    sensor_id   INT NOT NULL REFERENCES sensor(id) ON DELETE CASCADE,
+    ts          TIMESTAMPTZ NOT NULL,
+    value       DOUBLE PRECISION NOT NULL,
+    quality     BOOLEAN DEFAULT TRUE,
+    meta        JSONB,
+    PRIMARY KEY (sensor_id, ts)
+  ) PARTITION BY RANGE (ts);
+  -- (sensor_id, ts DESC) seria redundante com a PK: o índice é lido de trás para frente
+  CREATE INDEX IF NOT EXISTS idx_measurement_ts ON measurement (ts DESC);
+  CREATE TABLE measurement_default PARTITION OF measurement DEFAULT;
+
+  SELECT date_trunc('month', min(ts) AT TIME ZONE 'UTC')::date INTO first FROM measurement_unpartitioned;
+  FOR m IN SELECT generate_series(COALESCE(first, date_trunc('month', now() AT TIME ZONE 'UTC')::date),
+                                  date_trunc('month', now() AT TIME ZONE 'UTC'), interval '1 month')::date LOOP
+    PERFORM measurement_partition_create(m);
+  END LOOP;
+  PERFORM measurement_partition_maintain();
+
+  INSERT INTO measurement (id, sensor_id, ts, value, quality, meta)
+  SELECT id, sensor_id, ts, value, quality, meta FROM measurement_unpartitioned;
+
+  ALTER SEQUENCE measurement_id_seq OWNED BY measurement.id;
+  -- a view seguiu o RENAME; recriada para apontar para a nova tabela
+  CREATE OR REPLACE VIEW v_hourly_avg_24h AS
+  SELECT s.tag, date_trunc('hour', m.ts) AS hour_bucket,
+         AVG(m.value) AS avg_value, MIN(m.value) AS min_value, MAX(m.value) AS max_value
+  FROM measurement m
+  JOIN sensor s ON s.id = m.sensor_id
+  WHERE m.ts >= now() - interval '24 hours'
+  GROUP BY s.tag, hour_bucket
+  ORDER BY hour_bucket DESC, s.tag;
+  DROP TABLE measurement_unpartitioned;
+
+  -- triggers de rollup (07_measurement_rollups.sql) caíram junto com a tabela antiga
+  IF EXISTS (SELECT 1 FROM pg_tables WHERE schemaname = 'eta' AND tablename = 'measurement_1m') THEN
+    CREATE TRIGGER trg_measurement_rollup_ins AFTER INSERT ON measurement
+      REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_insert();
+    CREATE TRIGGER trg_measurement_rollup_upd AFTER UPDATE ON measurement
+      REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_change();
+    CREATE TRIGGER trg_measurement_rollup_del AFTER DELETE ON measurement
+      REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_after_change();
+  END IF;
+END$$;
+
+-- agenda a criação das partições no próprio banco quando houver pg_cron
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron')
+     AND EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'eta.measurement'::regclass) THEN
+    EXECUTE $q$SELECT cron.schedule('eta-measurement-partitions', '0 3 * * *',
+                                    'SELECT eta.measurement_partition_maintain()')$q$;
+  END IF;
+END$$;
@@ -0,0 +1,21 @@
+SET search_path TO eta, public;
+
+-- Arquivo frio de eta.measurement (worker/archive_measurements.py): meses
+-- fechados saem do banco para Parquet, um arquivo por sensor e mês
+-- (<ARCHIVE_DIR>/AAAA-MM/sensor_<id>.parquet, ordenado por ts).
+-- Cada linha daqui registra um arquivo já verificado; relatórios e séries
+-- consultam esta tabela para saber se o período pedido passa pelo arquivo.
+-- Os rollups (07_measurement_rollups.sql) continuam com o histórico inteiro.
+
+CREATE TABLE IF NOT EXISTS measurement_archive (
+  sensor_id    INT NOT NULL REFERENCES sensor(id) ON DELETE CASCADE,
+  month        DATE NOT NULL,              -- primeiro dia do mês (UTC)
+  path         TEXT NOT NULL,              -- relativo a ARCHIVE_DIR
+  rows         BIGINT NOT NULL,
+  ts_min       TIMESTAMPTZ NOT NULL,
+  ts_max       TIMESTAMPTZ NOT NULL,
+  value_sum    DOUBLE PRECISION NOT NULL,
+  archived_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (sensor_id, month)
+);
+CREATE INDEX IF NOT EXISTS idx_measurement_archive_month ON measurement_archive (month);
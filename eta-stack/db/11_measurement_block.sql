@@ -0,0 +1,66 @@
+SET search_path TO eta, public;
+
+-- Armazenamento compacto opcional (worker/pack_blocks.py): dias UTC fechados
+-- de cada sensor saem de eta.measurement e viram um bloco com ts em
+-- delta-of-delta e valores em XOR (worker/block_codec.py), ~3 a 7 bytes por
+-- leitura contra ~130 de uma linha de measurement com seus índices.
+-- Um bloco nunca passa de um dia UTC: quem procura blocos de um período
+-- pode limitar ts_first a [início - 1 dia, fim).
+-- n, value_min/max/sum permitem agregar sem decodificar. Os rollups
+-- (07_measurement_rollups.sql) continuam com o histórico.
+-- Um dia compactado (ou um mês arquivado, 10_measurement_archive.sql) fica
+-- fechado: measurement_day_closed diz quais, rollup_rebuild não os recalcula
+-- e leituras novas para eles são descartadas no INSERT (bulk_import, replay
+-- do spool ou de uma captura trariam de novo o que já está no bloco/arquivo
+-- e os rollups contariam duas vezes).
+
+CREATE TABLE IF NOT EXISTS measurement_block (
+  sensor_id     INT NOT NULL REFERENCES sensor(id) ON DELETE CASCADE,
+  ts_first      TIMESTAMPTZ NOT NULL,
+  ts_last       TIMESTAMPTZ NOT NULL,
+  n             INT NOT NULL,
+  value_min     DOUBLE PRECISION NOT NULL,
+  value_max     DOUBLE PRECISION NOT NULL,
+  value_sum     DOUBLE PRECISION NOT NULL,
+  ts_data       BYTEA NOT NULL,
+  value_data    BYTEA NOT NULL,
+  quality_data  BYTEA NOT NULL,
+  meta_data     BYTEA,
+  PRIMARY KEY (sensor_id, ts_first)
+);
+CREATE INDEX IF NOT EXISTS idx_measurement_block_ts ON measurement_block (ts_first);
+
+-- os dados já vêm comprimidos: sem nova tentativa de compressão no TOAST
+ALTER TABLE measurement_block ALTER COLUMN value_data SET STORAGE EXTERNAL;
+ALTER TABLE measurement_block ALTER COLUMN meta_data SET STORAGE EXTERNAL;
+
+-- sem SET search_path e com nomes qualificados: a função é embutida (inlined)
+-- nas consultas de rollup_rebuild e no trigger abaixo
+CREATE OR REPLACE FUNCTION eta.measurement_day_closed(p_sensor INT, p_ts TIMESTAMPTZ)
+RETURNS boolean AS $$
+  SELECT EXISTS (SELECT 1 FROM eta.measurement_block b
+                 WHERE b.sensor_id = p_sensor
+                   AND b.ts_first >= date_trunc('day', p_ts, 'UTC')
+                   AND b.ts_first < date_trunc('day', p_ts, 'UTC') + interval '1 day')
+      OR EXISTS (SELECT 1 FROM eta.measurement_archive a
+                 WHERE a.sensor_id = p_sensor AND a.month = date_trunc('month', p_ts, 'UTC')::date)
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION measurement_skip_closed_day() RETURNS trigger AS $$
+BEGIN
+  IF measurement_day_closed(NEW.sensor_id, NEW.ts) THEN
+    RETURN NULL;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+-- só leituras de dias anteriores a hoje (UTC) pagam a consulta; a ingestão
+-- corrente passa direto. Cargas que já filtram os dias fechados em lote
+-- (bulk_import.py, com anti-join) desligam a checagem linha a linha na sessão
+-- com SET eta.closed_day_checked = 'on'.
+DROP TRIGGER IF EXISTS trg_measurement_closed_day ON measurement;
+CREATE TRIGGER trg_measurement_closed_day BEFORE INSERT ON measurement
+  FOR EACH ROW WHEN (NEW.ts < date_trunc('day', now(), 'UTC')
+                     AND current_setting('eta.closed_day_checked', true) IS DISTINCT FROM 'on')
+  EXECUTE FUNCTION measurement_skip_closed_day();
@@ -0,0 +1,222 @@
+SET search_path TO eta, public;
+
+-- Retenção declarativa: quanto tempo cada tabela guarda, com exceções por
+-- sensor. Sem política (ou keep NULL) a tabela guarda para sempre.
+--   target     measurement (linhas e blocos de measurement_block),
+--              measurement_1m | measurement_1h | measurement_1d,
+--              event, raw_ingest (esta sem sensor)
+--   sensor_id  NULL = padrão da tabela; preenchido = exceção do sensor,
+--              inclusive keep NULL para guardar aquele sensor para sempre.
+-- Exemplo: INSERT INTO eta.retention_policy (target, keep) VALUES ('measurement', '1 year');
+--
+-- CALL eta.retention_enforce() apaga o que passou do prazo em lotes de
+-- p_batch linhas, em ordem de ts por sensor (o lote seguinte começa de onde
+-- o anterior parou, sem reler entradas mortas do índice), com COMMIT a cada
+-- lote: nenhuma transação longa segura locks nem impede o vacuum.
+-- Em measurement, partições mensais inteiramente vencidas para todos os
+-- sensores são desanexadas e descartadas (09_measurement_partitioning.sql;
+-- chunks com TimescaleDB) em vez de apagadas linha a linha. Apagar leituras
+-- não mexe nos rollups (eta.rollup_skip). Meses já arquivados em Parquet
+-- (10_measurement_archive.sql) ficam fora: o arquivo tem o próprio diretório.
+-- Cada tabela/sensor processado vira uma linha em retention_run (linhas
+-- apagadas, partições descartadas, tempo); o worker chama a cada
+-- RETENTION_H horas e, com pg_cron, fica agendado também no banco.
+-- Linhas apagadas de measurement desfazem o resumo do BRIN em ts nas páginas
+-- liberadas (measurement_brin_forget, 13_measurement_indexes.sql); o worker
+-- roda VACUUM em seguida, e pelo pg_cron fica a cargo do autovacuum.
+
+CREATE TABLE IF NOT EXISTS retention_policy (
+  id         SERIAL PRIMARY KEY,
+  target     TEXT NOT NULL CHECK (target IN ('measurement', 'measurement_1m', 'measurement_1h',
+                                             'measurement_1d', 'event', 'raw_ingest')),
+  sensor_id  INT REFERENCES sensor(id) ON DELETE CASCADE,
+  keep       INTERVAL,
+  CHECK (sensor_id IS NULL OR target <> 'raw_ingest')
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_retention_policy ON retention_policy (target, COALESCE(sensor_id, 0));
+
+CREATE TABLE IF NOT EXISTS retention_run (
+  id          BIGSERIAL PRIMARY KEY,
+  started_at  TIMESTAMPTZ NOT NULL,
+  target      TEXT NOT NULL,
+  sensor_id   INT,
+  cutoff      TIMESTAMPTZ NOT NULL,
+  rows        BIGINT NOT NULL,           -- partições descartadas entram pela estimativa (reltuples)
+  partitions  INT NOT NULL DEFAULT 0,
+  elapsed     INTERVAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_retention_run_started ON retention_run (started_at DESC);
+
+-- padrão: payload bruto 90 dias, rollup de 1 minuto 2 anos; 1h, 1d e as
+-- leituras (que o arquivo Parquet tira do banco) ficam para sempre
+INSERT INTO retention_policy (target, keep)
+SELECT t, k::interval FROM (VALUES ('raw_ingest', '90 days'), ('measurement_1m', '2 years')) v(t, k)
+WHERE NOT EXISTS (SELECT 1 FROM retention_policy p WHERE p.target = v.t AND p.sensor_id IS NULL);
+
+-- corte efetivo por tabela e sensor (sensor_id NULL em raw_ingest); só o que tem prazo
+CREATE OR REPLACE FUNCTION retention_cutoffs()
+RETURNS TABLE (target TEXT, sensor_id INT, cutoff TIMESTAMPTZ) AS $$
+  SELECT t.target, s.id, now() - CASE WHEN o.id IS NOT NULL THEN o.keep ELSE d.keep END
+  FROM (SELECT DISTINCT p.target FROM retention_policy p WHERE p.target <> 'raw_ingest') t
+  CROSS JOIN sensor s
+  LEFT JOIN retention_policy d ON d.target = t.target AND d.sensor_id IS NULL
+  LEFT JOIN retention_policy o ON o.target = t.target AND o.sensor_id = s.id
+  WHERE CASE WHEN o.id IS NOT NULL THEN o.keep ELSE d.keep END IS NOT NULL
+  UNION ALL
+  SELECT p.target, NULL, now() - p.keep
+  FROM retention_policy p
+  WHERE p.target = 'raw_ingest' AND p.keep IS NOT NULL;
+$$ LANGUAGE sql STABLE SET search_path = eta, public;
+
+-- quantas linhas cada corte apagaria (para --dry-run; conta de verdade, pode demorar)
+CREATE OR REPLACE FUNCTION retention_preview()
+RETURNS TABLE (target TEXT, sensor_id INT, cutoff TIMESTAMPTZ, rows BIGINT) AS $$
+DECLARE
+  c RECORD;
+BEGIN
+  FOR c IN SELECT * FROM retention_cutoffs() r ORDER BY r.target, r.sensor_id LOOP
+    target := c.target; sensor_id := c.sensor_id; cutoff := c.cutoff;
+    IF c.target = 'raw_ingest' THEN
+      SELECT count(*) INTO rows FROM raw_ingest WHERE received_at < c.cutoff;
+    ELSE
+      EXECUTE format('SELECT count(*) FROM %I WHERE sensor_id = $1 AND %I < $2', c.target,
+                     CASE WHEN c.target LIKE 'measurement\_1_' THEN 'bucket' ELSE 'ts' END)
+        INTO rows USING c.sensor_id, c.cutoff;
+      IF c.target = 'measurement' AND to_regclass('eta.measurement_block') IS NOT NULL THEN
+        rows := rows + (SELECT COALESCE(sum(b.n), 0) FROM measurement_block b
+                        WHERE b.sensor_id = c.sensor_id AND b.ts_last < c.cutoff);
+      END IF;
+    END IF;
+    RETURN NEXT;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql STABLE SET search_path = eta, public;
+
+-- descarta as partições (ou chunks) de measurement vencidas para todos os sensores
+CREATE OR REPLACE FUNCTION retention_drop_measurement_partitions(p_before TIMESTAMPTZ)
+RETURNS TABLE (partitions INT, rows BIGINT) AS $$
+DECLARE
+  name TEXT;
+  est  REAL;
+BEGIN
+  partitions := 0; rows := 0;
+  -- DETACH pede lock exclusivo na tabela mãe: sem fila atrás de consultas longas
+  SET LOCAL lock_timeout = '5s';
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'eta.measurement'::regclass) THEN
+    FOR name IN SELECT measurement_partition_retire(p_before, false) LOOP
+      SELECT c.reltuples INTO est FROM pg_class c WHERE c.oid = ('eta.' || name)::regclass;
+      EXECUTE format('DROP TABLE %I', name);
+      partitions := partitions + 1;
+      rows := rows + GREATEST(est, 0)::bigint;
+    END LOOP;
+  ELSIF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb') THEN
+    EXECUTE $q$SELECT count(*) FROM drop_chunks('eta.measurement', older_than => $1)$q$
+      INTO partitions USING p_before;
+  END IF;
+  RETURN NEXT;
+EXCEPTION WHEN lock_not_available OR undefined_function THEN
+  RAISE NOTICE 'retenção: partições de measurement ficaram para os lotes (%)', SQLERRM;
+  partitions := 0; rows := 0;
+  RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
+
+-- procedimento com COMMIT não aceita SET search_path: nomes qualificados
+CREATE OR REPLACE PROCEDURE eta.retention_enforce(p_batch INT DEFAULT 5000)
+LANGUAGE plpgsql AS $$
+DECLARE
+  c       RECORD;
+  started TIMESTAMPTZ := now();
+  t0      TIMESTAMPTZ;
+  tscol   TEXT;
+  keycols TEXT;
+  filter  TEXT;
+  stmt    TEXT;
+  last    TIMESTAMPTZ;
+  n       BIGINT;
+  total   BIGINT;
+  oldest  TIMESTAMPTZ;
+  dropped RECORD;
+  rels    REGCLASS[];
+  pages   BIGINT[];
+BEGIN
+  -- vários workers agendam a mesma rotina: só um roda por vez
+  IF NOT pg_try_advisory_lock(hashtext('eta.retention_enforce')) THEN
+    RAISE NOTICE 'retenção: já em execução em outra sessão';
+    RETURN;
+  END IF;
+
+  -- partições: só as vencidas para todos os sensores (nenhum guarda para sempre)
+  SELECT min(r.cutoff) INTO oldest FROM eta.retention_cutoffs() r WHERE r.target = 'measurement'
+  HAVING count(*) = (SELECT count(*) FROM eta.sensor);
+  IF oldest IS NOT NULL THEN
+    t0 := clock_timestamp();
+    SELECT * INTO dropped FROM eta.retention_drop_measurement_partitions(oldest);
+    IF dropped.partitions > 0 THEN
+      INSERT INTO eta.retention_run (started_at, target, sensor_id, cutoff, rows, partitions, elapsed)
+      VALUES (started, 'measurement', NULL, oldest, dropped.rows, dropped.partitions, clock_timestamp() - t0);
+    END IF;
+    COMMIT;
+  END IF;
+
+  FOR c IN SELECT * FROM eta.retention_cutoffs() r ORDER BY r.target, r.sensor_id LOOP
+    t0 := clock_timestamp();
+    total := 0;
+    last := '-infinity';
+    IF c.target = 'raw_ingest' THEN
+      tscol := 'received_at'; keycols := 'id'; filter := '';
+    ELSE
+      tscol := CASE WHEN c.target LIKE 'measurement\_1_' THEN 'bucket' ELSE 'ts' END;
+      keycols := CASE WHEN c.target = 'event' THEN 'id' ELSE 'sensor_id, ' || tscol END;
+      filter := 'sensor_id = $1 AND ';
+    END IF;
+    -- measurement devolve também as páginas liberadas (tabela/partição e página)
+    stmt := format('WITH d AS (DELETE FROM eta.%1$I WHERE (%2$s) IN (
+                      SELECT %2$s FROM eta.%1$I WHERE %3$s%4$I >= $2 AND %4$I < $3 ORDER BY %4$I LIMIT $4)
+                    RETURNING %4$I%5$s)
+                    SELECT c.n, c.last, f.rels, f.pages
+                    FROM (SELECT count(*) AS n, max(%4$I) AS last FROM d) c,
+                         (SELECT %6$s) f', c.target, keycols, filter, tscol,
+                   CASE WHEN c.target = 'measurement' THEN ', tableoid, ctid' ELSE '' END,
+                   CASE WHEN c.target = 'measurement'
+                        THEN 'array_agg(rel) AS rels, array_agg(page) AS pages FROM (SELECT DISTINCT
+                              tableoid::regclass AS rel, (ctid::text::point)[0]::int8 AS page FROM d) p'
+                        ELSE 'NULL::regclass[] AS rels, NULL::int8[] AS pages' END);
+    LOOP
+      -- leituras apagadas por prazo continuam contadas nos rollups
+      PERFORM set_config('eta.rollup_skip', 'on', true);
+      EXECUTE stmt INTO n, last, rels, pages USING c.sensor_id, last, c.cutoff, p_batch;
+      total := total + n;
+      COMMIT;
+      -- depois do COMMIT: um resumo refeito antes dele ainda veria as linhas apagadas
+      IF pages IS NOT NULL AND to_regprocedure('eta.measurement_brin_forget(regclass[], bigint[])') IS NOT NULL THEN
+        PERFORM eta.measurement_brin_forget(rels, pages);
+        COMMIT;
+      END IF;
+      EXIT WHEN n < p_batch;
+    END LOOP;
+    IF c.target = 'measurement' AND to_regclass('eta.measurement_block') IS NOT NULL THEN
+      WITH d AS (DELETE FROM eta.measurement_block b WHERE b.sensor_id = c.sensor_id AND b.ts_last < c.cutoff
+                 RETURNING b.n)
+      SELECT total + COALESCE(sum(d.n), 0) INTO total FROM d;
+    END IF;
+    IF total > 0 THEN
+      INSERT INTO eta.retention_run (started_at, target, sensor_id, cutoff, rows, elapsed)
+      VALUES (started, c.target, c.sensor_id, c.cutoff, total, clock_timestamp() - t0);
+    END IF;
+    COMMIT;
+  END LOOP;
+
+  SELECT COALESCE(sum(r.rows), 0) INTO total FROM eta.retention_run r WHERE r.started_at = started;
+  RAISE NOTICE 'retenção: % linhas apagadas em %', total, clock_timestamp() - started;
+  PERFORM pg_advisory_unlock(hashtext('eta.retention_enforce'));
+END;
+$$;
+
+-- agenda no próprio banco quando houver pg_cron
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+    EXECUTE $q$SELECT cron.schedule('eta-retention', '30 3 * * *', 'CALL eta.retention_enforce()')$q$;
+  END IF;
+END$$;
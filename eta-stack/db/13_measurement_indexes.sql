@@ -0,0 +1,92 @@
+SET search_path TO eta, public;
+
+-- Índices de eta.measurement: uma B-tree só, (sensor_id, ts) INCLUDE (value),
+-- e um BRIN em ts.
+-- - A chave cobre value: série bruta e última leitura por sensor viram
+--   index-only scan (o mapa de visibilidade fica em dia com o autovacuum
+--   de inserção); (sensor_id, ts DESC) era a mesma chave lida ao contrário.
+-- - Consultas só por período (relatório, arquivo, blocos) usam o BRIN: a
+--   tabela é preenchida em ordem de ts, então faixas de 32 páginas têm
+--   min/max de ts estreitos; o índice ocupa KBs em vez de dezenas de MB.
+-- worker/bench_indexes.py compara este layout com o de 01_schema.sql e o
+-- de 09_measurement_partitioning.sql numa massa gerada (vazão de inserção,
+-- tamanho dos índices e latência das consultas da API).
+-- Na ingestão cada lote traz um ts para vários sensores, e a B-tree com
+-- INCLUDE não usa o split otimizado para inserção crescente: as páginas
+-- ficam pela metade até um REINDEX (a partição de um mês fechado pode ser
+-- reindexada com REINDEX TABLE CONCURRENTLY; dias que pack_blocks.py já
+-- compactou nem ficam na tabela).
+-- A troca reconstrói a chave com lock exclusivo em measurement: rodar em
+-- janela de manutenção em bases grandes.
+-- O resumo de uma faixa do BRIN só cresce. Quando pack_blocks.py ou a
+-- retenção apagam dias antigos, o vacuum devolve o espaço e a ingestão
+-- grava leituras novas nessas páginas: sem cuidado, a faixa passaria a ir do
+-- dia apagado até agora e casaria com qualquer janela recente. Por isso
+-- quem apaga chama measurement_brin_forget com as páginas afetadas (depois
+-- do COMMIT): as faixas ficam sem resumo até o próximo vacuum, que as
+-- resume só com o que sobrou, e a partir daí voltam a crescer de verdade.
+
+DO $$
+DECLARE
+  key_name TEXT;
+  covered  BOOLEAN;
+BEGIN
+  -- chave única (sensor_id, ts): PK na tabela particionada, UNIQUE na original/hypertable
+  SELECT c.conname, i.indnatts > i.indnkeyatts INTO key_name, covered
+  FROM pg_constraint c
+  JOIN pg_index i ON i.indexrelid = c.conindid
+  WHERE c.conrelid = 'eta.measurement'::regclass AND c.contype IN ('p', 'u')
+    AND i.indnkeyatts = 2
+    AND (SELECT array_agg(a.attname::text ORDER BY k.ord)
+         FROM unnest(i.indkey[0:1]) WITH ORDINALITY k(attnum, ord)
+         JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum) = ARRAY['sensor_id', 'ts'];
+
+  IF key_name IS NOT NULL AND NOT covered THEN
+    LOCK TABLE measurement IN ACCESS EXCLUSIVE MODE;
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = key_name AND contype = 'p') THEN
+      EXECUTE format('ALTER TABLE measurement DROP CONSTRAINT %I, ADD PRIMARY KEY (sensor_id, ts) INCLUDE (value)',
+                     key_name);
+    ELSE
+      EXECUTE format('ALTER TABLE measurement DROP CONSTRAINT %I, ADD CONSTRAINT %I UNIQUE (sensor_id, ts) INCLUDE (value)',
+                     key_name, key_name);
+    END IF;
+  END IF;
+
+  DROP INDEX IF EXISTS idx_measurement_sensor_ts;
+  IF EXISTS (SELECT 1 FROM pg_class c JOIN pg_am am ON am.oid = c.relam
+             WHERE c.oid = to_regclass('eta.idx_measurement_ts') AND am.amname = 'btree') THEN
+    DROP INDEX idx_measurement_ts;
+  END IF;
+END$$;
+
+CREATE INDEX IF NOT EXISTS idx_measurement_ts_brin ON measurement USING brin (ts)
+  WITH (pages_per_range = 32, autosummarize = on);
+
+-- desfaz o resumo das faixas do BRIN que contêm as páginas informadas;
+-- p_rels[i] é a tabela (measurement, partição ou chunk, o tableoid das linhas
+-- apagadas) da página p_pages[i]; retorna quantas faixas foram desfeitas
+CREATE OR REPLACE FUNCTION measurement_brin_forget(p_rels regclass[], p_pages bigint[])
+RETURNS int AS $$
+DECLARE
+  r   RECORD;
+  blk BIGINT;
+  n   INT := 0;
+BEGIN
+  FOR r IN
+    SELECT i.indexrelid::regclass AS idx, array_agg(DISTINCT u.page) AS pages,
+           COALESCE((SELECT split_part(o, '=', 2)::int FROM unnest(c.reloptions) o
+                     WHERE o LIKE 'pages_per_range=%'), 128) AS ppr
+    FROM unnest(p_rels, p_pages) u(rel, page)
+    JOIN pg_index i ON i.indrelid = u.rel
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am am ON am.oid = c.relam AND am.amname = 'brin'
+    GROUP BY i.indexrelid, c.reloptions
+  LOOP
+    FOR blk IN SELECT DISTINCT p - p % r.ppr FROM unnest(r.pages) p LOOP
+      PERFORM brin_desummarize_range(r.idx, blk);
+      n := n + 1;
+    END LOOP;
+  END LOOP;
+  RETURN n;
+END;
+$$ LANGUAGE plpgsql SET search_path = eta, public;
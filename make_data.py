@@ -1,70 +1,251 @@
 # make_data.py
-import json
+"""
+Gerador de dados sintéticos da ETA, em blocos e vetorizado.
+
+Cada bloco é uma matriz (instantes x tags) calculada de uma vez com NumPy:
+base + ciclo diário + ruído + deriva, limites físicos e algumas anomalias.
+Os blocos são gravados assim que ficam prontos (CSV/Parquet long e wide) e,
+com --copy, carregados no Postgres via COPY; a memória não cresce com o
+tamanho do conjunto.
+
+Sem argumentos gera o mesmo mês de antes: 6 tags a cada 15 minutos em
+eta_synthetic_month_long.csv e eta_synthetic_month_wide.csv. Com --tags
+maior que 6, as tags extras repetem os perfis com sufixo (qualidade/ph/0007).
+
+Uso:
+  python make_data.py
+  python make_data.py --tags 2000 --days 730 --interval 1min --format parquet --prefix eta_2anos
+  python make_data.py --tags 500 --days 365 --copy --layout none
+"""
+
+import argparse
+import io
+import os
+from datetime import datetime, timedelta, timezone
+
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta, timezone
 
-# 30 dias de dados a cada 15 minutos
-start = datetime.now(timezone.utc) - timedelta(days=30)
-end = datetime.now(timezone.utc)
-ts = pd.date_range(start=start, end=end, freq="15min", inclusive="left")
-
-rng = np.random.default_rng(42)
-
-def diurnal_cycle(n, amplitude=1.0, phase=0.0):
-    # ciclo diário (24h) aproximado para 15min
-    x = np.linspace(0 + phase, 2*np.pi * (n / (24*4)), n)
-    return amplitude * np.sin(x)
-
-N = len(ts)
-signals = {
-    ("qualidade/ph", "pH"):            {"base": 7.2,  "noise": 0.06, "drift": 0.0,     "amp": 0.08},
-    ("decantacao/turbidez", "NTU"):    {"base": 0.3,  "noise": 0.05, "drift": 0.0,     "amp": 0.07},
-    ("bombeamento/vazao", "m3/h"):     {"base": 160., "noise": 8.0,  "drift": 0.0,     "amp": 30.0},
-    ("qualidade/cloro", "mg/L"):       {"base": 1.8,  "noise": 0.12, "drift": -0.0005, "amp": 0.2},
-    ("pressao/linha1", "bar"):         {"base": 3.2,  "noise": 0.08, "drift": 0.0002,  "amp": 0.25},
-    ("nivel/reservatorio", "%"):       {"base": 65.,  "noise": 2.0,  "drift": 0.01,    "amp": 8.0},
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# (tag, unidade): base, ruído, deriva por amostra, amplitude do ciclo diário, limites físicos
+SIGNALS = {
+    ("qualidade/ph", "pH"):            {"base": 7.2,  "noise": 0.06, "drift": 0.0,     "amp": 0.08, "clip": (6.4, 8.8)},
+    ("decantacao/turbidez", "NTU"):    {"base": 0.3,  "noise": 0.05, "drift": 0.0,     "amp": 0.07, "clip": (0.02, 5.0)},
+    ("bombeamento/vazao", "m3/h"):     {"base": 160., "noise": 8.0,  "drift": 0.0,     "amp": 30.0, "clip": (20.0, 400.0)},
+    ("qualidade/cloro", "mg/L"):       {"base": 1.8,  "noise": 0.12, "drift": -0.0005, "amp": 0.2,  "clip": (0.2, 4.0)},
+    ("pressao/linha1", "bar"):         {"base": 3.2,  "noise": 0.08, "drift": 0.0002,  "amp": 0.25, "clip": (1.0, 6.0)},
+    ("nivel/reservatorio", "%"):       {"base": 65.,  "noise": 2.0,  "drift": 0.01,    "amp": 8.0,  "clip": (5.0, 100.0)},
 }
 
-rows = []
-for (tag, unit), cfg in signals.items():
-    base  = cfg["base"]
-    noise = cfg["noise"]
-    drift = cfg["drift"]
-    amp   = cfg["amp"]
-
-    cycle = diurnal_cycle(N, amplitude=amp)
-    noise_series = rng.normal(0, noise, N)
-    drift_series = np.linspace(0, drift*N, N)
-    values = base + cycle + noise_series + drift_series
-
-    # limites físicos básicos
-    if unit == "NTU":  values = np.clip(values, 0.02, 5.0)
-    if unit == "pH":   values = np.clip(values, 6.4, 8.8)
-    if unit == "mg/L": values = np.clip(values, 0.2, 4.0)
-    if unit == "bar":  values = np.clip(values, 1.0, 6.0)
-    if unit == "%":    values = np.clip(values, 5.0, 100.0)
-    if unit == "m3/h": values = np.clip(values, 20.0, 400.0)
-
-    # algumas anomalias
-    idx = rng.choice(N, size=6, replace=False)
-    values[idx] *= rng.uniform(0.6, 1.4, size=6)
-
-    for t, v in zip(ts, values):
-        rows.append({
-            "ts": t.isoformat(),
-            "tag": tag,
-            "value": float(np.round(v, 3)),
-            "unit": unit,
-            "quality": True,
-            "meta": json.dumps({"sim": True}, ensure_ascii=False)
-        })
-
-df = pd.DataFrame(rows).sort_values("ts")
-
-# salva na PASTA ATUAL (sem /mnt/data)
-df.to_csv("eta_synthetic_month_long.csv", index=False)
-wide = df.pivot_table(index="ts", columns="tag", values="value").reset_index()
-wide.to_csv("eta_synthetic_month_wide.csv", index=False)
-
-print("Arquivos gerados: eta_synthetic_month_long.csv e eta_synthetic_month_wide.csv")
+# fração de leituras com anomalia (~6 por tag num mês a cada 15 min)
+ANOMALY_RATE = 6 / 2880
+
+META = '{"sim": true}'
+
+TS_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def build_tags(n):
+    """Tags, unidades e parâmetros (arrays por tag) para `n` tags."""
+    profiles = list(SIGNALS.items())
+    tags, units, params = [], [], {k: [] for k in ("base", "noise", "drift", "amp", "lo", "hi")}
+    for i in range(n):
+        (tag, unit), cfg = profiles[i % len(profiles)]
+        tags.append(tag if i < len(profiles) else f"{tag}/{i:04d}")
+        units.append(unit)
+        for k in ("base", "noise", "drift", "amp"):
+            params[k].append(cfg[k])
+        params["lo"].append(cfg["clip"][0])
+        params["hi"].append(cfg["clip"][1])
+    return tags, units, {k: np.asarray(v, dtype=np.float64) for k, v in params.items()}
+
+
+def generate(start, steps, step_s, params, rng, chunk_steps):
+    """Itera (ts, valores[instantes, tags]) em blocos de `chunk_steps` instantes."""
+    ntags = len(params["base"])
+    # fase aleatória por tag além da primeira volta de perfis
+    phase = np.where(np.arange(ntags) < len(SIGNALS), 0.0, rng.uniform(0, 2 * np.pi, ntags))
+    for first in range(0, steps, chunk_steps):
+        k = np.arange(first, min(first + chunk_steps, steps))
+        t = k * step_s
+        cycle = params["amp"] * np.sin(2 * np.pi * t[:, None] / 86400.0 + phase)
+        noise = rng.normal(0.0, 1.0, (len(k), ntags)) * params["noise"]
+        values = params["base"] + cycle + noise + params["drift"] * k[:, None]
+        np.clip(values, params["lo"], params["hi"], out=values)
+
+        anomalies = rng.random(values.shape) < ANOMALY_RATE
+        values[anomalies] *= rng.uniform(0.6, 1.4, int(anomalies.sum()))
+
+        ts = pd.DatetimeIndex(start + pd.to_timedelta(t, unit="s"))
+        yield ts, np.round(values, 3)
+
+
+def long_frame(ts, values, tags, units, text_ts=False):
+    n, ntags = values.shape
+    if text_ts:
+        # CSV: formata cada instante uma vez, e não uma vez por leitura no to_csv
+        ts = pd.Index(ts.strftime(TS_FORMAT))
+    return pd.DataFrame({
+        "ts": ts.repeat(ntags),
+        "tag": np.tile(np.asarray(tags, dtype=object), n),
+        "value": values.ravel(),
+        "unit": np.tile(np.asarray(units, dtype=object), n),
+        "quality": True,
+        "meta": META,
+    })
+
+
+def wide_frame(ts, values, tags):
+    df = pd.DataFrame(values, columns=tags)
+    df.insert(0, "ts", ts)
+    return df
+
+
+class Output:
+    """Arquivo CSV ou Parquet gravado bloco a bloco."""
+
+    def __init__(self, path):
+        self.path = path
+        self._first = True
+        self._writer = None
+        if path.endswith(".parquet") and pq is None:
+            raise SystemExit("pyarrow não instalado: necessário para --format parquet")
+
+    def write(self, df):
+        if self.path.endswith(".parquet"):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False,
+                      date_format=TS_FORMAT)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class PgLoader:
+    """COPY de cada bloco numa tabela temporária e merge em eta.measurement."""
+
+    def __init__(self, tags, units):
+        import psycopg2
+        self.conn = psycopg2.connect(host=os.getenv("PGHOST", "localhost"), port=int(os.getenv("PGPORT", "5432")),
+                                     user=os.getenv("PGUSER", "postgres"), password=os.getenv("PGPASSWORD", "postgres"),
+                                     dbname=os.getenv("PGDATABASE", "eta"))
+        with self.conn.cursor() as cur:
+            cur.execute("SET synchronous_commit = off")
+            device_id = self._device(cur)
+            cur.execute("""INSERT INTO eta.sensor (device_id, tag, unit)
+                           SELECT %s, t.tag, t.unit FROM unnest(%s::text[], %s::text[]) AS t(tag, unit)
+                           ON CONFLICT (tag) DO NOTHING""", (device_id, tags, units))
+            cur.execute("SELECT tag, id FROM eta.sensor WHERE tag = ANY(%s)", (tags,))
+            ids = dict(cur.fetchall())
+            cur.execute("""CREATE TEMP TABLE stage (sensor_id int, ts timestamptz, value float8)
+                           ON COMMIT DELETE ROWS""")
+        self.conn.commit()
+        self.sensor_ids = np.asarray([ids[t] for t in tags], dtype=np.int64)
+
+    @staticmethod
+    def _device(cur):
+        """Dispositivo 'GW-SIM' (site/unidade simulados), criado se preciso."""
+        cur.execute("SELECT id FROM eta.device WHERE serial = 'GW-SIM'")
+        row = cur.fetchone()
+        if row:
+            return row[0]
+        cur.execute("INSERT INTO eta.site (name) VALUES ('ETA Simulada') RETURNING id")
+        cur.execute("INSERT INTO eta.unit (site_id, name, process) VALUES (%s, 'Simulação', 'simulacao') RETURNING id",
+                    (cur.fetchone()[0],))
+        cur.execute("""INSERT INTO eta.device (unit_id, vendor, model, serial, protocol)
+                       VALUES (%s, 'Sim', 'make_data', 'GW-SIM', 'sim') RETURNING id""", (cur.fetchone()[0],))
+        return cur.fetchone()[0]
+
+    def write(self, ts, values):
+        n, ntags = values.shape
+        df = pd.DataFrame({"sensor_id": np.tile(self.sensor_ids, n), "value": values.ravel(),
+                           "ts": np.repeat(np.asarray(ts.strftime(TS_FORMAT), dtype=object), ntags)})
+        buf = io.StringIO()
+        df.to_csv(buf, header=False, index=False, columns=["sensor_id", "ts", "value"])
+        buf.seek(0)
+        with self.conn.cursor() as cur:
+            cur.copy_expert("COPY stage (sensor_id, ts, value) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute("""INSERT INTO eta.measurement (sensor_id, ts, value, quality, meta)
+                           SELECT sensor_id, ts, value, TRUE, '{"sim": true}'::jsonb FROM stage
+                           ON CONFLICT (sensor_id, ts) DO NOTHING""")
+            cur.execute("""INSERT INTO eta.sensor_latest AS l (sensor_id, ts, value, quality, meta)
+                           SELECT DISTINCT ON (sensor_id) sensor_id, ts, value, TRUE, '{"sim": true}'::jsonb
+                           FROM stage ORDER BY sensor_id, ts DESC
+                           ON CONFLICT (sensor_id) DO UPDATE
+                              SET ts = EXCLUDED.ts, value = EXCLUDED.value, quality = EXCLUDED.quality, meta = EXCLUDED.meta
+                            WHERE EXCLUDED.ts > l.ts""")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera dados sintéticos da ETA")
+    ap.add_argument("--tags", type=int, default=len(SIGNALS))
+    ap.add_argument("--days", type=float, default=30)
+    ap.add_argument("--interval", default="15min", help="intervalo de amostragem (ex.: 15min, 1min, 10s)")
+    ap.add_argument("--start", default=None, help="início ISO-8601 (padrão: agora - days)")
+    ap.add_argument("--prefix", default="eta_synthetic_month", help="prefixo dos arquivos gerados")
+    ap.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    ap.add_argument("--layout", choices=("both", "long", "wide", "none"), default="both")
+    ap.add_argument("--copy", action="store_true", help="carrega também no Postgres (PG* do ambiente)")
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000, help="leituras por bloco")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    step_s = pd.to_timedelta(args.interval).total_seconds()
+    if args.start:
+        start = pd.Timestamp(args.start)
+        start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+    else:
+        start = pd.Timestamp(datetime.now(timezone.utc) - timedelta(days=args.days)).floor("s")
+    steps = int(args.days * 86400 // step_s)
+    chunk_steps = max(1, args.chunk_rows // max(1, args.tags))
+
+    tags, units, params = build_tags(args.tags)
+    rng = np.random.default_rng(args.seed)
+
+    outputs = {}
+    if args.layout in ("both", "long"):
+        outputs["long"] = Output(f"{args.prefix}_long.{args.format}")
+    if args.layout in ("both", "wide"):
+        outputs["wide"] = Output(f"{args.prefix}_wide.{args.format}")
+    loader = PgLoader(tags, units) if args.copy else None
+
+    rows = 0
+    try:
+        for ts, values in generate(start, steps, step_s, params, rng, chunk_steps):
+            if "long" in outputs:
+                outputs["long"].write(long_frame(ts, values, tags, units, text_ts=args.format == "csv"))
+            if "wide" in outputs:
+                outputs["wide"].write(wide_frame(ts, values, tags))
+            if loader is not None:
+                loader.write(ts, values)
+            rows += values.size
+            print(f"{rows} leituras ({ts[-1].isoformat()})", end="\r", flush=True)
+    finally:
+        for out in outputs.values():
+            out.close()
+        if loader is not None:
+            loader.close()
+
+    print()
+    print(f"{rows} leituras, {len(tags)} tags, {steps} instantes")
+    if outputs:
+        print("Arquivos gerados: " + " e ".join(out.path for out in outputs.values()))
+
+
+if __name__ == "__main__":
+    main()
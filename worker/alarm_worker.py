@@ -206,17 +206,11 @@ def get_last_measurements():
     query = """
         SELECT
             s.id AS sensor_id,
-            COALESCE(m.tag, s.meta->>'tag', s.tag) AS tag,
-            m.value,
-            m.ts
+            COALESCE(l.meta->>'tag', s.meta->>'tag', s.tag) AS tag,
+            l.value,
+            l.ts
         FROM eta.sensor s
-        JOIN LATERAL (
-            SELECT m2.tag, m2.value, m2.ts
-            FROM eta.measurement m2
-            WHERE m2.sensor_id = s.id
-            ORDER BY m2.ts DESC
-            LIMIT 1
-        ) m ON TRUE
+        JOIN eta.sensor_latest l ON l.sensor_id = s.id
         ORDER BY s.id;
     """
 
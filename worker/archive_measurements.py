@@ -0,0 +1,332 @@
+"""
+Arquivamento de meses fechados de eta.measurement em Parquet.
+
+Para cada mês (UTC) anterior ao corte, numa única transação REPEATABLE READ:
+  1. lê as leituras do mês em ordem (sensor_id, ts) por um cursor no
+     servidor e grava um Parquet zstd por sensor em
+     <ARCHIVE_DIR>/AAAA-MM/sensor_<id>.parquet (arquivo temporário + rename);
+  2. relê cada arquivo (memory map) e confere linhas, soma dos valores e
+     primeiro/último ts com o que o banco tem no mesmo snapshot;
+  3. registra os arquivos em eta.measurement_archive e tira as leituras do
+     banco: com a tabela particionada (09_measurement_partitioning.sql) a
+     partição do mês é desanexada e apagada; sem ela, DELETE com os triggers
+     de rollup desligados (eta.rollup_skip), para os rollups manterem o mês.
+Blocos do mês em eta.measurement_block (pack_blocks.py) vão junto: são
+decodificados, mesclados às linhas do sensor e apagados ao fim.
+Um mês arquivado fica fechado (eta.measurement_day_closed): leituras que
+chegarem depois para ele são descartadas no INSERT pelo trigger
+measurement_skip_closed_day (11_measurement_block.sql). O arquivo só é
+mesclado a um já existente se sobrarem linhas de antes do trigger.
+
+Relatórios e séries leem o período arquivado direto dos arquivos (ver
+read_archive e api/services/archive_service.py).
+
+Uso:
+  python archive_measurements.py                    # meses antes de ARCHIVE_KEEP_MONTHS
+  python archive_measurements.py --before 2025-01 --dir /archive
+  python archive_measurements.py --dry-run
+"""
+
+import argparse
+import math
+import os
+import time
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+from main import pg_conn
+from pack_blocks import (BLOCK_COLUMNS, DELETE_MEASUREMENT_SQL, blocks_to_frame, forget_brin_ranges,
+                         vacuum_measurement)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# meses mais recentes que ficam no banco (além do mês corrente)
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "3"))
+FETCH_ROWS = 100_000
+
+SCHEMA = None if pa is None else pa.schema([
+    ("sensor_id", pa.int32()),
+    ("ts", pa.timestamp("us", tz="UTC")),
+    ("value", pa.float64()),
+    ("quality", pa.bool_()),
+    ("meta", pa.string()),
+])
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def next_month(d):
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def utc(d):
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def archive_path(month, sensor_id):
+    return f"{month:%Y-%m}/sensor_{sensor_id}.parquet"
+
+
+def read_archive(files, start_dt, end_dt, root=ARCHIVE_DIR, columns=("ts", "value", "quality", "meta")):
+    """
+    Lê do arquivo as leituras com start_dt <= ts < end_dt.
+
+    `files` são pares (path relativo, dicionário de colunas constantes, ex.
+    {"tag": ..., "unit": ...}); os arquivos são abertos com memory map e
+    filtrados por ts na leitura (row groups fora do período são pulados).
+    """
+    if pq is None:
+        raise RuntimeError("pyarrow não instalado: necessário para ler o arquivo Parquet")
+    start_dt, end_dt = pd.Timestamp(start_dt), pd.Timestamp(end_dt)
+    start_dt = start_dt.tz_localize("UTC") if start_dt.tzinfo is None else start_dt
+    end_dt = end_dt.tz_localize("UTC") if end_dt.tzinfo is None else end_dt
+    frames = []
+    for path, extra in files:
+        t = pq.read_table(os.path.join(root, path), columns=list(columns), memory_map=True,
+                          filters=[("ts", ">=", start_dt), ("ts", "<", end_dt)])
+        if t.num_rows:
+            frames.append(t.to_pandas().assign(**extra))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(columns))
+
+
+def _stats(table):
+    ts = table.column("ts").to_numpy()
+    return {"rows": table.num_rows, "value_sum": float(table.column("value").to_numpy().sum()),
+            "ts_min": ts.min(), "ts_max": ts.max()}
+
+
+def _combine(a, b):
+    """Estatísticas de dois conjuntos disjuntos de leituras do mesmo sensor."""
+    if a is None:
+        return b
+    return {"rows": a["rows"] + b["rows"], "value_sum": a["value_sum"] + b["value_sum"],
+            "ts_min": min(a["ts_min"], b["ts_min"]), "ts_max": max(a["ts_max"], b["ts_max"])}
+
+
+def _expected(rows):
+    """{sensor_id: estatísticas} de linhas (sensor_id, n, soma, ts mínimo, ts máximo)."""
+    return {sid: {"rows": int(n), "value_sum": float(s), "ts_min": pd.Timestamp(a).to_datetime64(),
+                  "ts_max": pd.Timestamp(b).to_datetime64()}
+            for sid, n, s, a, b in rows}
+
+
+def _same(a, b):
+    return (a["rows"] == b["rows"] and a["ts_min"] == b["ts_min"] and a["ts_max"] == b["ts_max"]
+            and math.isclose(a["value_sum"], b["value_sum"], rel_tol=1e-9, abs_tol=1e-6))
+
+
+class _SensorFile:
+    """Parquet de um sensor/mês em escrita: temporário até `commit`."""
+
+    def __init__(self, root, month, sensor_id):
+        self.rel = archive_path(month, sensor_id)
+        self.final = os.path.join(root, self.rel)
+        self.tmp = self.final + ".tmp"
+        os.makedirs(os.path.dirname(self.final), exist_ok=True)
+        self.writer = pq.ParquetWriter(self.tmp, SCHEMA, compression="zstd")
+        self.unsorted = False
+
+    def write(self, rows):
+        cols = list(zip(*rows))
+        self.writer.write_batch(pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, SCHEMA)],
+                                                schema=SCHEMA))
+
+    def write_frame(self, df):
+        """Grava leituras decodificadas de blocos; o arquivo é reordenado em `close`."""
+        self.writer.write_table(pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False))
+        self.unsorted = True
+
+    def close(self):
+        """Fecha o temporário, mesclando-o ao arquivo já existente e reordenando-o se tiver blocos."""
+        self.writer.close()
+        exists = os.path.exists(self.final)
+        if not exists and not self.unsorted:
+            return
+        # mês já arquivado antes: junta com o arquivo existente. Linhas, blocos e
+        # arquivo nunca têm o mesmo sensor/dia (measurement_skip_closed_day);
+        # uma sobreposição perderia linhas aqui e a conferência de `verify` falha
+        old = [pq.read_table(self.final, memory_map=True).to_pandas()] if exists else []
+        new = pq.read_table(self.tmp).to_pandas()
+        merged = (pd.concat(old + [new], ignore_index=True)
+                    .drop_duplicates(subset=["ts"], keep="last").sort_values("ts"))
+        pq.write_table(pa.Table.from_pandas(merged, schema=SCHEMA, preserve_index=False),
+                       self.tmp, compression="zstd", row_group_size=FETCH_ROWS)
+
+    def verify(self, expected):
+        """Relê o temporário e confere com linhas + blocos (+ arquivo anterior); retorna as estatísticas dele."""
+        got = _stats(pq.read_table(self.tmp, columns=["ts", "value"], memory_map=True))
+        if not _same(got, expected):
+            raise RuntimeError(f"{self.rel}: arquivo não confere com o banco ({got} != {expected})")
+        return got
+
+    def commit(self):
+        with open(self.tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(self.tmp, self.final)
+
+    def discard(self):
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def _partition(cur, month):
+    """Nome da partição do mês, se measurement for particionada e ela existir."""
+    name = f"measurement_{month:%Y_%m}"
+    cur.execute("""SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = 'eta.measurement'::regclass AND c.relname = %s""", (name,))
+    return name if cur.fetchone() else None
+
+
+def archive_month(conn, month, root, dry_run=False):
+    """Arquiva um mês; retorna (sensores, leituras)."""
+    lo, hi = utc(month), utc(next_month(month))
+    # a consulta ao catálogo vai numa transação própria: dentro da REPEATABLE READ
+    # abaixo ela fixaria o snapshot antes das travas, e o que fosse gravado ou
+    # compactado entre o snapshot e o LOCK seria apagado sem ter sido exportado
+    with conn.cursor() as cur:
+        partition = _partition(cur, month)
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cur.execute("SET LOCAL statement_timeout = 0")
+        # travas antes da primeira consulta, que fixa o snapshot: nada entra no
+        # mês nem é compactado enquanto ele é exportado (leituras seguem liberadas).
+        # Não pôr nenhuma consulta antes delas (SET não fixa o snapshot)
+        cur.execute("LOCK TABLE eta.measurement_block IN SHARE MODE")
+        if partition:
+            cur.execute(f"LOCK TABLE eta.{partition} IN SHARE MODE")
+        cur.execute("""SELECT sensor_id, count(*), sum(value), min(ts), max(ts) FROM eta.measurement
+                       WHERE ts >= %s AND ts < %s GROUP BY sensor_id ORDER BY sensor_id""", (lo, hi))
+        expected = _expected(cur.fetchall())
+        # blocos de um dia do mês (um bloco nunca passa de um dia UTC); linhas e
+        # blocos de um sensor nunca cobrem o mesmo dia, então as contagens somam
+        cur.execute("""SELECT sensor_id, sum(n), sum(value_sum), min(ts_first), max(ts_last)
+                       FROM eta.measurement_block WHERE ts_first >= %s AND ts_first < %s
+                       GROUP BY sensor_id""", (lo, hi))
+        for sid, e in _expected(cur.fetchall()).items():
+            expected[sid] = _combine(expected.get(sid), e)
+        cur.execute(f"""SELECT {BLOCK_COLUMNS} FROM eta.measurement_block
+                        WHERE ts_first >= %s AND ts_first < %s ORDER BY sensor_id, ts_first""", (lo, hi))
+        blocks = {}
+        for b in cur.fetchall():
+            blocks.setdefault(b[0], []).append(b)
+        # sensor já arquivado neste mês: o arquivo novo é o antigo mais o que há no banco
+        cur.execute("""SELECT sensor_id, rows, value_sum, ts_min, ts_max FROM eta.measurement_archive
+                       WHERE month = %s AND sensor_id = ANY(%s)""", (month, list(expected)))
+        archived = _expected(cur.fetchall())
+    if not expected or dry_run:
+        conn.rollback()
+        return len(expected), sum(e["rows"] for e in expected.values())
+
+    files = {}
+    freed = ([], [])
+    try:
+        for sid, bs in blocks.items():
+            files[sid] = _SensorFile(root, month, sid)
+            files[sid].write_frame(blocks_to_frame(bs, meta_as_text=True))
+        with conn.cursor(name="archive_month") as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute("""SELECT sensor_id, ts, value, quality, meta::text FROM eta.measurement
+                           WHERE ts >= %s AND ts < %s ORDER BY sensor_id, ts""", (lo, hi))
+            while True:
+                rows = cur.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i == len(rows) or rows[i][0] != rows[start][0]:
+                        sid = rows[start][0]
+                        if sid not in files:
+                            files[sid] = _SensorFile(root, month, sid)
+                        files[sid].write(rows[start:i])
+                        start = i
+
+        manifest = []
+        for sid, f in files.items():
+            f.close()
+            got = f.verify(_combine(archived.get(sid), expected[sid]))
+            manifest.append((sid, month, f.rel, got["rows"], pd.Timestamp(got["ts_min"], tz="UTC"),
+                             pd.Timestamp(got["ts_max"], tz="UTC"), got["value_sum"]))
+
+        for f in files.values():
+            f.commit()
+        with conn.cursor() as cur:
+            cur.executemany("""INSERT INTO eta.measurement_archive
+                                   (sensor_id, month, path, rows, ts_min, ts_max, value_sum)
+                               VALUES (%s, %s, %s, %s, %s, %s, %s)
+                               ON CONFLICT (sensor_id, month) DO UPDATE
+                                  SET path = EXCLUDED.path, rows = EXCLUDED.rows, ts_min = EXCLUDED.ts_min,
+                                      ts_max = EXCLUDED.ts_max, value_sum = EXCLUDED.value_sum,
+                                      archived_at = NOW()""", manifest)
+            if blocks:
+                cur.execute("DELETE FROM eta.measurement_block WHERE ts_first >= %s AND ts_first < %s", (lo, hi))
+            if partition:
+                cur.execute(f"ALTER TABLE eta.measurement DETACH PARTITION eta.{partition}")
+                cur.execute(f"DROP TABLE eta.{partition}")
+            else:
+                cur.execute("SET LOCAL eta.rollup_skip = 'on'")
+                # sem partição, o espaço liberado volta para a ingestão: ver pack_blocks.forget_brin_ranges
+                cur.execute(DELETE_MEASUREMENT_SQL, (lo, hi))
+                freed = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        for f in files.values():
+            f.discard()
+        raise
+    forget_brin_ranges(conn, freed)
+    return len(files), sum(e["rows"] for e in expected.values())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Arquiva meses fechados de eta.measurement em Parquet")
+    ap.add_argument("--before", default=None,
+                    help="arquiva meses anteriores a AAAA-MM (padrão: mês corrente - ARCHIVE_KEEP_MONTHS)")
+    ap.add_argument("--dir", default=ARCHIVE_DIR, help="diretório do arquivo (ARCHIVE_DIR)")
+    ap.add_argument("--dry-run", action="store_true", help="só lista o que seria arquivado")
+    args = ap.parse_args()
+    if pq is None:
+        raise SystemExit("pyarrow não instalado: necessário para gravar Parquet")
+
+    if args.before:
+        before = month_start(datetime.strptime(args.before, "%Y-%m").date())
+    else:
+        before = month_start(datetime.now(timezone.utc).date())
+        for _ in range(ARCHIVE_KEEP_MONTHS):
+            before = month_start(date.fromordinal(before.toordinal() - 1))
+
+    conn = pg_conn()
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(ts) FROM eta.measurement WHERE ts < %s", (utc(before),))
+        first = cur.fetchone()[0]
+    conn.commit()
+    if first is None:
+        print(f"OK: nada anterior a {before:%Y-%m} no banco")
+        return
+
+    t0 = time.monotonic()
+    month = month_start(first.astimezone(timezone.utc).date())
+    total = 0
+    while month < before:
+        sensors, rows = archive_month(conn, month, args.dir, dry_run=args.dry_run)
+        total += rows
+        if rows:
+            verb = "seriam arquivadas" if args.dry_run else "arquivadas"
+            print(f"[archive] {month:%Y-%m}: {rows} leituras de {sensors} sensores {verb}")
+        month = next_month(month)
+    if total and not args.dry_run:
+        vacuum_measurement(conn)
+    conn.close()
+    print(f"OK: {total} leituras anteriores a {before:%Y-%m} em {time.monotonic() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
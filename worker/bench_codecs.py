@@ -0,0 +1,117 @@
+"""
+Microbenchmark dos codecs de payload da ingestão (ver ingest_codecs.py).
+
+Compara, para payloads representativos (1 leitura, lista de 50 leituras e
+um ciclo colunar de 500 tags):
+  - tamanho em bytes;
+  - decode puro;
+  - parse_message completo (decode + timestamps + leituras), que é o custo
+    por mensagem no worker;
+  - o caminho antigo de main.py (json.loads + json.dumps + isoparse).
+
+Uso: python bench_codecs.py [--n 2000] [--json resultado.json]
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+from dateutil import parser as dtparser
+
+import ingest_codecs
+from ingest_parse import parse_message
+
+NOW = datetime(2025, 9, 18, 21, 27, tzinfo=timezone.utc)
+NOW_ISO = "2025-09-18T21:27:00Z"
+NOW_MS = int(NOW.timestamp() * 1000)
+
+
+def payloads(ts):
+    single = {"tag": "qualidade/ph", "value": 7.12, "unit": "pH", "ts": ts, "meta": {"gw": "GW-01"}}
+    array = [{"tag": f"linha{i % 5}/sensor{i}", "value": 1.0 + i * 0.37, "unit": "bar", "ts": ts}
+             for i in range(50)]
+    columnar = {"ts": ts, "tags": [f"area{i % 10}/tag{i}" for i in range(500)],
+                "values": [round(10 + i * 0.013, 3) for i in range(500)]}
+    return {"single": single, "array50": array, "columnar500": columnar}
+
+
+def encoders():
+    enc = {"json": lambda o: json.dumps(o).encode("utf-8")}
+    if ingest_codecs.orjson is not None:
+        enc["orjson"] = ingest_codecs.orjson.dumps
+    if ingest_codecs.msgpack is not None:
+        enc["msgpack"] = ingest_codecs.msgpack.packb
+    if ingest_codecs.cbor2 is not None:
+        enc["cbor"] = lambda o: ingest_codecs.CBOR_MAGIC + ingest_codecs.cbor2.dumps(o)
+    return enc
+
+
+def timeit(fn, n):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6  # µs por chamada
+
+
+def legacy_path(data):
+    # caminho de main.py antes da camada de codecs
+    payload = json.loads(data.decode("utf-8"))
+    json.dumps(payload)
+    items = payload if isinstance(payload, list) else [payload]
+    for p in items:
+        if isinstance(p.get("ts"), str):
+            dtparser.isoparse(p["ts"])
+
+
+def run(n):
+    results = []
+    for codec, encode in encoders().items():
+        # JSON usa timestamp ISO (como os gateways atuais); binários usam epoch-ms
+        ts = NOW_ISO if codec in ("json", "orjson") else NOW_MS
+        for kind, obj in payloads(ts).items():
+            data = encode(obj)
+            decode_codec = "json" if codec == "orjson" else codec
+            saved = ingest_codecs.orjson
+            if codec == "json":
+                ingest_codecs.orjson = None  # força o json da stdlib
+            try:
+                row = {
+                    "codec": codec,
+                    "payload": kind,
+                    "bytes": len(data),
+                    "encode_us": timeit(lambda: encode(obj), n),
+                    "decode_us": timeit(lambda: ingest_codecs.decode(decode_codec, data), n),
+                    "parse_message_us": timeit(lambda: parse_message("eta/leituras/bench", data), n),
+                }
+            finally:
+                ingest_codecs.orjson = saved
+            if codec == "json" and kind != "columnar500":
+                row["legacy_us"] = timeit(lambda: legacy_path(data), n)
+            results.append(row)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000, help="iterações por medida")
+    ap.add_argument("--json", type=str, default=None, help="grava os resultados neste arquivo")
+    args = ap.parse_args()
+
+    results = run(args.n)
+    print(f"{'codec':<8} {'payload':<12} {'bytes':>7} {'encode µs':>10} {'decode µs':>10} "
+          f"{'parse µs':>10} {'legado µs':>10}")
+    for r in results:
+        legacy = f"{r['legacy_us']:10.1f}" if "legacy_us" in r else f"{'-':>10}"
+        print(f"{r['codec']:<8} {r['payload']:<12} {r['bytes']:>7} {r['encode_us']:10.1f} "
+              f"{r['decode_us']:10.1f} {r['parse_message_us']:10.1f} {legacy}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"n": args.n, "results": results}, f, indent=2)
+        print(f"OK: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
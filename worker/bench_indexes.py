@@ -0,0 +1,313 @@
+"""
+Benchmark dos índices de eta.measurement (ver eta-stack/db/13_measurement_indexes.sql).
+
+Monta a mesma massa de dados sintética num schema descartável (bench_idx),
+uma tabela por layout de índices:
+  - original:     id PK + UNIQUE (sensor_id, ts) + (sensor_id, ts DESC) + (ts DESC),
+                  como em 01_schema.sql;
+  - pk_ts:        PK (sensor_id, ts) + (ts DESC), como em 09_measurement_partitioning.sql;
+  - brin_include: PK (sensor_id, ts) INCLUDE (value) + BRIN (ts), como em 13;
+  - brin_forget:  o mesmo de brin_include, mas desfazendo o resumo do BRIN nas
+                  páginas liberadas por deleções (eta.measurement_brin_forget,
+                  como fazem pack_blocks, archive_measurements e a retenção).
+e mede, em cada uma:
+  - vazão de inserção: carga inicial em ordem de ts (INSERT ... SELECT por
+    dia) e lotes no formato da ingestão (execute_values, um ciclo de
+    varredura por lote, ON CONFLICT DO NOTHING);
+  - tamanho da tabela e de cada índice;
+  - latência (p50/p95) das consultas da API sobre measurement: última
+    leitura por sensor (painel / sensor_latest_refresh), série bruta de
+    poucas tags numa janela curta e aba "Bruto" do relatório (todas as tags
+    num dia), com o tipo de scan que o planner escolheu e os blocos lidos;
+  - com --reuse-days N, o cenário de reaproveitamento: apaga os N primeiros
+    dias (como pack/retenção), VACUUM, insere N dias novos depois do fim (as
+    linhas novas caem nas páginas liberadas) e mede de novo as consultas numa
+    janela recente. Sem desfazer o resumo, as faixas do BRIN reaproveitadas
+    passam a cobrir do dia apagado até hoje e toda consulta recente as lê.
+
+Uso:
+  python bench_indexes.py --sensors 50 --days 30 --interval 60 --json idx.json
+  python bench_indexes.py --layouts pk_ts,brin_include --repeat 50 --keep
+  python bench_indexes.py --layouts pk_ts,brin_include,brin_forget --reuse-days 10
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+PGHOST = os.getenv("PGHOST", "postgres")
+PGPORT = int(os.getenv("PGPORT", "5432"))
+PGUSER = os.getenv("PGUSER", "postgres")
+PGPASSWORD = os.getenv("PGPASSWORD", "postgres")
+PGDATABASE = os.getenv("PGDATABASE", "eta")
+
+SCHEMA = "bench_idx"
+COLUMNS = """
+    id        BIGSERIAL,
+    sensor_id INT NOT NULL,
+    ts        TIMESTAMPTZ NOT NULL,
+    value     DOUBLE PRECISION NOT NULL,
+    quality   BOOLEAN DEFAULT TRUE,
+    meta      JSONB
+"""
+LAYOUTS = {
+    "original": [
+        "ALTER TABLE {t} ADD PRIMARY KEY (id)",
+        "ALTER TABLE {t} ADD UNIQUE (sensor_id, ts)",
+        "CREATE INDEX ON {t} (sensor_id, ts DESC)",
+        "CREATE INDEX ON {t} (ts DESC)",
+    ],
+    "pk_ts": [
+        "ALTER TABLE {t} ADD PRIMARY KEY (sensor_id, ts)",
+        "CREATE INDEX ON {t} (ts DESC)",
+    ],
+    "brin_include": [
+        "ALTER TABLE {t} ADD PRIMARY KEY (sensor_id, ts) INCLUDE (value)",
+        "CREATE INDEX ON {t} USING brin (ts) WITH (pages_per_range = 32, autosummarize = on)",
+    ],
+}
+LAYOUTS["brin_forget"] = LAYOUTS["brin_include"]
+# layouts que desfazem o resumo do BRIN depois de apagar
+FORGET = {"brin_forget"}
+
+QUERIES = {
+    # painel: última leitura de cada sensor (o que sensor_latest_refresh faz)
+    "latest": ("""SELECT s.id, l.ts, l.value FROM generate_series(1, %(sensors)s) s(id)
+                  CROSS JOIN LATERAL (SELECT ts, value FROM {t} m WHERE m.sensor_id = s.id
+                                      ORDER BY ts DESC LIMIT 1) l"""),
+    # /measurements/series com janela bruta: poucas tags, ts e value
+    "series": ("""SELECT sensor_id, ts, value FROM {t}
+                  WHERE sensor_id = ANY(%(tags)s) AND ts >= %(start)s AND ts <= %(end)s
+                  ORDER BY sensor_id, ts"""),
+    # relatório, aba Bruto: todas as tags num período
+    "report": ("""SELECT ts, sensor_id, value, quality, meta FROM {t}
+                  WHERE ts >= %(start)s AND ts < %(end)s ORDER BY ts"""),
+}
+
+
+def pg_conn():
+    return psycopg2.connect(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, dbname=PGDATABASE)
+
+
+def percentiles(values):
+    a = np.asarray(values, dtype=np.float64)
+    p50, p95 = np.percentile(a, [50, 95])
+    return {"n": int(a.size), "p50_ms": float(p50), "p95_ms": float(p95), "max_ms": float(a.max())}
+
+
+def scan_nodes(plan):
+    """Tipos de scan de um plano EXPLAIN (FORMAT JSON), sem repetição."""
+    found = []
+
+    def walk(node):
+        if "Scan" in node["Node Type"] and node["Node Type"] not in found:
+            found.append(node["Node Type"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return ", ".join(found)
+
+
+def plan_blocks(plan):
+    """Blocos lidos (shared hit + read) e blocos de heap exatos/lossy de um EXPLAIN (ANALYZE, BUFFERS)."""
+    out = {"blocks": plan[0]["Plan"].get("Shared Hit Blocks", 0) + plan[0]["Plan"].get("Shared Read Blocks", 0),
+           "exact_heap": 0, "lossy_heap": 0}
+
+    def walk(node):
+        out["exact_heap"] += node.get("Exact Heap Blocks", 0)
+        out["lossy_heap"] += node.get("Lossy Heap Blocks", 0)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return out
+
+
+def create_table(cur, layout):
+    t = f"{SCHEMA}.m_{layout}"
+    cur.execute(f"DROP TABLE IF EXISTS {t}")
+    cur.execute(f"CREATE TABLE {t} ({COLUMNS})")
+    for stmt in LAYOUTS[layout]:
+        cur.execute(stmt.format(t=t))
+    return t
+
+
+def load(conn, t, sensors, start, days, interval):
+    """Carga inicial em ordem de ts, um dia por transação; retorna linhas/s."""
+    rows, t0 = 0, time.perf_counter()
+    with conn.cursor() as cur:
+        for d in range(days):
+            lo = start + timedelta(days=d)
+            cur.execute(f"""INSERT INTO {t} (sensor_id, ts, value, meta)
+                            SELECT s, g, round((50 + 10 * sin(s + extract(epoch FROM g) / 3600))::numeric, 3),
+                                   '{{"sim": true}}'
+                            FROM generate_series(%s::timestamptz, %s::timestamptz - interval '1 microsecond',
+                                                 make_interval(secs => %s)) g
+                            CROSS JOIN generate_series(1, %s) s
+                            ORDER BY g, s""", (lo, lo + timedelta(days=1), interval, sensors))
+            rows += cur.rowcount
+            conn.commit()
+    return rows / (time.perf_counter() - t0)
+
+
+def ingest_batches(conn, t, sensors, after, interval, cycles, rng):
+    """Lotes como os da ingestão (um ciclo com todas as tags); retorna linhas/s e latência por lote."""
+    lat, t0 = [], time.perf_counter()
+    with conn.cursor() as cur:
+        for c in range(cycles):
+            ts = after + timedelta(seconds=interval * (c + 1))
+            values = np.round(rng.normal(50.0, 5.0, sensors), 3).tolist()
+            b0 = time.perf_counter()
+            execute_values(cur, f"""INSERT INTO {t} (sensor_id, ts, value) VALUES %s
+                                    ON CONFLICT (sensor_id, ts) DO NOTHING""",
+                           [(s + 1, ts, v) for s, v in enumerate(values)], page_size=sensors)
+            conn.commit()
+            lat.append((time.perf_counter() - b0) * 1000)
+    return sensors * cycles / (time.perf_counter() - t0), percentiles(lat)
+
+
+def sizes(cur, t):
+    cur.execute("""SELECT c.relname, pg_relation_size(c.oid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                   WHERE i.indrelid = %s::regclass ORDER BY c.relname""", (t,))
+    idx = {name: size for name, size in cur.fetchall()}
+    cur.execute("SELECT pg_relation_size(%s::regclass)", (t,))
+    return {"table_mb": cur.fetchone()[0] / 2**20, "indexes_mb": sum(idx.values()) / 2**20,
+            "per_index_mb": {k: round(v / 2**20, 2) for k, v in idx.items()}}
+
+
+def run_queries(conn, t, sensors, start, end, repeat, series_minutes, rng):
+    out = {}
+    with conn.cursor() as cur:
+        for name, sql in QUERIES.items():
+            sql = sql.format(t=t)
+            lat = []
+            for i in range(repeat + 1):
+                # janelas sorteadas dentro do período carregado; a 1ª rodada só aquece
+                if name == "series":
+                    hi = start + (end - start) * rng.uniform(0.1, 1.0)
+                    params = {"tags": rng.choice(np.arange(1, sensors + 1), 3, replace=False).tolist(),
+                              "start": hi - timedelta(minutes=series_minutes), "end": hi}
+                else:
+                    lo = start + timedelta(days=int(rng.integers(0, max((end - start).days - 1, 1))))
+                    params = {"sensors": sensors, "start": lo, "end": lo + timedelta(days=1)}
+                q0 = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                if i:
+                    lat.append((time.perf_counter() - q0) * 1000)
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            out[name] = {**percentiles(lat), "scan": scan_nodes(plan), **plan_blocks(plan)}
+    conn.rollback()
+    return out
+
+
+def reuse(conn, t, layout, sensors, start, end, days, interval):
+    """Apaga os `days` primeiros dias e insere `days` dias novos depois do fim; retorna (início, fim) dos novos."""
+    with conn.cursor() as cur:
+        cur.execute(f"""WITH d AS (DELETE FROM {t} WHERE ts < %s RETURNING tableoid, ctid)
+                        SELECT COALESCE(array_agg(rel), '{{}}'), COALESCE(array_agg(page), '{{}}')
+                        FROM (SELECT DISTINCT tableoid::regclass::text AS rel,
+                                     (ctid::text::point)[0]::int8 AS page FROM d) p""",
+                    (start + timedelta(days=days),))
+        rels, pages = cur.fetchone()
+        conn.commit()
+        if layout in FORGET:
+            cur.execute("SELECT eta.measurement_brin_forget(%s::regclass[], %s::int8[])", (rels, pages))
+            conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"VACUUM {t}")
+    conn.autocommit = False
+    # depois dos lotes de ingest_batches, que passam um pouco do fim
+    lo = end + timedelta(days=1)
+    load(conn, t, sensors, lo, days, interval)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"VACUUM ANALYZE {t}")
+    conn.autocommit = False
+    return lo, lo + timedelta(days=days)
+
+
+def print_queries(queries):
+    for name, q in queries.items():
+        print(f"    {name:7s} p50 {q['p50_ms']:8.2f} ms  p95 {q['p95_ms']:8.2f} ms  "
+              f"blocos {q['blocks']:7d} (heap exatos {q['exact_heap']}, lossy {q['lossy_heap']})  [{q['scan']}]")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compara layouts de índices de eta.measurement")
+    ap.add_argument("--sensors", type=int, default=50)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--interval", type=int, default=60, help="segundos entre leituras de um sensor")
+    ap.add_argument("--cycles", type=int, default=200, help="lotes no formato da ingestão, após a carga")
+    ap.add_argument("--repeat", type=int, default=30, help="execuções por consulta")
+    ap.add_argument("--series-minutes", type=int, default=360)
+    ap.add_argument("--layouts", default=",".join(LAYOUTS))
+    ap.add_argument("--reuse-days", type=int, default=0,
+                    help="apaga os N primeiros dias, insere N novos e mede de novo (0 = não roda)")
+    ap.add_argument("--keep", action="store_true", help="não apaga o schema bench_idx ao final")
+    ap.add_argument("--json", type=str, default=None, help="grava os resultados neste arquivo")
+    args = ap.parse_args()
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=args.days)
+    conn = pg_conn()
+    with conn.cursor() as cur:
+        cur.execute("SET statement_timeout = 0")
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    conn.commit()
+
+    result = {"params": vars(args), "layouts": {}}
+    try:
+        for layout in args.layouts.split(","):
+            rng = np.random.default_rng(42)
+            with conn.cursor() as cur:
+                t = create_table(cur, layout)
+            conn.commit()
+            r = {"load_rows_s": load(conn, t, args.sensors, start, args.days, args.interval)}
+            r["batch_rows_s"], r["batch_ms"] = ingest_batches(conn, t, args.sensors, end, args.interval,
+                                                              args.cycles, rng)
+            # índice só cobre de fato depois do vacuum (mapa de visibilidade)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"VACUUM ANALYZE {t}")
+                r.update(sizes(cur, t))
+            conn.autocommit = False
+            r["queries"] = run_queries(conn, t, args.sensors, start, end, args.repeat, args.series_minutes, rng)
+            result["layouts"][layout] = r
+
+            print(f"[{layout}] carga {r['load_rows_s']:,.0f} linhas/s, lotes {r['batch_rows_s']:,.0f} linhas/s "
+                  f"(p95 {r['batch_ms']['p95_ms']:.1f} ms), tabela {r['table_mb']:.1f} MB, "
+                  f"índices {r['indexes_mb']:.1f} MB {r['per_index_mb']}")
+            print_queries(r["queries"])
+
+            if args.reuse_days:
+                lo, hi = reuse(conn, t, layout, args.sensors, start, end, args.reuse_days, args.interval)
+                rng = np.random.default_rng(7)
+                r["reuse"] = run_queries(conn, t, args.sensors, lo, hi, args.repeat, args.series_minutes, rng)
+                print(f"  depois de apagar {args.reuse_days} dias e inserir {args.reuse_days} novos:")
+                print_queries(r["reuse"])
+    finally:
+        if not args.keep:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"OK: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
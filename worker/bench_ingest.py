@@ -0,0 +1,380 @@
+"""
+Gerador de carga e benchmark de vazão da ingestão.
+
+Modos:
+  - mqtt: publica leituras sintéticas no broker (MQTT_HOST/MQTT_PORT) na taxa
+          pedida e mede o pipeline de main.py rodando à parte: vazão que
+          chega ao banco, latência ponta a ponta (ts da leitura -> linha
+          visível em eta.measurement, por polling a cada --poll-ms) e atraso
+          do broker (publicação -> entrega a um assinante de controle).
+  - db:   grava direto no banco com ingest_batch.write_batch (sem broker)
+          e mede a latência de commit de cada lote.
+
+O ts de cada leitura é o instante do ciclo de publicação, então todas as
+latências saem do mesmo relógio (rode o benchmark na mesma máquina do worker
+ou com relógios sincronizados).
+
+Uso:
+  python bench_ingest.py --mode mqtt --tags 5000 --rate 1 --duration 60 --json run.json
+  python bench_ingest.py --mode db --tags 5000 --rate 0 --duration 30 --baseline run_anterior.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import paho.mqtt.client as mqtt
+import psycopg2
+from psycopg2.extras import execute_values
+
+import ingest_codecs
+from ingest_batch import write_batch
+from ingest_parse import parse_message
+from main import ensure_defaults
+from sensor_registry import SensorRegistry
+
+PGHOST = os.getenv("PGHOST", "postgres")
+PGPORT = int(os.getenv("PGPORT", "5432"))
+PGUSER = os.getenv("PGUSER", "postgres")
+PGPASSWORD = os.getenv("PGPASSWORD", "postgres")
+PGDATABASE = os.getenv("PGDATABASE", "eta")
+
+MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+
+TOPIC_PREFIX = "eta/leituras/"
+
+
+def pg_conn():
+    return psycopg2.connect(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, dbname=PGDATABASE)
+
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    a = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"n": int(a.size), "mean": float(a.mean()), "p50": float(p50), "p95": float(p95),
+            "p99": float(p99), "max": float(a.max())}
+
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# -- geração de carga -------------------------------------------------------
+
+def make_tags(prefix, n):
+    return [f"{prefix}/t{i:05d}" for i in range(n)]
+
+
+def encode(obj, codec):
+    if codec == "msgpack":
+        return ingest_codecs.msgpack.packb(obj)
+    if codec == "cbor":
+        return ingest_codecs.CBOR_MAGIC + ingest_codecs.cbor2.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def cycle_messages(prefix, tags, ts, fmt, chunk, codec, rng):
+    """Mensagens (tópico, bytes) de um ciclo de varredura com todas as tags."""
+    # binários levam epoch-ms; JSON leva ISO-8601, como os gateways atuais
+    ts_value = int(ts.timestamp() * 1000) if codec != "json" else ts.isoformat()
+    values = np.round(rng.normal(50.0, 5.0, len(tags)), 3).tolist()
+    suffix = "" if codec == "json" else f"/{codec}"
+    if fmt == "single":
+        for tag, v in zip(tags, values):
+            yield TOPIC_PREFIX + tag + suffix, encode({"tag": tag, "value": v, "ts": ts_value}, codec)
+        return
+    for start in range(0, len(tags), chunk):
+        part, vals = tags[start:start + chunk], values[start:start + chunk]
+        topic = f"{TOPIC_PREFIX}{prefix}/lote{start // chunk}{suffix}"
+        if fmt == "columnar":
+            obj = {"ts": ts_value, "tags": part, "values": vals}
+        else:
+            obj = [{"tag": t, "value": v, "ts": ts_value} for t, v in zip(part, vals)]
+        yield topic, encode(obj, codec)
+
+
+def paced_cycles(rate, duration):
+    """Gera os instantes de cada ciclo; rate=0 significa sem pausa entre ciclos."""
+    t0 = time.monotonic()
+    wall0 = time.time()
+    n = 0
+    while True:
+        due = t0 + (n / rate if rate > 0 else 0)
+        now = time.monotonic()
+        if now - t0 >= duration:
+            return
+        if due > now:
+            time.sleep(due - now)
+            now = time.monotonic()
+        # ts do ciclo = relógio de parede do instante de envio (resolução de ms)
+        ts = datetime.fromtimestamp(round(wall0 + (now - t0), 3), tz=timezone.utc)
+        yield n, ts, max(0.0, now - due)
+        n += 1
+
+
+# -- observadores -----------------------------------------------------------
+
+class BrokerObserver:
+    """Assinante de controle: mede publicação -> entrega pelo broker."""
+
+    def __init__(self, topic):
+        self.lags_ms = []
+        self.received = 0
+        self._client = mqtt.Client(client_id=f"eta-bench-observer-{os.getpid()}")
+        self._client.on_message = self._on_message
+        self._topic = topic
+        self._ready = threading.Event()
+        self._client.on_subscribe = lambda *a: self._ready.set()
+
+    def _on_message(self, client, userdata, msg):
+        now = time.time()
+        parsed = parse_message(msg.topic, msg.payload)
+        if parsed["readings"]:
+            self.received += 1
+            self.lags_ms.append((now - parsed["readings"][0]["ts"].timestamp()) * 1000.0)
+
+    def start(self):
+        self._client.connect(MQTT_HOST, MQTT_PORT, 60)
+        self._client.subscribe(self._topic)
+        self._client.loop_start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        self._client.loop_stop()
+        self._client.disconnect()
+
+
+class DbObserver:
+    """
+    Polling em eta.measurement: vazão que chega ao banco e latência ponta a ponta.
+
+    Com vários writers um id menor pode ser commitado depois de um maior, então
+    cada poll relê uma janela de `window` ids abaixo do maior já visto.
+    """
+
+    def __init__(self, sensor_ids, poll_ms, window=20000):
+        self.sensor_ids = list(sensor_ids)
+        self.poll_s = poll_ms / 1000.0
+        self.window = window
+        self._seen = set()
+        self.latencies_ms = []
+        self.rows = 0
+        self.first_at = None
+        self.last_at = None
+        self._stop = threading.Event()
+        self._conn = pg_conn()
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT coalesce(max(id), 0) FROM eta.measurement")
+            self._start_id = self._last_id = cur.fetchone()[0]
+        self._thread = threading.Thread(target=self._run, name="bench-db-observer", daemon=True)
+
+    def poll(self):
+        with self._conn.cursor() as cur:
+            cur.execute("""SELECT id, ts FROM eta.measurement
+                           WHERE id > %s AND sensor_id = ANY(%s) ORDER BY id""",
+                        (max(self._start_id, self._last_id - self.window), self.sensor_ids))
+            rows = [r for r in cur.fetchall() if r[0] not in self._seen]
+        now = time.time()
+        if rows:
+            self._seen.update(r[0] for r in rows)
+            self._last_id = max(self._last_id, rows[-1][0])
+            self.rows += len(rows)
+            self.first_at = self.first_at or now
+            self.last_at = now
+            self.latencies_ms.extend((now - ts.timestamp()) * 1000.0 for _, ts in rows)
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_s):
+            self.poll()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait_drain(self, expected, timeout_s):
+        """Espera as linhas esperadas chegarem (ou o timeout); retorna o tempo de dreno."""
+        t0 = time.monotonic()
+        while self.rows < expected and time.monotonic() - t0 < timeout_s:
+            time.sleep(self.poll_s)
+        return time.monotonic() - t0
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.poll()
+        self._conn.close()
+
+
+# -- execução ---------------------------------------------------------------
+
+def ensure_sensors(conn, tags):
+    """Cadastra as tags do benchmark (reaproveitadas entre execuções) e retorna seus ids."""
+    device_id = ensure_defaults(conn)  # mesmo dispositivo padrão do worker
+    with conn.cursor() as cur:
+        execute_values(cur, """INSERT INTO eta.sensor (device_id, tag, unit) VALUES %s
+                               ON CONFLICT (tag) DO NOTHING""",
+                       [(device_id, t, None) for t in tags], page_size=1000)
+        cur.execute("SELECT id FROM eta.sensor WHERE tag = ANY(%s)", (tags,))
+        ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    return device_id, ids
+
+
+def run_mqtt(args, tags, sensor_ids):
+    observer = BrokerObserver(f"{TOPIC_PREFIX}{args.prefix}/#").start()
+    db = DbObserver(sensor_ids, args.poll_ms).start()
+    client = mqtt.Client(client_id=f"eta-bench-{os.getpid()}")
+    client.connect(MQTT_HOST, MQTT_PORT, 60)
+    client.loop_start()
+
+    rng = np.random.default_rng(42)
+    sent_msgs = sent_rows = cycles = 0
+    late_s = []
+    t0, wall0 = time.monotonic(), time.time()
+    for _, ts, late in paced_cycles(args.rate, args.duration):
+        for topic, data in cycle_messages(args.prefix, tags, ts, args.format, args.chunk, args.codec, rng):
+            client.publish(topic, data, qos=args.qos)
+            sent_msgs += 1
+        sent_rows += len(tags)
+        cycles += 1
+        late_s.append(late)
+    publish_s = time.monotonic() - t0
+
+    drain_s = db.wait_drain(sent_rows, args.drain_timeout)
+    db.stop()
+    client.loop_stop()
+    client.disconnect()
+    observer.stop()
+
+    landed_s = db.last_at - wall0 if db.last_at else None
+    return {
+        "publish": {"cycles": cycles, "messages": sent_msgs, "rows": sent_rows, "seconds": publish_s,
+                    "rows_per_s": sent_rows / publish_s, "messages_per_s": sent_msgs / publish_s,
+                    "cycle_late_ms": percentiles([x * 1000.0 for x in late_s])},
+        "landed": {"rows": db.rows, "rows_expected": sent_rows, "loss": sent_rows - db.rows,
+                   "drain_s": drain_s,
+                   "rows_per_s": db.rows / landed_s if landed_s else 0.0},
+        "broker_lag_ms": percentiles(observer.lags_ms),
+        "e2e_latency_ms": percentiles(db.latencies_ms),
+    }
+
+
+def run_db(args, tags, device_id):
+    conn = pg_conn()
+    registry = SensorRegistry(device_id).load(conn, listen=False)
+    rng = np.random.default_rng(42)
+    commit_ms, sent_rows = [], 0
+    t0 = time.monotonic()
+    for _, ts, _ in paced_cycles(args.rate, args.duration):
+        batch, rows = [], 0
+        for topic, data in cycle_messages(args.prefix, tags, ts, args.format, args.chunk, args.codec, rng):
+            msg = parse_message(topic, data)
+            batch.append(msg)
+            rows += len(msg["readings"])
+            if rows >= args.batch_rows:
+                commit_ms.append(timed_write(conn, registry, batch))
+                sent_rows += rows
+                batch, rows = [], 0
+        if batch:
+            commit_ms.append(timed_write(conn, registry, batch))
+            sent_rows += rows
+    seconds = time.monotonic() - t0
+    conn.close()
+    return {
+        "landed": {"rows": sent_rows, "seconds": seconds, "rows_per_s": sent_rows / seconds,
+                   "batches": len(commit_ms)},
+        "commit_latency_ms": percentiles(commit_ms),
+    }
+
+
+def timed_write(conn, registry, batch):
+    t = time.perf_counter()
+    write_batch(conn, registry, batch)
+    return (time.perf_counter() - t) * 1000.0
+
+
+def compare(result, baseline_path):
+    """Imprime a variação das métricas principais contra um JSON anterior."""
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    keys = [("landed", "rows_per_s"), ("e2e_latency_ms", "p50"), ("e2e_latency_ms", "p99"),
+            ("broker_lag_ms", "p99"), ("commit_latency_ms", "p50"), ("commit_latency_ms", "p99")]
+    print(f"comparação com {baseline_path} (rev {base.get('git_rev')}):")
+    changed = [k for k in ("mode", "tags", "rate", "format", "chunk", "codec")
+               if base.get("config", {}).get(k) != result["config"].get(k)]
+    if changed:
+        print(f"  atenção: configuração diferente em {', '.join(changed)}")
+    for section, key in keys:
+        old = base.get(section, {}).get(key)
+        new = result.get(section, {}).get(key)
+        if old is None or new is None:
+            continue
+        delta = (new - old) / old * 100.0 if old else 0.0
+        print(f"  {section}.{key:<5} {old:12.2f} -> {new:12.2f} ({delta:+.1f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=("mqtt", "db"), default="mqtt")
+    ap.add_argument("--tags", type=int, default=5000)
+    ap.add_argument("--rate", type=float, default=1.0, help="ciclos por segundo (0 = sem limite)")
+    ap.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    ap.add_argument("--format", choices=("single", "array", "columnar"), default="array")
+    ap.add_argument("--chunk", type=int, default=100, help="tags por mensagem (array/columnar)")
+    ap.add_argument("--codec", choices=("json", "msgpack", "cbor"), default="json")
+    ap.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    ap.add_argument("--prefix", default="bench", help="prefixo das tags sintéticas")
+    ap.add_argument("--batch-rows", type=int, default=500, help="leituras por lote no modo db")
+    ap.add_argument("--poll-ms", type=int, default=100, help="intervalo do polling no banco (modo mqtt)")
+    ap.add_argument("--drain-timeout", type=float, default=60.0)
+    ap.add_argument("--json", type=str, default=None, help="grava os resultados neste arquivo")
+    ap.add_argument("--baseline", type=str, default=None, help="JSON de uma execução anterior para comparar")
+    args = ap.parse_args()
+
+    tags = make_tags(args.prefix, args.tags)
+    conn = pg_conn()
+    device_id, sensor_ids = ensure_sensors(conn, tags)
+    conn.close()
+
+    started = datetime.now(timezone.utc)
+    if args.mode == "mqtt":
+        result = run_mqtt(args, tags, sensor_ids)
+    else:
+        result = run_db(args, tags, device_id)
+    result = {"started_at": started.isoformat(), "git_rev": git_rev(), "host": platform.node(),
+              "python": platform.python_version(), "config": vars(args), **result}
+
+    for section in ("publish", "landed"):
+        if section in result:
+            print(section, {k: round(v, 2) if isinstance(v, float) else v
+                            for k, v in result[section].items() if not isinstance(v, dict)})
+    for section in ("broker_lag_ms", "e2e_latency_ms", "commit_latency_ms"):
+        if section in result:
+            print(section, {k: round(v, 1) for k, v in result[section].items()})
+
+    if args.baseline:
+        compare(result, args.baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"OK: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
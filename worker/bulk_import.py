@@ -0,0 +1,200 @@
+"""
+Importação em massa de histórico (CSV / Parquet) para eta.measurement.
+
+Formatos de entrada (detectados pelas colunas):
+  - long: ts, tag, value e, opcionais, unit, quality, meta (JSON)
+          (eta_synthetic_*_long.csv do make_data.py, exportações de historiador);
+  - wide: ts + uma coluna por tag (eta_synthetic_*_wide.csv).
+
+O arquivo é lido em blocos de --chunk linhas (pandas / pyarrow) e cada bloco
+vai para um processo do pool (--workers), que na sua própria conexão:
+  1. faz COPY do bloco para uma tabela temporária (staging);
+  2. cadastra de uma vez as tags ainda desconhecidas (ON CONFLICT (tag));
+  3. mescla em eta.measurement com JOIN em eta.sensor e
+     ON CONFLICT (sensor_id, ts) DO NOTHING (ou DO UPDATE com --update),
+     pulando os dias já compactados em blocos ou arquivados em Parquet.
+Cada bloco é uma transação: rodar de novo o mesmo arquivo não duplica nada.
+
+Uso:
+  python bulk_import.py eta_synthetic_month_long.csv
+  python bulk_import.py historiador_2024.parquet --workers 8 --chunk 500000
+  python bulk_import.py planta_wide.csv --tz America/Sao_Paulo --unit m3/h
+"""
+
+import argparse
+import io
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from ingest_codecs import json_dumps
+from main import ensure_defaults, pg_conn
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+STAGE_COLUMNS = ("tag", "unit", "ts", "value", "quality", "meta")
+
+MERGE_SQL = """
+    INSERT INTO eta.measurement (sensor_id, ts, value, quality, meta)
+    SELECT s.id, st.ts, st.value, COALESCE(st.quality, TRUE), st.meta
+      FROM stage st JOIN eta.sensor s ON s.tag = st.tag
+     -- dias já compactados/arquivados (eta.measurement_day_closed) ficam de fora:
+     -- as leituras voltariam para measurement e os rollups as contariam duas vezes
+     WHERE NOT EXISTS (SELECT 1 FROM eta.measurement_block b
+                        WHERE b.sensor_id = s.id AND b.ts_first >= date_trunc('day', st.ts, 'UTC')
+                          AND b.ts_first < date_trunc('day', st.ts, 'UTC') + interval '1 day')
+       AND NOT EXISTS (SELECT 1 FROM eta.measurement_archive a
+                        WHERE a.sensor_id = s.id AND a.month = date_trunc('month', st.ts, 'UTC')::date)
+    ON CONFLICT (sensor_id, ts) DO {action}
+"""
+UPDATE_ACTION = "UPDATE SET value = EXCLUDED.value, quality = EXCLUDED.quality, meta = EXCLUDED.meta"
+# última leitura de cada tag do bloco em eta.sensor_latest (só avança no tempo)
+LATEST_SQL = """
+    INSERT INTO eta.sensor_latest AS l (sensor_id, ts, value, quality, meta)
+    SELECT s.id, st.ts, st.value, COALESCE(st.quality, TRUE), st.meta
+      FROM (SELECT DISTINCT ON (tag) * FROM stage ORDER BY tag, ts DESC) st
+      JOIN eta.sensor s ON s.tag = st.tag
+     ORDER BY s.id
+    ON CONFLICT (sensor_id) DO UPDATE
+       SET ts = EXCLUDED.ts, value = EXCLUDED.value, quality = EXCLUDED.quality, meta = EXCLUDED.meta
+     WHERE EXCLUDED.ts > l.ts
+"""
+
+# conexão e parâmetros de cada processo do pool (ver _init_worker)
+_conn = None
+_device_id = None
+_merge_sql = None
+
+
+def _init_worker(device_id, update):
+    global _conn, _device_id, _merge_sql
+    _conn = pg_conn()
+    _device_id = device_id
+    _merge_sql = MERGE_SQL.format(action=UPDATE_ACTION if update else "NOTHING")
+    with _conn.cursor() as cur:
+        # blocos grandes passam pelos triggers dos rollups: sem o statement_timeout da ingestão
+        cur.execute("SET statement_timeout = 0")
+        # MERGE_SQL já exclui os dias fechados em lote: sem a checagem linha a linha do trigger
+        cur.execute("SET eta.closed_day_checked = 'on'")
+        # bloco perdido num crash é só reimportado: não precisa esperar o fsync do WAL
+        cur.execute("SET synchronous_commit = off")
+        cur.execute("""CREATE TEMP TABLE stage (tag text, unit text, ts timestamptz, value float8,
+                                                quality boolean, meta jsonb) ON COMMIT DELETE ROWS""")
+    _conn.commit()
+
+
+def _load_chunk(df):
+    """Grava um bloco já normalizado (colunas STAGE_COLUMNS); retorna (lidas, gravadas)."""
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False, columns=list(STAGE_COLUMNS), date_format="%Y-%m-%dT%H:%M:%S.%f%z")
+    buf.seek(0)
+    try:
+        with _conn.cursor() as cur:
+            cur.copy_expert(f"COPY stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+            # ORDER BY: processos cadastrando as mesmas tags travam na mesma ordem (sem deadlock)
+            cur.execute("""INSERT INTO eta.sensor (device_id, tag, unit)
+                           SELECT %s, tag, unit FROM (SELECT DISTINCT ON (tag) tag, unit FROM stage
+                                                      ORDER BY tag, unit NULLS LAST) t
+                           ORDER BY tag
+                           ON CONFLICT (tag) DO NOTHING""", (_device_id,))
+            cur.execute(_merge_sql)
+            written = cur.rowcount
+            cur.execute(LATEST_SQL)
+        _conn.commit()
+    except Exception:
+        _conn.rollback()
+        raise
+    return len(df), written
+
+
+def read_chunks(path, chunk):
+    """Itera DataFrames de até `chunk` linhas do arquivo."""
+    if path.endswith((".parquet", ".pq")):
+        if pq is None:
+            raise SystemExit("pyarrow não instalado: necessário para ler Parquet")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk)
+
+
+def _meta_json(meta):
+    """meta como texto JSON para o COPY: o CSV já traz texto, o Parquet traz dict/struct."""
+    if meta is None or isinstance(meta, str):
+        return meta
+    if isinstance(meta, float) and math.isnan(meta):
+        return None
+    return json_dumps(meta.tolist() if hasattr(meta, "tolist") else meta)
+
+
+def normalize(df, tz, unit):
+    """Converte um bloco long ou wide para as colunas da staging."""
+    if "tag" in df.columns and "value" in df.columns:
+        out = df.reindex(columns=STAGE_COLUMNS)
+    else:
+        out = df.melt(id_vars="ts", var_name="tag", value_name="value").reindex(columns=STAGE_COLUMNS)
+    if unit is not None:
+        out["unit"] = out["unit"].fillna(unit)
+    ts = pd.to_datetime(out["ts"], utc=tz is None, format="mixed")
+    if tz is not None:
+        ts = ts.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT") if ts.dt.tz is None else ts
+        ts = ts.dt.tz_convert("UTC")
+    out["ts"] = ts
+    # NaN/inf (inclusive "nan"/"inf" no CSV) contaminariam as somas dos rollups
+    out["value"] = pd.to_numeric(out["value"], errors="coerce").replace([np.inf, -np.inf], np.nan)
+    out["meta"] = out["meta"].map(_meta_json, na_action="ignore").astype(object)
+    # repetição dentro do bloco quebraria o ON CONFLICT DO UPDATE; vale a última
+    return out.dropna(subset=["tag", "ts", "value"]).drop_duplicates(subset=["tag", "ts"], keep="last")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Importa histórico CSV/Parquet para eta.measurement")
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--chunk", type=int, default=200_000, help="linhas do arquivo por bloco")
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--tz", default=None, help="fuso dos ts sem fuso (padrão: UTC)")
+    ap.add_argument("--unit", default=None, help="unidade das tags novas sem coluna unit")
+    ap.add_argument("--update", action="store_true", help="sobrescreve medições já existentes")
+    args = ap.parse_args()
+
+    conn = pg_conn()
+    device_id = ensure_defaults(conn)
+    conn.close()
+
+    t0 = time.monotonic()
+    read = written = 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(device_id, args.update)) as pool:
+        pending = set()
+
+        def collect(done):
+            nonlocal read, written
+            for fut in done:
+                r, w = fut.result()
+                read += r
+                written += w
+            elapsed = time.monotonic() - t0
+            print(f"[import] {read} leituras ({read / elapsed:.0f}/s), {written} gravadas")
+
+        for path in args.files:
+            for df in read_chunks(path, args.chunk):
+                # limita os blocos em memória aguardando um processo livre
+                if len(pending) >= 2 * args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(pool.submit(_load_chunk, normalize(df, args.tz, args.unit)))
+        if pending:
+            collect(wait(pending).done)
+
+    elapsed = time.monotonic() - t0
+    print(f"OK: {read} leituras, {written} gravadas em {elapsed:.1f}s ({read / max(elapsed, 1e-9):.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
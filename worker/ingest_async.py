@@ -0,0 +1,485 @@
+"""
+Ingestão MQTT -> Postgres totalmente assíncrona (alternativa a main.py).
+
+Um único processo asyncio: cliente MQTT assíncrono (aiomqtt), pool de
+conexões assíncronas (psycopg_pool) e gravação em lote por coroutines.
+O contrato do payload é o mesmo de main.py (ver ingest_parse.parse_message),
+então os gateways não mudam nada, e as leituras passam pelos mesmos estágios,
+na mesma ordem, no laço de recebimento: duplicadas (ingest_dedup), validação
+(ingest_validate) e compressão (ingest_compress). Lote que falha por banco
+fora do ar vai para o spool em disco (ingest_spool) e é regravado por uma
+task quando o banco volta. Broker e LISTEN eta_sensor reconectam com
+backoff (até RECONNECT_MAX_S); task de fundo que termina com erro é logada.
+
+Uso: python ingest_async.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import aiomqtt
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from ingest_batch import binary_message, failed_message
+from ingest_codecs import json_dumps
+from ingest_compress import Compressor
+from ingest_dedup import DedupFilter
+from ingest_parse import parse_message
+from ingest_spool import Spool
+from ingest_validate import Validator
+from sensor_registry import SENSOR_SQL
+
+PGHOST = os.getenv("PGHOST", "postgres")
+PGPORT = int(os.getenv("PGPORT", "5432"))
+PGUSER = os.getenv("PGUSER", "postgres")
+PGPASSWORD = os.getenv("PGPASSWORD", "postgres")
+PGDATABASE = os.getenv("PGDATABASE", "eta")
+
+MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "eta/leituras/#")
+
+DEFAULT_SITE = os.getenv("DEFAULT_SITE", "ETA Central")
+DEFAULT_UNIT = os.getenv("DEFAULT_UNIT", "Filtração")
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+INGEST_WRITERS = int(os.getenv("INGEST_WRITERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_STATS_S = int(os.getenv("INGEST_STATS_S", "30"))
+
+# mesmos estágios e spool de main.py (vazio / 0 desligam)
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "ingest_spool")
+INGEST_SPOOL_SEGMENT_MB = int(os.getenv("INGEST_SPOOL_SEGMENT_MB", "16"))
+INGEST_SPOOL_MAX_MB = int(os.getenv("INGEST_SPOOL_MAX_MB", "1024"))
+INGEST_SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "0") == "1"
+INGEST_SPOOL_REPLAY_S = int(os.getenv("INGEST_SPOOL_REPLAY_S", "5"))
+INGEST_SPOOL_BATCH = int(os.getenv("INGEST_SPOOL_BATCH", "5000"))
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "15000"))
+INGEST_COMPRESSION = os.getenv("INGEST_COMPRESSION", "1") == "1"
+INGEST_DEDUP_WINDOW = int(os.getenv("INGEST_DEDUP_WINDOW", "64"))
+INGEST_VALIDATE = os.getenv("INGEST_VALIDATE", "1") == "1"
+
+# banco fora do ar, conexão caída, statement_timeout, pool sem conexão livre
+TRANSIENT_ERRORS = (psycopg.OperationalError, psycopg.InterfaceError, ConnectionError)
+# espera máxima entre tentativas de reconexão (LISTEN e broker MQTT)
+RECONNECT_MAX_S = 30
+
+
+def conninfo():
+    return (f"host={PGHOST} port={PGPORT} user={PGUSER} password={PGPASSWORD} dbname={PGDATABASE} "
+            f"connect_timeout=10 options='-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}'")
+
+
+async def ensure_defaults(conn):
+    """Mesmo cadastro padrão site/unidade/dispositivo de main.ensure_defaults."""
+    cur = await conn.execute("SELECT id FROM eta.site WHERE name=%s", (DEFAULT_SITE,))
+    row = await cur.fetchone()
+    if not row:
+        cur = await conn.execute("INSERT INTO eta.site (name) VALUES (%s) RETURNING id", (DEFAULT_SITE,))
+        row = await cur.fetchone()
+    site_id = row[0]
+
+    cur = await conn.execute("SELECT id FROM eta.unit WHERE site_id=%s AND name=%s", (site_id, DEFAULT_UNIT))
+    row = await cur.fetchone()
+    if not row:
+        cur = await conn.execute("""INSERT INTO eta.unit (site_id, name, process)
+                                    VALUES (%s, %s, %s) RETURNING id""", (site_id, DEFAULT_UNIT, "filtracao"))
+        row = await cur.fetchone()
+    unit_id = row[0]
+
+    cur = await conn.execute("SELECT id FROM eta.device WHERE unit_id=%s AND serial=%s", (unit_id, "GW-AUTO"))
+    row = await cur.fetchone()
+    if not row:
+        cur = await conn.execute("""INSERT INTO eta.device (unit_id, vendor, model, serial, protocol)
+                                    VALUES (%s, %s, %s, %s, %s) RETURNING id""",
+                                 (unit_id, "Auto", "Virtual", "GW-AUTO", "mqtt"))
+        row = await cur.fetchone()
+    await conn.commit()
+    return row[0]
+
+
+class AsyncSensorRegistry:
+    """
+    Versão assíncrona de sensor_registry.SensorRegistry: cache tag -> id
+    (com a configuração de compressão e de validação de cada tag) carregado
+    no início, cadastro em lote de tags novas e LISTEN eta_sensor numa
+    conexão dedicada para acompanhar outros processos.
+    """
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self._ids = {}
+        self._compression = {}
+        self._validity = {}
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def compression(self, tag):
+        return self._compression.get(tag)
+
+    def validity(self, tag):
+        return self._validity.get(tag)
+
+    def _store(self, rows, replace=False):
+        ids = {row[0]: row[1] for row in rows}
+        compression = {row[0]: row[2] for row in rows if row[2] is not None}
+        validity = {row[0]: row[3:] for row in rows if any(v is not None for v in row[3:])}
+        if replace:
+            self._ids, self._compression, self._validity = ids, compression, validity
+        else:
+            self._ids.update(ids)
+            self._compression.update(compression)
+            self._validity.update(validity)
+
+    async def load(self, conn):
+        cur = await conn.execute(SENSOR_SQL)
+        self._store(await cur.fetchall(), replace=True)
+        return self
+
+    async def listen(self, pool):
+        """
+        Task de longa duração: recarrega o cache a cada NOTIFY eta_sensor,
+        numa conexão própria. O gerador notifies() segura o lock dela
+        enquanto está aberto: as consultas vão numa conexão do pool. Caindo
+        a conexão, reconecta com backoff e recarrega tudo (os NOTIFY do
+        intervalo se perderam).
+        """
+        delay = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo(), autocommit=True) as conn:
+                    await conn.execute("LISTEN eta_sensor")
+                    async with pool.connection() as c:
+                        await self.load(c)
+                    delay = 1
+                    async for n in conn.notifies():
+                        async with pool.connection() as c:
+                            if n.payload == "INSERT":
+                                cur = await c.execute(SENSOR_SQL + " WHERE id > %s",
+                                                      (max(self._ids.values(), default=0),))
+                                self._store(await cur.fetchall())
+                            else:
+                                await self.load(c)
+            except TRANSIENT_ERRORS as e:
+                print(f"[worker-async] LISTEN eta_sensor caiu ({' '.join(str(e).split())}); "
+                      f"nova tentativa em {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_S)
+
+    async def resolve(self, conn, units_by_tag):
+        """
+        Retorna ({tag: id}, {tag: id recém-cadastrado}); os novos só vão para
+        o cache depois do commit do lote (ver `publish`).
+        """
+        ids = {tag: self._ids[tag] for tag in units_by_tag if tag in self._ids}
+        missing = [tag for tag in units_by_tag if tag not in ids]
+        if not missing:
+            return ids, {}
+        # serializa cadastros concorrentes entre os writers deste processo
+        async with self._lock:
+            cur = await conn.execute(
+                """INSERT INTO eta.sensor (device_id, tag, unit)
+                   SELECT %s, t.tag, t.unit FROM unnest(%s::text[], %s::text[]) AS t(tag, unit)
+                   ON CONFLICT (tag) DO NOTHING
+                   RETURNING tag, id""",
+                (self.device_id, missing, [units_by_tag[t] for t in missing]),
+            )
+            created = dict(await cur.fetchall())
+            raced = [t for t in missing if t not in created]
+            if raced:
+                cur = await conn.execute("SELECT tag, id FROM eta.sensor WHERE tag = ANY(%s)", (raced,))
+                rows = await cur.fetchall()
+                self._ids.update(rows)
+                ids.update(rows)
+        ids.update(created)
+        return ids, created
+
+    def publish(self, created):
+        self._ids.update(created)
+
+
+async def write_batch(pool, registry, batch):
+    """Equivalente assíncrono de ingest_batch.write_batch (COPY no raw, unnest nas medições e em sensor_latest)."""
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor().copy(
+                    "COPY eta.raw_ingest (src_topic, codec, payload, payload_bin, status, err_msg) "
+                    "FROM STDIN") as copy:
+                copy.set_types(["text", "text", "text", "bytea", "text", "text"])
+                for m in batch:
+                    if m.get("no_raw"):
+                        continue
+                    await copy.write_row((m["topic"], m["codec"], m["payload_json"], m["payload_bin"],
+                                          m["status"], m["err"]))
+
+            units_by_tag = {}
+            for m in batch:
+                for r in m["readings"]:
+                    units_by_tag.setdefault(r["tag"], r["unit"])
+
+            created = {}
+            if units_by_tag:
+                sensor_ids, created = await registry.resolve(conn, units_by_tag)
+                readings = [r for m in batch for r in m["readings"]]
+                await conn.execute(
+                    """INSERT INTO eta.measurement (sensor_id, ts, value, quality, meta)
+                       SELECT * FROM unnest(%s::int[], %s::timestamptz[], %s::float8[], %s::bool[], %s::jsonb[])
+                       ON CONFLICT (sensor_id, ts) DO NOTHING""",
+                    ([sensor_ids[r["tag"]] for r in readings], [r["ts"] for r in readings],
+                     [r["value"] for r in readings], [r.get("quality", True) for r in readings],
+                     [json_dumps(r["meta"] or {}) for r in readings]),
+                )
+                # eta.sensor_latest: a leitura mais nova de cada sensor, só para frente
+                latest = {}
+                for r in readings:
+                    sid = sensor_ids[r["tag"]]
+                    if sid not in latest or r["ts"] > latest[sid]["ts"]:
+                        latest[sid] = r
+                sids = sorted(latest)
+                await conn.execute(
+                    """INSERT INTO eta.sensor_latest AS l (sensor_id, ts, value, quality, meta)
+                       SELECT * FROM unnest(%s::int[], %s::timestamptz[], %s::float8[], %s::bool[], %s::jsonb[])
+                       ON CONFLICT (sensor_id) DO UPDATE
+                          SET ts = EXCLUDED.ts, value = EXCLUDED.value, quality = EXCLUDED.quality, meta = EXCLUDED.meta
+                        WHERE EXCLUDED.ts > l.ts""",
+                    (sids, [latest[k]["ts"] for k in sids], [latest[k]["value"] for k in sids],
+                     [latest[k].get("quality", True) for k in sids], [json_dumps(latest[k]["meta"] or {}) for k in sids]),
+                )
+
+    registry.publish(created)
+
+
+class Stats:
+    def __init__(self):
+        self.received = 0
+        self.written = 0
+        self.batches_failed = 0
+        self.spooled = 0
+        self.rejected = 0
+        self.dropped = 0
+
+
+async def writer(q, pool, registry, stats, spool=None):
+    """Drena a fila em lotes de até INGEST_BATCH_SIZE leituras ou INGEST_FLUSH_MS ms."""
+    max_delay = INGEST_FLUSH_MS / 1000.0
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await q.get()]
+        rows = max(1, len(batch[0]["readings"]))
+        deadline = loop.time() + max_delay
+        while rows < INGEST_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                msg = await asyncio.wait_for(q.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(msg)
+            rows += max(1, len(msg["readings"]))
+        try:
+            await write_batch(pool, registry, batch)
+            stats.written += len(batch)
+        except Exception as e:
+            stats.batches_failed += 1
+            if isinstance(e, TRANSIENT_ERRORS):
+                await keep(batch, e, stats, spool)
+            else:
+                # como ingest_batch.BatchWriter: uma a uma, só a recusada perde as leituras
+                print(f"[worker-async] Lote recusado pelo banco ({' '.join(str(e).split())}); "
+                      f"gravando as {len(batch)} mensagens uma a uma")
+                await write_each(pool, registry, batch, stats, spool)
+        finally:
+            for _ in batch:
+                q.task_done()
+
+
+async def keep(batch, err, stats, spool):
+    """Banco indisponível: o lote vai para o spool ou, sem spool, é descartado."""
+    if spool is not None:
+        await asyncio.to_thread(spool.append, batch)
+        stats.spooled += len(batch)
+        print(f"[worker-async] Falha ao gravar lote ({' '.join(str(err).split())}); "
+              f"{len(batch)} mensagens no spool")
+    else:
+        stats.dropped += len(batch)
+        print(f"[worker-async] Falha ao gravar lote ({' '.join(str(err).split())}); "
+              f"{len(batch)} mensagens descartadas")
+
+
+async def write_each(pool, registry, batch, stats, spool):
+    for i, msg in enumerate(batch):
+        try:
+            await write_one(pool, registry, msg, stats)
+        except TRANSIENT_ERRORS as e:
+            await keep(batch[i:], e, stats, spool)
+            return
+
+
+async def write_one(pool, registry, msg, stats):
+    """Grava uma mensagem; recusada, fica só o raw com o erro. TRANSIENT_ERRORS sobem."""
+    try:
+        await write_batch(pool, registry, [msg])
+        stats.written += 1
+        return
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as e:
+        stats.rejected += 1
+        print(f"[worker-async] Mensagem de {msg['topic']} recusada pelo banco: {' '.join(str(e).split())}")
+        failed = failed_message(msg, e)
+    for attempt in (failed, binary_message(failed)):
+        try:
+            await write_batch(pool, registry, [attempt])
+            return
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception:
+            pass
+    stats.dropped += 1
+    print(f"[worker-async] Mensagem de {msg['topic']} descartada: nem eta.raw_ingest a aceitou")
+
+
+async def replay_spool(spool, pool, registry, stats):
+    """
+    Task equivalente a ingest_spool.SpoolReplayer: tenta drenar o spool a
+    cada INGEST_SPOOL_REPLAY_S segundos. A leitura dos segmentos roda numa
+    thread e cada lote é gravado no loop; lote recusado por erro de dados
+    é descartado (contado em `rejected`) para não travar o spool.
+    """
+    loop = asyncio.get_running_loop()
+
+    def write(batch):
+        try:
+            asyncio.run_coroutine_threadsafe(write_batch(pool, registry, batch), loop).result()
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            stats.rejected += len(batch)
+            print(f"[worker-async] spool: lote com {len(batch)} mensagens recusado pelo banco, descartado: {e}")
+
+    while True:
+        await asyncio.sleep(INGEST_SPOOL_REPLAY_S)
+        if not spool.pending_bytes():
+            continue
+        t0 = time.monotonic()
+        try:
+            n = await asyncio.to_thread(spool.replay, write, INGEST_SPOOL_BATCH)
+        except Exception as e:
+            s = spool.stats()
+            print(f"[worker-async] spool: replay adiado ({' '.join(str(e).split())}); "
+                  f"pendentes={s['pending_bytes']} bytes em {s['segments']} segmentos")
+            continue
+        if n:
+            print(f"[worker-async] spool: {n} mensagens regravadas em {time.monotonic() - t0:.1f}s")
+
+
+async def report_stats(q, stats, stages, spool=None):
+    last, last_t = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(INGEST_STATS_S)
+        now = time.monotonic()
+        rate = (stats.written - last) / (now - last_t)
+        last, last_t = stats.written, now
+        print(f"[worker-async] fila={q.qsize()} recebidas={stats.received} gravadas={stats.written} "
+              f"({rate:.0f} msg/s) lotes_com_falha={stats.batches_failed} no_spool={stats.spooled} "
+              f"recusadas={stats.rejected} perdidas={stats.dropped}")
+        for name, stage in stages.items():
+            if stage is not None:
+                print(f"[worker-async] {name} " + " ".join(f"{k}={v}" for k, v in stage.stats().items()))
+        if spool is not None:
+            print("[worker-async] spool " + " ".join(f"{k}={v}" for k, v in spool.stats().items()))
+
+
+def log_failure(task):
+    """done callback das tasks de fundo: nenhuma deveria terminar antes do fim de main()."""
+    if not task.cancelled() and task.exception() is not None:
+        e = task.exception()
+        print(f"[worker-async] Task {task.get_name()} terminou com erro: {type(e).__name__}: {e}")
+
+
+async def consume(q, stats, stages, registry):
+    """Assina MQTT_TOPIC e enfileira as mensagens parseadas; reconecta ao broker com backoff."""
+    dedup, validator, compressor = stages["duplicadas"], stages["validação"], stages["compressão"]
+    delay = 1
+    while True:
+        try:
+            async with aiomqtt.Client(hostname=MQTT_HOST, port=MQTT_PORT, keepalive=60) as client:
+                async with client.messages() as messages:
+                    await client.subscribe(MQTT_TOPIC)
+                    delay = 1
+                    print(f"[worker-async] Subscribed to {MQTT_TOPIC} @ {MQTT_HOST}:{MQTT_PORT} "
+                          f"(batch={INGEST_BATCH_SIZE} rows / {INGEST_FLUSH_MS} ms, writers={INGEST_WRITERS}, "
+                          f"{len(registry)} sensores em cache)")
+                    async for message in messages:
+                        stats.received += 1
+                        parsed = parse_message(message.topic.value, message.payload)
+                        if dedup is not None:
+                            dedup.apply(parsed)
+                        if validator is not None:
+                            validator.apply([parsed])
+                        if compressor is not None:
+                            compressor.apply(parsed)
+                        # fila cheia: o await segura a leitura do socket (backpressure)
+                        await q.put(parsed)
+        except aiomqtt.MqttError as e:
+            print(f"[worker-async] Conexão com o broker perdida ({e}); nova tentativa em {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_S)
+
+
+async def main():
+    # writers + refresh do cache (o LISTEN tem conexão própria) + replay do spool
+    pool = AsyncConnectionPool(conninfo(), min_size=1, max_size=INGEST_WRITERS + 2, open=False)
+    await pool.open()
+    async with pool.connection() as conn:
+        device_id = await ensure_defaults(conn)
+        registry = await AsyncSensorRegistry(device_id).load(conn)
+
+    # mesma ordem de main.on_message, num único caminho ordenado
+    dedup = DedupFilter(INGEST_DEDUP_WINDOW) if INGEST_DEDUP_WINDOW > 0 else None
+    validator = Validator(registry) if INGEST_VALIDATE else None
+    compressor = Compressor(registry) if INGEST_COMPRESSION else None
+    spool = None
+    if INGEST_SPOOL_DIR:
+        spool = Spool(INGEST_SPOOL_DIR, segment_bytes=INGEST_SPOOL_SEGMENT_MB << 20,
+                      max_bytes=INGEST_SPOOL_MAX_MB << 20, fsync=INGEST_SPOOL_FSYNC)
+
+    q = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stats = Stats()
+    stages = {"duplicadas": dedup, "validação": validator, "compressão": compressor}
+    tasks = [asyncio.create_task(registry.listen(pool), name="listen"),
+             asyncio.create_task(report_stats(q, stats, stages, spool), name="stats")]
+    tasks += [asyncio.create_task(writer(q, pool, registry, stats, spool), name=f"writer-{i}")
+              for i in range(INGEST_WRITERS)]
+    if spool is not None:
+        tasks.append(asyncio.create_task(replay_spool(spool, pool, registry, stats), name="spool-replay"))
+    for t in tasks:
+        t.add_done_callback(log_failure)
+
+    try:
+        await consume(q, stats, stages, registry)
+    finally:
+        # pontos retidos pelo swinging door entram antes de drenar a fila
+        held = compressor.flush() if compressor is not None else None
+        if held is not None:
+            await q.put(held)
+        await q.join()
+        for t in tasks:
+            t.cancel()
+        await pool.close()
+        if spool is not None:
+            spool.close()
+
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        # psycopg e aiomqtt exigem o SelectorEventLoop no Windows
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,262 @@
+import csv
+import io
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from ingest_codecs import json_dumps
+
+# falhas em que o lote vale a pena guardar e tentar de novo mais tarde
+# (banco fora do ar, conexão caída, statement_timeout); erros de dados não
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionError)
+
+
+def copy_raw(cur, batch):
+    """
+    Grava as linhas de eta.raw_ingest do lote via COPY, já com o status final.
+    O payload vai como recebido: texto JSON em `payload`, bytes em `payload_bin`.
+    Mensagens "no_raw" (pontos retidos da compressão, ver Compressor.flush) não têm linha.
+    """
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for m in batch:
+        if m.get("no_raw"):
+            continue
+        payload_bin = "\\x" + m["payload_bin"].hex() if m["payload_bin"] is not None else None
+        w.writerow((m["topic"], m["codec"], m["payload_json"], payload_bin, m["status"], m["err"]))
+    buf.seek(0)
+    cur.copy_expert("COPY eta.raw_ingest (src_topic, codec, payload, payload_bin, status, err_msg) "
+                    "FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def insert_measurements(cur, rows):
+    execute_values(
+        cur,
+        """INSERT INTO eta.measurement (sensor_id, ts, value, quality, meta)
+           VALUES %s
+           ON CONFLICT (sensor_id, ts) DO NOTHING""",
+        rows,
+        template="(%s,%s,%s,%s,%s::jsonb)",
+        page_size=1000,
+    )
+
+
+def upsert_latest(cur, rows):
+    """
+    Atualiza eta.sensor_latest com a leitura mais nova de cada sensor do lote
+    (linhas de insert_measurements); só avança: leituras mais antigas que a
+    já gravada não mudam nada. Ordenado por sensor_id para que escritores
+    concorrentes travem as linhas na mesma ordem.
+    """
+    latest = {}
+    for row in rows:
+        cur_row = latest.get(row[0])
+        if cur_row is None or row[1] > cur_row[1]:
+            latest[row[0]] = row
+    execute_values(
+        cur,
+        """INSERT INTO eta.sensor_latest AS l (sensor_id, ts, value, quality, meta)
+           VALUES %s
+           ON CONFLICT (sensor_id) DO UPDATE
+              SET ts = EXCLUDED.ts, value = EXCLUDED.value, quality = EXCLUDED.quality, meta = EXCLUDED.meta
+            WHERE EXCLUDED.ts > l.ts""",
+        [latest[k] for k in sorted(latest)],
+        template="(%s,%s,%s,%s,%s::jsonb)",
+        page_size=1000,
+    )
+
+
+def failed_message(msg, err):
+    """
+    A mensagem como linha de eta.raw_ingest com status 'failed' e o erro,
+    sem leituras: o que fica de uma mensagem que o banco recusou.
+    """
+    return dict(msg, status="failed", err=" ".join(str(err).split()).replace("\x00", "")[:1000], readings=[])
+
+
+def binary_message(msg):
+    """Payload texto que nem o COPY aceita (NUL) vai como bytes em payload_bin."""
+    if msg["payload_json"] is None:
+        return msg
+    return dict(msg, payload_json=None, payload_bin=msg["payload_json"].encode("utf-8"))
+
+
+def write_batch(conn, registry, batch):
+    """
+    Grava um lote de mensagens já parseadas (ver ingest_parse.parse_message)
+    em eta.raw_ingest, eta.measurement e eta.sensor_latest numa única transação.
+    """
+    with conn.cursor() as cur:
+        copy_raw(cur, batch)
+
+        units_by_tag = {}
+        for m in batch:
+            for r in m["readings"]:
+                units_by_tag.setdefault(r["tag"], r["unit"])
+
+        if units_by_tag:
+            sensor_ids = registry.resolve(cur, units_by_tag)
+            rows, late = [], []
+            for m in batch:
+                for r in m["readings"]:
+                    row = (sensor_ids[r["tag"]], r["ts"], r["value"], r.get("quality", True),
+                           json_dumps(r["meta"] or {}))
+                    (late if r.get("late") else rows).append(row)
+            # atrasadas (ver ingest_dedup) vão num INSERT à parte, depois das novas
+            for part in (rows, late):
+                if part:
+                    insert_measurements(cur, part)
+            if rows or late:
+                upsert_latest(cur, rows + late)
+    conn.commit()
+    registry.commit()
+
+
+class BatchWriter:
+    """
+    Acumula mensagens e grava em lote a cada `max_rows` leituras ou
+    `max_ms` milissegundos (o que vier primeiro).
+
+    `add` pode ser chamado da thread de rede do MQTT; o flush por tempo
+    roda numa thread própria (`start`). Ambos compartilham a mesma conexão,
+    protegida por lock.
+
+    Com `spool` (ver ingest_spool), um lote que falha por indisponibilidade
+    do banco (TRANSIENT_ERRORS) vai para o disco em vez de ser perdido; sem
+    spool, é descartado e contado. Um lote recusado por erro de dados é
+    regravado mensagem a mensagem: só as que o banco recusar de novo perdem
+    as leituras, e ficam em eta.raw_ingest com status 'failed' e o erro.
+    Nenhuma exceção sobe de `add` (que roda no callback do MQTT). Com
+    `connect`, a conexão caída é reaberta no máximo a cada RECONNECT_S segundos.
+    """
+
+    RECONNECT_S = 5.0
+
+    def __init__(self, conn, registry, max_rows=500, max_ms=250, spool=None, connect=None):
+        self.conn = conn
+        self.registry = registry
+        self.spool = spool
+        self.connect = connect
+        self._next_reconnect = 0.0
+        self.batches_failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.max_rows = max(1, int(max_rows))
+        self.max_delay = max(1, int(max_ms)) / 1000.0
+        self._buf = []
+        self._rows = 0
+        self._first_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, msg):
+        with self._lock:
+            if not self._buf:
+                self._first_at = time.monotonic()
+            self._buf.append(msg)
+            self._rows += max(1, len(msg["readings"]))
+            if self._rows >= self.max_rows:
+                self._flush_locked()
+
+    def flush_if_due(self):
+        with self._lock:
+            if self._buf and time.monotonic() - self._first_at >= self.max_delay:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        batch, self._buf, self._rows = self._buf, [], 0
+        if not batch:
+            return
+        try:
+            self._ensure_conn()
+            write_batch(self.conn, self.registry, batch)
+        except Exception as e:
+            self._rollback()
+            self.batches_failed += 1
+            if isinstance(e, TRANSIENT_ERRORS):
+                self._keep(batch, e)
+            else:
+                print(f"[worker] Lote recusado pelo banco ({' '.join(str(e).split())}); "
+                      f"gravando as {len(batch)} mensagens uma a uma")
+                self._write_each(batch)
+
+    def _rollback(self):
+        self.registry.rollback()
+        if not self.conn.closed:
+            self.conn.rollback()
+
+    def _keep(self, batch, err):
+        """Banco indisponível: o lote vai para o spool ou, sem spool, é descartado."""
+        if self.spool is not None:
+            self.spool.append(batch)
+            print(f"[worker] Falha ao gravar lote ({' '.join(str(err).split())}); {len(batch)} mensagens no spool")
+        else:
+            self.dropped += len(batch)
+            print(f"[worker] Falha ao gravar lote ({' '.join(str(err).split())}); {len(batch)} mensagens descartadas")
+
+    def _write_each(self, batch):
+        for i, msg in enumerate(batch):
+            try:
+                self._write_one(msg)
+            except TRANSIENT_ERRORS as e:
+                self._rollback()
+                self._keep(batch[i:], e)
+                return
+
+    def _write_one(self, msg):
+        """Grava uma mensagem; recusada, fica só o raw com o erro. TRANSIENT_ERRORS sobem."""
+        try:
+            write_batch(self.conn, self.registry, [msg])
+            return
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            self._rollback()
+            self.rejected += 1
+            print(f"[worker] Mensagem de {msg['topic']} recusada pelo banco: {' '.join(str(e).split())}")
+            failed = failed_message(msg, e)
+        for attempt in (failed, binary_message(failed)):
+            try:
+                write_batch(self.conn, self.registry, [attempt])
+                return
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception:
+                self._rollback()
+        self.dropped += 1
+        print(f"[worker] Mensagem de {msg['topic']} descartada: nem eta.raw_ingest a aceitou")
+
+    def _ensure_conn(self):
+        if not self.conn.closed or self.connect is None:
+            return
+        now = time.monotonic()
+        if now < self._next_reconnect:
+            raise ConnectionError("conexão com o banco indisponível")
+        self._next_reconnect = now + self.RECONNECT_S
+        self.conn = self.connect()
+
+    def _run(self):
+        tick = min(self.max_delay, 0.05)
+        while not self._stop.wait(tick):
+            try:
+                self.flush_if_due()
+            except Exception as e:
+                print("[worker] Falha no flush do lote:", e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="batch-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
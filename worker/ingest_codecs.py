@@ -0,0 +1,100 @@
+"""
+Codecs de payload da ingestão MQTT.
+
+O codec é escolhido pelo sufixo do tópico (último nível `json`, `msgpack`
+ou `cbor`, ex.: eta/leituras/scan/msgpack) ou, sem sufixo, pelo conteúdo:
+CBOR auto-descrito (tag 55799, bytes d9 d9 f7), JSON ({, [ ou espaço) e
+MessagePack nos demais casos.
+
+Backends opcionais: orjson (JSON rápido, com fallback para o json da
+stdlib), msgpack e cbor2. Um codec sem backend instalado falha só as
+mensagens que o usam.
+"""
+
+import json
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+CBOR_MAGIC = b"\xd9\xd9\xf7"
+TOPIC_SUFFIXES = ("json", "msgpack", "cbor")
+
+
+def _reject_constant(name):
+    # NaN/Infinity são aceitos pelo json da stdlib, mas não pelo jsonb
+    raise ValueError(f"constante JSON inválida: {name}")
+
+
+def json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data, parse_constant=_reject_constant)
+
+
+def json_dumps(obj):
+    """Serialização usada nas colunas jsonb (meta) pelos writers."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, default=str)
+
+
+def _msgpack_loads(data):
+    if msgpack is None:
+        raise RuntimeError("codec msgpack indisponível (pip install msgpack)")
+    # timestamp=3: extensão Timestamp do MessagePack vira datetime (UTC)
+    return msgpack.unpackb(data, raw=False, timestamp=3)
+
+
+def _cbor_loads(data):
+    if cbor2 is None:
+        raise RuntimeError("codec cbor indisponível (pip install cbor2)")
+    obj = cbor2.loads(data)
+    if isinstance(obj, cbor2.CBORTag) and obj.tag == 55799:
+        obj = obj.value  # marcador "self-described CBOR"
+    return _thaw(obj)
+
+
+def _thaw(obj):
+    # o cbor2 devolve frozendict/tuplas para itens sob tags; o parser espera dict/list
+    if isinstance(obj, Mapping):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_thaw(v) for v in obj]
+    return obj
+
+
+DECODERS = {"json": json_loads, "msgpack": _msgpack_loads, "cbor": _cbor_loads}
+
+
+def pick_codec(topic, data):
+    """
+    Retorna (codec, tópico sem o sufixo de codec).
+    """
+    head, _, last = topic.rpartition("/")
+    if head and last in TOPIC_SUFFIXES:
+        return last, head
+    if data[:3] == CBOR_MAGIC:
+        return "cbor", topic
+    if data[:1] in (b"{", b"[", b" ", b"\n", b"\r", b"\t"):
+        return "json", topic
+    return "msgpack", topic
+
+
+def decode(codec, data):
+    if codec == "json" and b"\\u0000" in data:
+        # o jsonb não aceita \u0000; melhor falhar aqui do que derrubar o lote
+        raise ValueError("payload contém \\u0000")
+    return DECODERS[codec](data)
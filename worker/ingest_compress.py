@@ -0,0 +1,194 @@
+"""
+Compressão por exceção na ingestão (deadband e swinging door).
+
+Configuração por sensor em eta.sensor.meta, chave "compression":
+
+    {"compression": {"method": "deadband" | "swinging_door",
+                     "abs": 0.02,       # desvio absoluto, na unidade do sensor
+                     "pct": 0.5,        # ou % do último valor gravado (vale o maior)
+                     "gap_s": 300,      # leitura após um buraco maior que isso é sempre gravada
+                     "max_s": 900}}     # grava ao menos uma leitura a cada max_s
+
+Sensores sem "compression" passam direto. O estado (último ponto gravado,
+ponto retido, portas do swinging door) fica em memória por processo; com o
+supervisor em modo hash cada sensor vive num único consumidor, em modo
+shared a compressão fica menos eficiente (cada consumidor vê parte da série).
+
+Deadband: grava quando |v - último gravado| > desvio.
+Swinging door: retém a última leitura e só a grava quando a reta até a
+próxima deixaria alguma leitura descartada a mais de ±desvio; assim a
+interpolação linear entre pontos gravados fica a no máximo `desvio` de cada
+leitura descartada. Por isso o ponto mais recente de uma série estável pode
+chegar ao banco com atraso de até max_s; no desligamento, `Compressor.flush`
+devolve os pontos retidos para serem gravados.
+
+Leituras fora de ordem (ts <= último ts visto da tag) e as marcadas pela
+validação (quality=false) são gravadas sem passar pelo filtro. main.py e ingest_async.py aplicam a compressão
+conforme INGEST_COMPRESSION.
+"""
+
+import threading
+
+METHODS = ("deadband", "swinging_door")
+
+
+def parse_config(cfg):
+    """Normaliza meta.compression; retorna None se ausente ou inválida."""
+    if not isinstance(cfg, dict) or cfg.get("method") not in METHODS:
+        return None
+    try:
+        return {
+            "method": cfg["method"],
+            "abs": float(cfg.get("abs") or 0.0),
+            "pct": float(cfg.get("pct") or 0.0),
+            "gap_s": float(cfg.get("gap_s") or 0.0),
+            "max_s": float(cfg.get("max_s") or 0.0),
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+class _Stream:
+    """Estado de compressão de uma tag."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.raw = None        # meta.compression de onde cfg veio (detecta recarga do cache)
+        self.archived = None   # último ponto gravado (t, v)
+        self.held = None       # swinging door: última leitura recebida e ainda não gravada
+        self.last_t = None
+        self.slope_up = self.slope_low = None
+        self.dev = 0.0
+
+    def _deviation(self, v):
+        return max(self.cfg["abs"], abs(v) * self.cfg["pct"] / 100.0)
+
+    def _archive(self, r, t, out):
+        out.append(r)
+        self.archived = (t, r["value"])
+        self.held = None
+        self.slope_up = self.slope_low = None
+        self.dev = self._deviation(r["value"])
+
+    def offer(self, r, out):
+        """Processa uma leitura; acrescenta a `out` o que deve ser gravado."""
+        t, v = r["ts"].timestamp(), r["value"]
+        cfg = self.cfg
+        if self.last_t is not None and t <= self.last_t:
+            out.append(r)  # fora de ordem/duplicada: não mexe no estado
+            return
+        if r.get("quality") is False:
+            out.append(r)  # marcada pela validação (ingest_validate): a flag precisa chegar ao banco
+            return
+        gap = self.last_t is not None and cfg["gap_s"] and t - self.last_t > cfg["gap_s"]
+        self.last_t = t
+
+        if self.archived is None or gap:
+            # primeiro ponto, ou primeiro depois de um buraco: fecha o trecho anterior
+            if self.held is not None:
+                out.append(self.held[2])
+            self._archive(r, t, out)
+            return
+
+        t_a, v_a = self.archived
+        if cfg["max_s"] and t - t_a >= cfg["max_s"]:
+            if self.held is not None:
+                out.append(self.held[2])
+            self._archive(r, t, out)
+            return
+
+        if cfg["method"] == "deadband":
+            if abs(v - v_a) > self.dev:
+                self._archive(r, t, out)
+            return
+
+        # swinging door: a reta do último gravado até a leitura nova precisa
+        # passar a ±desvio de todas as leituras retidas desde então (corredor
+        # de inclinações); se não passa, grava a última retida e recomeça dela
+        dt = t - t_a
+        slope = (v - v_a) / dt
+        if self.held is not None and not (self.slope_low <= slope <= self.slope_up):
+            t_h, _, held = self.held
+            self._archive(held, t_h, out)
+            t_a, v_a = self.archived
+            dt = t - t_a
+        up = (v + self.dev - v_a) / dt
+        low = (v - self.dev - v_a) / dt
+        self.slope_up = up if self.slope_up is None else min(self.slope_up, up)
+        self.slope_low = low if self.slope_low is None else max(self.slope_low, low)
+        self.held = (t, v, r)
+
+
+class Compressor:
+    """
+    Estágio entre o parse e a gravação: filtra `msg["readings"]` de cada
+    mensagem conforme a configuração de compressão do sensor (lida do cache
+    do SensorRegistry, que acompanha alterações em eta.sensor.meta).
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.readings_in = 0
+        self.readings_out = 0
+
+    def _stream(self, tag, out):
+        raw = self.registry.compression(tag)
+        st = self._streams.get(tag)
+        if st is not None and st.raw is raw:
+            return st
+        cfg = parse_config(raw)
+        if st is not None:
+            if cfg == st.cfg:
+                st.raw = raw  # cache recarregado, mesma configuração
+                return st
+            # configuração alterada/removida: fecha a série com o ponto retido
+            if st.held is not None:
+                out.append(st.held[2])
+            del self._streams[tag]
+        if cfg is None:
+            return None
+        st = self._streams[tag] = _Stream(cfg)
+        st.raw = raw
+        return st
+
+    def apply(self, msg):
+        readings = msg["readings"]
+        if not readings:
+            return msg
+        out = []
+        with self._lock:
+            for r in readings:
+                st = self._stream(r["tag"], out)
+                if st is None:
+                    out.append(r)
+                else:
+                    st.offer(r, out)
+            self.readings_in += len(readings)
+            self.readings_out += len(out)
+        msg["readings"] = out
+        return msg
+
+    def flush(self):
+        """
+        Grava (devolve) o ponto retido de cada tag, para o desligamento. Vem
+        numa mensagem sem linha de eta.raw_ingest ("no_raw"): o raw de cada
+        leitura já foi gravado com a mensagem de origem. None se não há nada.
+        """
+        out = []
+        with self._lock:
+            for st in self._streams.values():
+                if st.held is not None:
+                    t_h, _, held = st.held
+                    st._archive(held, t_h, out)
+            self.readings_out += len(out)
+        if not out:
+            return None
+        return {"topic": None, "codec": None, "payload_json": None, "payload_bin": None,
+                "status": "parsed", "err": None, "readings": out, "no_raw": True}
+
+    def stats(self):
+        ratio = self.readings_in / self.readings_out if self.readings_out else 0.0
+        return {"in": self.readings_in, "out": self.readings_out, "ratio": round(ratio, 2),
+                "streams": len(self._streams)}
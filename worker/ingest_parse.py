@@ -0,0 +1,205 @@
+import json
+import math
+from datetime import datetime, timezone
+from dateutil import parser as dtparser
+import numpy as np
+
+from ingest_codecs import decode, json_dumps, pick_codec
+
+TOPIC_PREFIX = "eta/leituras/"
+
+
+def _utc(dt):
+    # sem fuso é UTC: naive e aware misturados quebram as comparações (ordenação, latest)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def parse_ts(ts, default=None):
+    """Aceita ISO-8601, epoch em milissegundos ou datetime (msgpack/cbor); sempre devolve com fuso."""
+    if isinstance(ts, datetime):
+        return _utc(ts)
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        try:
+            return datetime.fromtimestamp(ts / 1000.0, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            pass
+    elif ts:
+        try:
+            # fromisoformat (3.11+) é bem mais rápido; dateutil cobre o resto
+            return _utc(datetime.fromisoformat(ts))
+        except (TypeError, ValueError):
+            pass
+        try:
+            return _utc(dtparser.isoparse(ts))
+        except Exception:
+            pass
+    return _utc(default) if default else datetime.now(timezone.utc)
+
+
+def _value(value):
+    """float finito ou None: NaN/inf entrariam para sempre nas somas dos rollups."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _text(value):
+    return value if isinstance(value, str) and value else None
+
+
+def _meta(meta):
+    # meta vai para jsonb e recebe meta.flags na validação: só objeto
+    if meta is None or isinstance(meta, dict):
+        return meta
+    return {"raw": meta}
+
+
+def _single(topic, payload, now):
+    # { "tag": "...", "value": 7.1, "unit": "...", "ts": "2025-09-18T21:27:00Z", "meta": {...} }
+    value = payload.get("value")
+    if value is None:
+        return [], "missing value"
+    value = _value(value)
+    if value is None:
+        return [], "invalid value"
+    tag = payload.get("tag") or topic.replace(TOPIC_PREFIX, "")
+    if not isinstance(tag, str):
+        return [], "invalid tag"
+    return [{
+        "tag": tag,
+        "value": value,
+        "unit": _text(payload.get("unit")),
+        "ts": parse_ts(payload.get("ts"), now),
+        "meta": _meta(payload.get("meta")),
+    }], None
+
+
+def _array(items, now):
+    # [ {tag, value, unit, ts, meta}, ... ] -- um item por tag do ciclo de varredura
+    readings, skipped = [], 0
+    ts_cache = {}
+    for item in items:
+        if not isinstance(item, dict) or not _text(item.get("tag")):
+            skipped += 1
+            continue
+        value = _value(item.get("value"))
+        if value is None:
+            skipped += 1
+            continue
+        raw_ts = item.get("ts")
+        try:
+            ts = ts_cache.get(raw_ts)
+        except TypeError:
+            ts = None  # chave não hashable
+        if ts is None:
+            ts = parse_ts(raw_ts, now)
+            if isinstance(raw_ts, (str, int, float)):
+                ts_cache[raw_ts] = ts
+        readings.append({"tag": item["tag"], "value": value, "unit": _text(item.get("unit")),
+                         "ts": ts, "meta": _meta(item.get("meta"))})
+    return readings, skipped
+
+
+def _columnar(payload, now):
+    # { "ts": "...", "tags": [...], "values": [...], "units": [...]?, "meta": {...}? }
+    tags = payload.get("tags") or []
+    values = payload.get("values") or []
+    if not isinstance(tags, list) or not isinstance(values, list):
+        return [], 0, "tags/values devem ser listas"
+    if len(tags) != len(values):
+        return [], len(values), "tags/values com tamanhos diferentes"
+    try:
+        # None -> NaN; conversão de todo o vetor de uma vez
+        arr = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return [], len(values), "invalid value"
+    if arr.ndim != 1:
+        return [], len(values), "invalid value"
+    ok = np.isfinite(arr) & np.array([isinstance(t, str) and t != "" for t in tags], dtype=bool)
+    # "units" em lista (uma por tag) ou uma unidade só para todas
+    units = payload.get("units")
+    if isinstance(units, list):
+        units = [_text(u) for u in units[:len(tags)]] + [None] * (len(tags) - len(units))
+    else:
+        units = [_text(units)] * len(tags)
+    ts = parse_ts(payload.get("ts"), now)
+    meta = _meta(payload.get("meta"))
+    readings = [{"tag": tags[i], "value": v, "unit": units[i], "ts": ts, "meta": meta}
+                for i, v in zip(np.flatnonzero(ok).tolist(), arr[ok].tolist())]
+    return readings, int(len(arr) - ok.sum()), None
+
+
+def parse_message(topic, data):
+    """
+    Converte uma mensagem MQTT no formato usado pelos writers de ingestão.
+
+    Aceita uma leitura por mensagem ({tag, value, unit, ts, meta}), uma lista
+    dessas leituras ou o formato colunar {ts, tags, values[, units, meta]},
+    codificados em JSON, MessagePack ou CBOR (ver ingest_codecs).
+    Retorna um dict com `topic`, `codec`, o payload original para
+    eta.raw_ingest (`payload_json` com o texto JSON recebido, sem
+    re-serializar, ou `payload_bin` com os bytes msgpack/cbor), `status`,
+    `err` e `readings` (lista de leituras prontas para eta.measurement).
+    Não acessa o banco: pode rodar em qualquer thread.
+    """
+    codec, base_topic = pick_codec(topic, data)
+    msg = {"topic": topic, "codec": codec, "payload_json": None, "payload_bin": None,
+           "status": "failed", "err": None, "readings": []}
+    try:
+        payload = decode(codec, data)
+    except Exception as e:
+        if codec == "json":
+            msg["payload_json"] = json_dumps({"_raw": data.decode("utf-8", "ignore").replace("\x00", "")})
+        else:
+            msg["payload_bin"] = bytes(data)
+        msg["err"] = str(e) or type(e).__name__
+        return msg
+    if codec == "json":
+        msg["payload_json"] = data.decode("utf-8")
+    else:
+        msg["payload_bin"] = bytes(data)
+
+    now = datetime.now(timezone.utc)
+    err = None
+    # payload malformado vira status='failed' no raw_ingest: uma exceção
+    # aqui derrubaria o loop MQTT (e a redelivery QoS1 repetiria a queda)
+    try:
+        if isinstance(payload, list):
+            readings, skipped = _array(payload, now)
+        elif isinstance(payload, dict) and "tags" in payload:
+            readings, skipped, err = _columnar(payload, now)
+        elif isinstance(payload, dict):
+            readings, err = _single(base_topic, payload, now)
+            skipped = 0
+        else:
+            readings, skipped, err = [], 0, "unsupported payload"
+    except Exception as e:
+        readings, skipped, err = [], 0, f"payload inválido: {str(e) or type(e).__name__}"
+
+    if not readings:
+        msg["err"] = err or "missing value"
+        return msg
+    if skipped:
+        err = f"{skipped} leitura(s) sem valor válido descartada(s)"
+    # status final já na gravação: o raw_ingest é escrito uma única vez, na
+    # mesma transação das medições (sem o UPDATE received -> parsed)
+    msg.update(status="parsed", err=err, readings=readings)
+    return msg
+
+
+def dump_message(msg):
+    """Serializa uma mensagem parseada numa linha JSON (spill/spool em disco)."""
+    readings = [dict(r, ts=r["ts"].isoformat()) for r in msg["readings"]]
+    payload_bin = msg["payload_bin"].hex() if msg["payload_bin"] is not None else None
+    return json.dumps(dict(msg, readings=readings, payload_bin=payload_bin), ensure_ascii=False, default=str)
+
+
+def load_message(line):
+    msg = json.loads(line)
+    for r in msg["readings"]:
+        r["ts"] = parse_ts(r["ts"])
+    if msg["payload_bin"] is not None:
+        msg["payload_bin"] = bytes.fromhex(msg["payload_bin"])
+    return msg
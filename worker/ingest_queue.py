@@ -0,0 +1,204 @@
+import os
+import queue
+import threading
+import time
+
+from ingest_batch import BatchWriter
+from ingest_parse import dump_message, load_message
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class IngestQueue:
+    """
+    Fila limitada entre o callback MQTT e as threads de gravação.
+
+    Política quando a fila está cheia:
+      - block:       o callback espera (backpressure chega ao broker via TCP);
+      - drop_oldest: descarta a mensagem mais antiga da fila;
+      - spill:       grava a mensagem em `spill_path` (JSON lines), que é
+                     reinjetado quando a fila esvazia.
+    """
+
+    def __init__(self, maxsize=10000, policy="block", spill_path=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"política de backpressure inválida: {policy}")
+        if policy == "spill" and not spill_path:
+            raise ValueError("política 'spill' requer spill_path")
+        self.policy = policy
+        self.spill_path = spill_path
+        self._q = queue.Queue(maxsize=maxsize)
+        self._spill_lock = threading.Lock()
+        self._spill_pending = 0
+        self._spill_offset = 0
+        if policy == "spill" and os.path.exists(spill_path):
+            # spill deixado por uma execução anterior
+            with open(spill_path, encoding="utf-8") as f:
+                self._spill_pending = sum(1 for _ in f)
+        self.enqueued = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    def put(self, msg):
+        self.enqueued += 1
+        if self.policy == "block":
+            self._q.put(msg)
+        elif self.policy == "drop_oldest":
+            while True:
+                try:
+                    self._q.put_nowait(msg)
+                    return
+                except queue.Full:
+                    try:
+                        self._q.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        else:
+            with self._spill_lock:
+                # não fura a ordem: enquanto houver spill pendente, continua no arquivo
+                if not self._spill_pending:
+                    try:
+                        self._q.put_nowait(msg)
+                        return
+                    except queue.Full:
+                        pass
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.write(dump_message(msg) + "\n")
+                self._spill_pending += 1
+                self.spilled += 1
+
+    def get(self, timeout):
+        try:
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            self._unspill()
+            return None
+
+    def _unspill(self):
+        """Reinjeta o arquivo de spill, do ponto onde parou, até a fila encher."""
+        if not self._spill_pending or not self._spill_lock.acquire(blocking=False):
+            return
+        try:
+            done = False
+            with open(self.spill_path, encoding="utf-8") as f:
+                f.seek(self._spill_offset)
+                while True:
+                    pos = f.tell()
+                    line = f.readline()
+                    if not line:
+                        done = True
+                        break
+                    try:
+                        self._q.put_nowait(load_message(line))
+                    except queue.Full:
+                        self._spill_offset = pos
+                        break
+                    self._spill_pending -= 1
+            if done:
+                os.remove(self.spill_path)
+                self._spill_offset = 0
+                self._spill_pending = 0
+        finally:
+            self._spill_lock.release()
+
+    def stats(self):
+        return {
+            "depth": self._q.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "spill_pending": self._spill_pending,
+        }
+
+
+class WriterPool:
+    """
+    N threads que drenam a IngestQueue, cada uma com sua própria conexão
+    Postgres e seu BatchWriter (flush por tamanho ou tempo).
+    """
+
+    def __init__(self, q, connect, registry, size=2, max_rows=500, max_ms=250, spool=None):
+        self.q = q
+        self.spool = spool
+        self.connect = connect
+        self.registry = registry
+        self.size = max(1, int(size))
+        self.max_rows = max_rows
+        self.max_ms = max_ms
+        self._errors = 0
+        self._writers = []
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def batches_failed(self):
+        return self._errors + sum(w.batches_failed for w in self._writers)
+
+    @property
+    def rejected(self):
+        return sum(w.rejected for w in self._writers)
+
+    @property
+    def dropped(self):
+        return sum(w.dropped for w in self._writers)
+
+    def _run(self, conn):
+        writer = BatchWriter(conn, self.registry, max_rows=self.max_rows, max_ms=self.max_ms,
+                             spool=self.spool, connect=self.connect)
+        self._writers.append(writer)
+        tick = min(writer.max_delay, 0.05)
+        while True:
+            msg = self.q.get(timeout=tick)
+            if msg is None and self._stop.is_set():
+                break
+            try:
+                if msg is not None:
+                    writer.add(msg)
+                writer.flush_if_due()
+            except Exception as e:
+                self._errors += 1
+                print("[worker] Falha ao gravar lote:", e)
+        try:
+            writer.flush()
+        finally:
+            writer.conn.close()
+
+    def start(self):
+        for i in range(self.size):
+            t = threading.Thread(target=self._run, args=(self.connect(),), name=f"ingest-writer-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+
+def report_stats(q, pool, interval_s, spool=None, compressor=None, dedup=None, validator=None):
+    """
+    Loga periodicamente fila, descartes, falhas de gravação, spool, compressão,
+    duplicadas e leituras sinalizadas pela validação. Sem fila (modo batch), `q` é None
+    e `pool` é o BatchWriter.
+    """
+    def _run():
+        while True:
+            time.sleep(interval_s)
+            if q is not None:
+                s = q.stats()
+                print(f"[worker] fila={s['depth']} recebidas={s['enqueued']} descartadas={s['dropped']} "
+                      f"spill={s['spilled']} (pendentes={s['spill_pending']})")
+            if pool is not None:
+                print(f"[worker] lotes_com_falha={pool.batches_failed} mensagens_recusadas={pool.rejected} "
+                      f"mensagens_perdidas={pool.dropped}")
+            if spool is not None:
+                print("[worker] spool " + " ".join(f"{k}={v}" for k, v in spool.stats().items()))
+            if compressor is not None:
+                print("[worker] compressão " + " ".join(f"{k}={v}" for k, v in compressor.stats().items()))
+            if dedup is not None:
+                print("[worker] dedup " + " ".join(f"{k}={v}" for k, v in dedup.stats().items()))
+            if validator is not None:
+                print("[worker] validação " + " ".join(f"{k}={v}" for k, v in validator.stats().items()))
+    threading.Thread(target=_run, name="ingest-stats", daemon=True).start()
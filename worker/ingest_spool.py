@@ -0,0 +1,286 @@
+"""
+Spool em disco da ingestão: segura os lotes que não puderam ser gravados
+no Postgres (banco fora do ar, timeout, erro de conexão) e os regrava em
+lote quando o banco volta.
+
+Formato: diretório com segmentos append-only `<seq>.seg`. Cada registro é
+um cabeçalho de 8 bytes (tamanho e crc32 do corpo, little-endian) seguido
+da mensagem parseada em JSON (ver ingest_parse.dump_message). Um registro
+truncado ou com checksum errado (queda no meio da escrita) encerra a
+leitura daquele segmento e é contado em `corrupt`.
+
+A entrega é "pelo menos uma vez": uma queda entre o commit de um lote e a
+gravação do checkpoint regrava o lote (as medições têm ON CONFLICT DO
+NOTHING; o raw_ingest pode ganhar linhas repetidas).
+
+O tamanho total é limitado por `max_bytes`: ao estourar, o segmento mais
+antigo é descartado (contadores `dropped_*`). O progresso do replay fica em
+`checkpoint`, para não regravar lotes já confirmados após um restart.
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+from ingest_batch import TRANSIENT_ERRORS
+from ingest_parse import dump_message, load_message
+
+HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".seg"
+
+
+class Spool:
+    def __init__(self, path, segment_bytes=16 << 20, max_bytes=1 << 30, fsync=False):
+        self.path = path
+        self.segment_bytes = max(HEADER.size + 1, int(segment_bytes))
+        self.max_bytes = max(self.segment_bytes, int(max_bytes))
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self._segments = {seq: os.path.getsize(self._seg_path(seq)) for seq in self._scan()}
+        self._active_seq = max(self._segments, default=0) + 1
+        self._active = None
+        self._checkpoint = self._read_checkpoint()
+
+        self.appended = 0
+        self.replayed = 0
+        self.dropped_segments = 0
+        self.dropped_bytes = 0
+        self.corrupt = 0
+        self.replay_failures = 0
+
+    # -- arquivos ---------------------------------------------------------
+
+    def _seg_path(self, seq):
+        return os.path.join(self.path, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _scan(self):
+        seqs = []
+        for name in os.listdir(self.path):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                seqs.append(int(name[:-len(SEGMENT_SUFFIX)]))
+        return sorted(seqs)
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, "checkpoint"), encoding="ascii") as f:
+                seq, offset = (int(x) for x in f.read().split())
+            return seq, offset
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _write_checkpoint(self, seq, offset):
+        tmp = os.path.join(self.path, "checkpoint.tmp")
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(f"{seq} {offset}\n")
+        os.replace(tmp, os.path.join(self.path, "checkpoint"))
+        self._checkpoint = (seq, offset)
+
+    def _remove(self, seq):
+        try:
+            os.remove(self._seg_path(seq))
+        except FileNotFoundError:
+            pass
+        self._segments.pop(seq, None)
+
+    # -- escrita ----------------------------------------------------------
+
+    def _seal_locked(self):
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._active_seq += 1
+
+    def append(self, batch):
+        """Grava um lote de mensagens no segmento ativo (um write + flush)."""
+        if not batch:
+            return
+        buf = bytearray()
+        for msg in batch:
+            body = dump_message(msg).encode("utf-8")
+            buf += HEADER.pack(len(body), zlib.crc32(body))
+            buf += body
+        with self._lock:
+            size = self._segments.get(self._active_seq, 0)
+            if self._active is not None and size + len(buf) > self.segment_bytes:
+                self._seal_locked()
+                size = 0
+            self._enforce_limit_locked(len(buf))
+            if self._active is None:
+                self._active = open(self._seg_path(self._active_seq), "ab")
+            self._active.write(buf)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._segments[self._active_seq] = size + len(buf)
+            self.appended += len(batch)
+
+    def _enforce_limit_locked(self, incoming):
+        # descarta os segmentos fechados mais antigos; o ativo nunca é descartado
+        while sum(self._segments.values()) + incoming > self.max_bytes:
+            sealed = [s for s in self._segments if s != self._active_seq]
+            if not sealed:
+                break
+            oldest = min(sealed)
+            self.dropped_segments += 1
+            self.dropped_bytes += self._segments[oldest]
+            print(f"[worker] spool cheio: descartando segmento {oldest} ({self._segments[oldest]} bytes)")
+            self._remove(oldest)
+
+    # -- replay -----------------------------------------------------------
+
+    def pending_bytes(self):
+        with self._lock:
+            return sum(self._segments.values())
+
+    def _read_records(self, seq, offset):
+        """Gera (offset_após_registro, mensagem) a partir de `offset`."""
+        try:
+            f = open(self._seg_path(seq), "rb")
+        except FileNotFoundError:
+            return  # descartado pelo limite de tamanho
+        with f:
+            f.seek(offset)
+            while True:
+                head = f.read(HEADER.size)
+                if not head:
+                    return
+                if len(head) < HEADER.size:
+                    self.corrupt += 1
+                    return
+                length, crc = HEADER.unpack(head)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    self.corrupt += 1
+                    return
+                offset += HEADER.size + length
+                yield offset, load_message(body.decode("utf-8"))
+
+    def replay(self, write_batch, max_rows=5000):
+        """
+        Drena o spool, do segmento mais antigo ao mais novo, chamando
+        `write_batch(lote)` com até `max_rows` leituras por lote. Para no
+        primeiro erro (o banco ainda não voltou) e retorna o número de
+        mensagens regravadas.
+        """
+        with self._lock:
+            # fecha o segmento ativo para que ele também possa ser drenado
+            if self._active is not None:
+                self._seal_locked()
+            seqs = sorted(self._segments)
+        done = 0
+        for seq in seqs:
+            cp_seq, cp_offset = self._checkpoint
+            offset = cp_offset if cp_seq == seq else 0
+            batch, rows = [], 0
+            for end, msg in self._read_records(seq, offset):
+                batch.append(msg)
+                rows += max(1, len(msg["readings"]))
+                if rows >= max_rows:
+                    done += self._replay_batch(write_batch, batch, seq, end)
+                    batch, rows = [], 0
+            if batch:
+                done += self._replay_batch(write_batch, batch, seq, end)
+            with self._lock:
+                self._remove(seq)
+            self._write_checkpoint(0, 0)
+        return done
+
+    def _replay_batch(self, write_batch, batch, seq, end):
+        try:
+            write_batch(batch)
+        except Exception:
+            self.replay_failures += 1
+            raise
+        self._write_checkpoint(seq, end)
+        self.replayed += len(batch)
+        return len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "pending_bytes": sum(self._segments.values()),
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "dropped_segments": self.dropped_segments,
+                "dropped_bytes": self.dropped_bytes,
+                "corrupt": self.corrupt,
+                "replay_failures": self.replay_failures,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+
+class SpoolReplayer:
+    """
+    Thread que tenta drenar o spool a cada `interval_s` segundos, com uma
+    conexão própria (`connect`) e o mesmo cache de sensores dos writers.
+    Um lote recusado por erro de dados (não transitório) é descartado e
+    contado em `rejected`, para não travar o spool.
+    """
+
+    def __init__(self, spool, connect, write_batch, registry, interval_s=5, max_rows=5000):
+        self.spool = spool
+        self.connect = connect
+        self.write_batch = write_batch
+        self.registry = registry
+        self.interval_s = interval_s
+        self.max_rows = max_rows
+        self.rejected = 0
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _write(self, batch):
+        try:
+            self.write_batch(self._conn, self.registry, batch)
+        except Exception as e:
+            self.registry.rollback()
+            if not self._conn.closed:
+                self._conn.rollback()
+            if isinstance(e, TRANSIENT_ERRORS):
+                raise
+            self.rejected += len(batch)
+            print(f"[worker] spool: lote com {len(batch)} mensagens recusado pelo banco, descartado: {e}")
+
+    def replay_once(self):
+        if not self.spool.pending_bytes():
+            return 0
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connect()
+        t0 = time.monotonic()
+        n = self.spool.replay(self._write, self.max_rows)
+        if n:
+            s = self.spool.stats()
+            print(f"[worker] spool: {n} mensagens regravadas em {time.monotonic() - t0:.1f}s "
+                  f"(pendentes={s['pending_bytes']} bytes em {s['segments']} segmentos)")
+        return n
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.replay_once()
+            except Exception as e:
+                s = self.spool.stats()
+                print(f"[worker] spool: replay adiado ({' '.join(str(e).split())}); pendentes={s['pending_bytes']} bytes "
+                      f"em {s['segments']} segmentos, descartados={s['dropped_bytes']} bytes")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
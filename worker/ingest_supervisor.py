@@ -0,0 +1,131 @@
+"""
+Supervisor da ingestão MQTT com vários processos consumidores.
+
+Sobe N processos de main.py (cada um com seu loop MQTT, conexão Postgres e
+cache de sensores) e reinicia os que morrerem, com backoff.
+
+Modos de distribuição (INGEST_SCALE_MODE / --mode):
+  - hash:   cada consumidor assina MQTT_TOPIC inteiro e só processa os
+            tópicos com crc32(tópico) % N == i. Um tópico (e portanto um
+            sensor) é sempre tratado pelo mesmo processo, na ordem de
+            chegada. Custa N cópias do tráfego entre broker e workers.
+  - shared: assinatura compartilhada do MQTT 5 ($share/<grupo>/<tópico>);
+            o broker entrega cada mensagem a um só consumidor. Mais barato
+            na rede, mas a ordem entre leituras de um mesmo sensor só é
+            preservada dentro de cada consumidor.
+
+Uso: python ingest_supervisor.py [--consumers 4] [--mode hash|shared]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+import sys
+import time
+
+INGEST_CONSUMERS = int(os.getenv("INGEST_CONSUMERS", "2"))
+INGEST_SCALE_MODE = os.getenv("INGEST_SCALE_MODE", "hash")
+INGEST_SHARE_GROUP = os.getenv("INGEST_SHARE_GROUP", "eta-ingest")
+
+RESTART_BACKOFF_MAX_S = 30.0
+# um consumidor que ficou de pé por esse tempo zera o backoff
+HEALTHY_AFTER_S = 60.0
+
+
+def consumer_env(index, count, mode):
+    topic = os.getenv("MQTT_TOPIC", "eta/leituras/#")
+    env = {"MQTT_CLIENT_ID": f"eta-ingest-{socket.gethostname()}-{index}"}
+    spool_dir = os.getenv("INGEST_SPOOL_DIR", "ingest_spool")
+    if spool_dir:
+        # segmentos e checkpoint do spool são de um único processo
+        env["INGEST_SPOOL_DIR"] = os.path.join(spool_dir, f"consumer-{index}")
+    if mode == "shared":
+        env["MQTT_TOPIC"] = f"$share/{INGEST_SHARE_GROUP}/{topic}"
+        env["MQTT_PROTOCOL"] = "5"
+    else:
+        env["INGEST_PARTITION"] = f"{index}/{count}"
+    return env
+
+
+def run_consumer(env):
+    # main.py lê a configuração do ambiente no import
+    os.environ.update(env)
+    # SIGTERM vira SystemExit: o finally de main.main() grava o lote pendente
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    import main
+    main.main()
+
+
+class Supervisor:
+    def __init__(self, count, mode):
+        if mode not in ("hash", "shared"):
+            raise ValueError(f"modo inválido: {mode}")
+        self.count = count
+        self.mode = mode
+        self.ctx = mp.get_context("spawn")
+        self.procs = [None] * count
+        self.started_at = [0.0] * count
+        self.backoff = [1.0] * count
+        self.next_start = [0.0] * count
+        self._stopping = False
+
+    def _start(self, i):
+        p = self.ctx.Process(target=run_consumer, args=(consumer_env(i, self.count, self.mode),),
+                             name=f"ingest-consumer-{i}", daemon=False)
+        p.start()
+        self.procs[i] = p
+        self.started_at[i] = time.monotonic()
+        print(f"[supervisor] consumidor {i} iniciado (pid={p.pid})")
+
+    def _check(self, i):
+        p = self.procs[i]
+        now = time.monotonic()
+        if p is not None and p.is_alive():
+            if now - self.started_at[i] >= HEALTHY_AFTER_S:
+                self.backoff[i] = 1.0
+            return
+        if p is not None:
+            print(f"[supervisor] consumidor {i} saiu (exitcode={p.exitcode}); "
+                  f"reiniciando em {self.backoff[i]:.0f}s")
+            p.join()
+            self.procs[i] = None
+            self.next_start[i] = now + self.backoff[i]
+            self.backoff[i] = min(self.backoff[i] * 2, RESTART_BACKOFF_MAX_S)
+        if now >= self.next_start[i]:
+            self._start(i)
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        print(f"[supervisor] {self.count} consumidores, modo={self.mode}")
+        for i in range(self.count):
+            self._start(i)
+        while not self._stopping:
+            time.sleep(1.0)
+            for i in range(self.count):
+                if not self._stopping:
+                    self._check(i)
+        print("[supervisor] encerrando consumidores...")
+        for p in self.procs:
+            if p is not None and p.is_alive():
+                p.terminate()
+        for p in self.procs:
+            if p is not None:
+                p.join(timeout=10)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--consumers", type=int, default=INGEST_CONSUMERS)
+    ap.add_argument("--mode", choices=("hash", "shared"), default=INGEST_SCALE_MODE)
+    args = ap.parse_args()
+    Supervisor(max(1, args.consumers), args.mode).run()
+
+
+if __name__ == "__main__":
+    main()
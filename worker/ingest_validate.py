@@ -0,0 +1,176 @@
+"""
+Validação das leituras na gravação, vetorizada por lote (NumPy).
+
+Por sensor, a partir do cache do SensorRegistry (eta.sensor):
+
+  - min_valid / max_valid: fora da faixa -> flag "range";
+  - decimals: o valor é arredondado antes de gravar;
+  - meta.validation.stuck_n: N leituras seguidas com o mesmo valor -> "stuck"
+    (a partir da N-ésima);
+  - meta.validation.spike: salto maior que isso em relação à leitura
+    anterior da mesma tag -> "spike".
+
+Leitura com qualquer flag vai com quality=false e meta.flags = [...]; as
+consultas filtram por quality em vez de recalcular limites. O último valor
+e o tamanho da sequência de cada tag ficam em memória, para que stuck/spike
+enxerguem a fronteira entre lotes.
+
+Roda no caminho único e ordenado de parse (main.on_message), antes da
+compressão: deadband e swinging door descartam repetições dentro da faixa,
+e stuck/spike precisam ver todas as leituras, na ordem de chegada. Mensagens
+pequenas (até SCALAR_MAX leituras) seguem por um laço Python equivalente,
+sem o custo fixo do NumPy por chamada.
+"""
+
+import threading
+
+import numpy as np
+
+FLAGS = ("range", "stuck", "spike")
+SCALAR_MAX = 64
+
+
+def parse_config(cfg):
+    """Normaliza meta.validation em (stuck_n, spike); 0 / NaN desligam."""
+    if not isinstance(cfg, dict):
+        return 0, np.nan
+    try:
+        stuck_n = int(cfg.get("stuck_n") or 0)
+    except (TypeError, ValueError):
+        stuck_n = 0
+    try:
+        spike = float(cfg["spike"]) if cfg.get("spike") is not None else np.nan
+    except (TypeError, ValueError):
+        spike = np.nan
+    return stuck_n, spike
+
+
+class Validator:
+    def __init__(self, registry):
+        self.registry = registry
+        self._last = {}  # tag -> (último valor, tamanho da sequência de valores iguais)
+        self._lock = threading.Lock()
+        self.readings_in = 0
+        self.flagged = dict.fromkeys(FLAGS, 0)
+
+    def _limits(self, tags):
+        """Arrays por tag única: min, max, decimais (-1 = sem arredondamento), stuck_n, spike."""
+        lo, hi, dec, stuck_n, spike = [], [], [], [], []
+        for tag in tags:
+            v = self.registry.validity(tag)
+            if v is None:
+                v = (None, None, None, None)
+            mn, mx, d, cfg = v
+            lo.append(np.nan if mn is None else mn)
+            hi.append(np.nan if mx is None else mx)
+            dec.append(-1 if d is None else d)
+            s, sp = parse_config(cfg)
+            stuck_n.append(s)
+            spike.append(sp)
+        return (np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64),
+                np.asarray(dec, dtype=np.int64), np.asarray(stuck_n, dtype=np.int64),
+                np.asarray(spike, dtype=np.float64))
+
+    def _flag(self, r, value, flags):
+        if any(flags):
+            # meta pode ser compartilhado entre as leituras de um payload colunar
+            r["meta"] = dict(r["meta"] or {}, flags=[f for f, on in zip(FLAGS, flags) if on])
+        r["value"] = value
+        r["quality"] = not any(flags)
+
+    def _apply_scalar(self, readings):
+        """Mesmas regras de `apply`, leitura a leitura; em ordem de tag e ts, como lá."""
+        counts = [0, 0, 0]
+        with self._lock:
+            for r in sorted(readings, key=lambda r: (str(r["tag"]), r["ts"])):
+                v = self.registry.validity(r["tag"])
+                mn, mx, d, cfg = (None, None, None, None) if v is None else v
+                stuck_n, spike = parse_config(cfg)
+                value = r["value"]
+                if d is not None:
+                    scale = 10.0 ** max(d, 0)
+                    value = round(value * scale) / scale
+                bad_range = (mn is not None and value < float(mn)) or (mx is not None and value > float(mx))
+                last = self._last.get(r["tag"])
+                prev, run = (np.nan, 1) if last is None else (last[0], last[1] + 1 if value == last[0] else 1)
+                self._last[r["tag"]] = (value, run)
+                flags = (bool(bad_range), stuck_n > 0 and run >= stuck_n, bool(abs(value - prev) > spike))
+                self._flag(r, value, flags)
+                counts = [c + f for c, f in zip(counts, flags)]
+            self.readings_in += len(readings)
+            for f, c in zip(FLAGS, counts):
+                self.flagged[f] += c
+
+    def apply(self, batch):
+        readings = [r for m in batch for r in m["readings"]]
+        n = len(readings)
+        if not n:
+            return batch
+        if n <= SCALAR_MAX:
+            self._apply_scalar(readings)
+            return batch
+        tags, inv = np.unique(np.array([r["tag"] for r in readings], dtype=object).astype(str),
+                              return_inverse=True)
+        values = np.fromiter((r["value"] for r in readings), dtype=np.float64, count=n)
+        ts = np.fromiter((r["ts"].timestamp() for r in readings), dtype=np.float64, count=n)
+        lo, hi, dec, stuck_n, spike = (a[inv] for a in self._limits(tags))
+
+        has_dec = dec >= 0
+        scale = np.where(has_dec, 10.0 ** np.maximum(dec, 0), 1.0)
+        values = np.where(has_dec, np.round(values * scale) / scale, values)
+
+        # NaN nos limites compara como falso: sem limite, sem flag
+        bad_range = (values < lo) | (values > hi)
+
+        # stuck/spike precisam da ordem por tag e ts
+        order = np.lexsort((ts, inv))
+        g, v = inv[order], values[order]
+        idx = np.arange(n)
+        start = np.ones(n, dtype=bool)
+        start[1:] = g[1:] != g[:-1]
+
+        with self._lock:
+            carried = [self._last.get(t) for t in tags[g[start]].tolist()]
+            prev = np.empty(n)
+            prev[1:] = v[:-1]
+            prev[start] = [np.nan if c is None else c[0] for c in carried]
+            base_run = np.array([1 if c is None else c[1] + 1 for c in carried], dtype=np.int64)
+
+            eq = v == prev
+            # tamanho da sequência de valores iguais terminando em cada posição;
+            # zera em cada valor diferente e no início de cada tag (que herda o lote anterior)
+            reset = ~eq | start
+            first = np.ones(n, dtype=np.int64)
+            first[start] = np.where(eq[start], base_run, 1)
+            last_reset = np.maximum.accumulate(np.where(reset, idx, 0))
+            run = first[last_reset] + (idx - last_reset)
+
+            end = np.ones(n, dtype=bool)
+            end[:-1] = start[1:]
+            for t, val, r in zip(tags[g[end]].tolist(), v[end].tolist(), run[end].tolist()):
+                self._last[t] = (val, r)
+
+        stuck = np.zeros(n, dtype=bool)
+        spiked = np.zeros(n, dtype=bool)
+        s_n, s_sp = stuck_n[order], spike[order]
+        stuck[order] = (s_n > 0) & (run >= s_n)
+        spiked[order] = np.abs(v - prev) > s_sp
+
+        flags = np.stack([bad_range, stuck, spiked])
+        quality = ~flags.any(axis=0)
+        for i in np.flatnonzero(~quality).tolist():
+            r = readings[i]
+            # meta pode ser compartilhado entre as leituras de um payload colunar
+            r["meta"] = dict(r["meta"] or {}, flags=[f for f, on in zip(FLAGS, flags[:, i]) if on])
+        for r, val, ok in zip(readings, values.tolist(), quality.tolist()):
+            r["value"] = val
+            r["quality"] = ok
+
+        with self._lock:
+            self.readings_in += n
+            for f, count in zip(FLAGS, flags.sum(axis=1).tolist()):
+                self.flagged[f] += count
+        return batch
+
+    def stats(self):
+        return {"in": self.readings_in, **self.flagged}
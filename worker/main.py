@@ -1,10 +1,21 @@
-import os, json, time
-from datetime import datetime, timezone
-from dateutil import parser as dtparser
+import os
+import threading
+import time
+import zlib
 import paho.mqtt.client as mqtt
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from ingest_batch import BatchWriter, write_batch
+from ingest_compress import Compressor
+from ingest_dedup import DedupFilter
+from ingest_parse import parse_message
+from ingest_queue import IngestQueue, WriterPool, report_stats
+from ingest_spool import Spool, SpoolReplayer
+from ingest_validate import Validator
+from mqtt_capture import CaptureWriter
+from sensor_registry import SensorRegistry
+
 PGHOST = os.getenv("PGHOST", "postgres")
 PGPORT = int(os.getenv("PGPORT", "5432"))
 PGUSER = os.getenv("PGUSER", "postgres")
@@ -14,15 +25,78 @@ PGDATABASE = os.getenv("PGDATABASE", "eta")
 MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "eta/leituras/#")
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "3.1.1")  # 3.1.1 | 5
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "")
+# "i/N": este consumidor só processa tópicos com crc32(tópico) % N == i
+# (ver ingest_supervisor.py); mantém a ordem por tópico/sensor
+INGEST_PARTITION = os.getenv("INGEST_PARTITION", "")
 
 DEFAULT_SITE = os.getenv("DEFAULT_SITE", "ETA Central")
 DEFAULT_UNIT = os.getenv("DEFAULT_UNIT", "Filtração")
 
+# flush do lote a cada N leituras ou M milissegundos, o que vier primeiro
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+# intervalo do refresh incremental do cache de sensores (além do LISTEN)
+SENSOR_REFRESH_S = int(os.getenv("SENSOR_REFRESH_S", "300"))
+
+# batch: o callback MQTT grava direto (flush no próprio thread de rede)
+# queue: o callback só parseia e enfileira; INGEST_WRITERS threads gravam
+INGEST_MODE = os.getenv("INGEST_MODE", "batch")
+INGEST_WRITERS = int(os.getenv("INGEST_WRITERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BACKPRESSURE = os.getenv("INGEST_BACKPRESSURE", "block")  # block | drop_oldest | spill
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "ingest_spill.jsonl")
+INGEST_STATS_S = int(os.getenv("INGEST_STATS_S", "30"))
+
+# spool em disco para lotes que falham com o banco fora do ar (vazio desliga)
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "ingest_spool")
+INGEST_SPOOL_SEGMENT_MB = int(os.getenv("INGEST_SPOOL_SEGMENT_MB", "16"))
+INGEST_SPOOL_MAX_MB = int(os.getenv("INGEST_SPOOL_MAX_MB", "1024"))
+INGEST_SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "0") == "1"
+INGEST_SPOOL_REPLAY_S = int(os.getenv("INGEST_SPOOL_REPLAY_S", "5"))
+INGEST_SPOOL_BATCH = int(os.getenv("INGEST_SPOOL_BATCH", "5000"))
+# banco lento também conta como indisponível: o lote estoura o timeout e vai para o spool
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "15000"))
+
+# compressão por exceção conforme eta.sensor.meta.compression (0 desliga o estágio)
+INGEST_COMPRESSION = os.getenv("INGEST_COMPRESSION", "1") == "1"
+
+# timestamps recentes lembrados por tag para descartar retransmissões (0 desliga)
+INGEST_DEDUP_WINDOW = int(os.getenv("INGEST_DEDUP_WINDOW", "64"))
+
+# faixa, arredondamento, valor travado e picos conforme eta.sensor (0 desliga)
+INGEST_VALIDATE = os.getenv("INGEST_VALIDATE", "1") == "1"
+
+# cria as partições mensais futuras de eta.measurement a cada N horas (0 desliga;
+# ver eta-stack/db/09_measurement_partitioning.sql)
+PARTITION_MAINTAIN_H = float(os.getenv("PARTITION_MAINTAIN_H", "24"))
+
+# aplica eta.retention_policy a cada N horas, apagando em lotes de RETENTION_BATCH
+# linhas (0 desliga; ver eta-stack/db/12_retention.sql e retention.py)
+RETENTION_H = float(os.getenv("RETENTION_H", "24"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "5000"))
+
+# grava todo o tráfego recebido num arquivo de captura (ver mqtt_capture.py)
+INGEST_CAPTURE_PATH = os.getenv("INGEST_CAPTURE_PATH", "")
+
 def pg_conn():
     return psycopg2.connect(
-        host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, dbname=PGDATABASE
+        host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, dbname=PGDATABASE,
+        connect_timeout=10, options=f"-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}"
     )
 
+def wait_for_db(max_delay_s=30):
+    """Tenta conectar com backoff em vez de derrubar o container na partida."""
+    delay = 1
+    while True:
+        try:
+            return pg_conn()
+        except psycopg2.OperationalError as e:
+            print(f"[worker] Postgres indisponível ({str(e).strip()}); nova tentativa em {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay_s)
+
 def ensure_defaults(conn):
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("SELECT id FROM eta.site WHERE name=%s", (DEFAULT_SITE,))
@@ -55,92 +129,154 @@ def ensure_defaults(conn):
         conn.commit()
         return device_id
 
-def upsert_sensor(conn, device_id, tag, unit=None, desc=None):
-    with conn.cursor() as cur:
-        cur.execute("SELECT id FROM eta.sensor WHERE tag=%s", (tag,))
-        r = cur.fetchone()
-        if r:
-            return r[0]
-        cur.execute("""INSERT INTO eta.sensor (device_id, tag, unit, description)
-                       VALUES (%s,%s,%s,%s) RETURNING id""",
-                    (device_id, tag, unit, desc))
-        sensor_id = cur.fetchone()[0]
-        conn.commit()
-        return sensor_id
-
-def insert_raw(conn, gateway_id, topic, payload_json, status="received", err=None):
-    with conn.cursor() as cur:
-        cur.execute("""INSERT INTO eta.raw_ingest (gateway_id, src_topic, payload, status, err_msg)
-                       VALUES (%s,%s,%s::jsonb,%s,%s) RETURNING id""",
-                    (gateway_id, topic, json.dumps(payload_json), status, err))
-        rid = cur.fetchone()[0]
-        conn.commit()
-        return rid
-
-def insert_measurement(conn, sensor_id, ts, value, unit=None, meta=None, quality=True):
-    with conn.cursor() as cur:
-        cur.execute("""INSERT INTO eta.measurement (sensor_id, ts, value, quality, meta)
-                       VALUES (%s,%s,%s,%s,%s)
-                       ON CONFLICT (sensor_id, ts) DO NOTHING""",
-                    (sensor_id, ts, float(value), quality, json.dumps(meta or {})))
-        conn.commit()
-
-def on_message(client, userdata, msg):
-    conn = userdata["conn"]
-    device_id = userdata["device_id"]
-
+def maintain_partitions():
+    """Garante as partições do mês corrente e dos próximos (sem efeito com TimescaleDB)."""
     try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-    except Exception as e:
+        conn = pg_conn()
         try:
-            insert_raw(conn, None, msg.topic, {"_raw": msg.payload.decode("utf-8","ignore")}, status="failed", err=str(e))
-        except Exception:
-            pass
-        return
-
-    rid = insert_raw(conn, None, msg.topic, payload, status="received")
+            with conn.cursor() as cur:
+                cur.execute("SELECT eta.measurement_partition_maintain()")
+            conn.commit()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print("[worker] Falha ao criar partições de eta.measurement:", " ".join(str(e).split()))
 
-    # payload esperado: { "tag": "...", "value": 7.1, "unit": "...", "ts": "2025-09-18T21:27:00Z", "meta": {...} }
-    tag = payload.get("tag") or msg.topic.replace("eta/leituras/","")
-    unit = payload.get("unit")
-    value = payload.get("value")
-    ts = payload.get("ts")
-    if ts:
-        try:
-            ts = dtparser.isoparse(ts)
-        except Exception:
-            ts = datetime.now(timezone.utc)
-    else:
-        ts = datetime.now(timezone.utc)
+def start_partition_maintenance(interval_h):
+    def run():
+        while True:
+            maintain_partitions()
+            time.sleep(interval_h * 3600)
+    threading.Thread(target=run, name="partition-maintain", daemon=True).start()
 
-    if value is None:
-        # marca ingestão como falha
+def enforce_retention(batch=RETENTION_BATCH):
+    """Roda eta.retention_enforce; retorna (target, sensor_id, linhas, partições, tempo) do que foi apagado."""
+    conn = pg_conn()
+    conn.autocommit = True  # o procedimento faz COMMIT a cada lote
+    try:
         with conn.cursor() as cur:
-            cur.execute("UPDATE eta.raw_ingest SET status='failed', err_msg='missing value' WHERE id=%s", (rid,))
-            conn.commit()
-        return
+            cur.execute("SET statement_timeout = 0")
+            cur.execute("SELECT now()")
+            t0 = cur.fetchone()[0]
+            cur.execute("CALL eta.retention_enforce(%s)", (batch,))
+            cur.execute("""SELECT target, sensor_id, rows, partitions, elapsed FROM eta.retention_run
+                           WHERE started_at >= %s ORDER BY id""", (t0,))
+            runs = cur.fetchall()
+            if any(r[0] == "measurement" and r[1] is not None and r[2] for r in runs):
+                # devolve o espaço e resume de novo as faixas do BRIN desfeitas pelo procedimento
+                cur.execute("VACUUM ANALYZE eta.measurement")
+            return runs
+    finally:
+        conn.close()
 
-    # garante sensor
-    sensor_id = upsert_sensor(conn, device_id, tag, unit=unit)
+def start_retention(interval_h):
+    def run():
+        while True:
+            try:
+                runs = enforce_retention()
+                if runs:
+                    print(f"[worker] Retenção: {sum(r[2] for r in runs)} linhas apagadas "
+                          f"({sum(r[3] for r in runs)} partições) em {len(runs)} tabelas/sensores")
+            except psycopg2.Error as e:
+                print("[worker] Falha na retenção:", " ".join(str(e).split()))
+            time.sleep(interval_h * 3600)
+    threading.Thread(target=run, name="retention", daemon=True).start()
 
-    # insere curado
-    insert_measurement(conn, sensor_id, ts, value, unit=unit, meta=payload.get("meta"), quality=True)
+def parse_partition(spec):
+    if not spec:
+        return None
+    index, count = (int(x) for x in spec.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"INGEST_PARTITION inválida: {spec}")
+    return index, count
 
-    # atualiza status do raw
-    with conn.cursor() as cur:
-        cur.execute("UPDATE eta.raw_ingest SET status='parsed' WHERE id=%s", (rid,))
-        conn.commit()
+def on_message(client, userdata, msg):
+    # payload esperado: { "tag": "...", "value": 7.1, "unit": "...", "ts": "2025-09-18T21:27:00Z", "meta": {...} }
+    partition = userdata["partition"]
+    if partition and zlib.crc32(msg.topic.encode("utf-8")) % partition[1] != partition[0]:
+        return
+    if userdata["capture"] is not None:
+        userdata["capture"].write(msg.topic, msg.payload, msg.qos)
+    parsed = parse_message(msg.topic, msg.payload)
+    if userdata["dedup"] is not None:
+        userdata["dedup"].apply(parsed)
+    # valida aqui, no caminho único e ordenado, antes da compressão descartar
+    # repetições: stuck/spike precisam da série completa de cada tag
+    if userdata["validator"] is not None:
+        userdata["validator"].apply([parsed])
+    if userdata["compressor"] is not None:
+        userdata["compressor"].apply(parsed)
+    userdata["sink"](parsed)
 
 def main():
-    conn = pg_conn()
+    conn = wait_for_db()
     device_id = ensure_defaults(conn)
 
-    client = mqtt.Client(userdata={"conn": conn, "device_id": device_id})
+    registry = SensorRegistry(device_id, refresh_s=SENSOR_REFRESH_S).load(conn)
+    if PARTITION_MAINTAIN_H > 0:
+        start_partition_maintenance(PARTITION_MAINTAIN_H)
+    if RETENTION_H > 0:
+        start_retention(RETENTION_H)
+
+    compressor = Compressor(registry) if INGEST_COMPRESSION else None
+    dedup = DedupFilter(INGEST_DEDUP_WINDOW) if INGEST_DEDUP_WINDOW > 0 else None
+    validator = Validator(registry) if INGEST_VALIDATE else None
+
+    spool = replayer = None
+    if INGEST_SPOOL_DIR:
+        spool = Spool(INGEST_SPOOL_DIR, segment_bytes=INGEST_SPOOL_SEGMENT_MB << 20,
+                      max_bytes=INGEST_SPOOL_MAX_MB << 20, fsync=INGEST_SPOOL_FSYNC)
+        replayer = SpoolReplayer(spool, pg_conn, write_batch, registry,
+                                 interval_s=INGEST_SPOOL_REPLAY_S, max_rows=INGEST_SPOOL_BATCH).start()
+
+    if INGEST_MODE == "queue":
+        q = IngestQueue(INGEST_QUEUE_SIZE, policy=INGEST_BACKPRESSURE, spill_path=INGEST_SPILL_PATH)
+        writer = WriterPool(q, pg_conn, registry, size=INGEST_WRITERS,
+                            max_rows=INGEST_BATCH_SIZE, max_ms=INGEST_FLUSH_MS, spool=spool).start()
+        report_stats(q, writer, INGEST_STATS_S, spool=spool, compressor=compressor, dedup=dedup,
+                     validator=validator)
+        sink = q.put
+        mode = f"queue={INGEST_QUEUE_SIZE} ({INGEST_BACKPRESSURE}), writers={INGEST_WRITERS}"
+    else:
+        writer = BatchWriter(conn, registry, max_rows=INGEST_BATCH_SIZE, max_ms=INGEST_FLUSH_MS,
+                             spool=spool, connect=pg_conn).start()
+        report_stats(None, writer, INGEST_STATS_S, spool=spool, compressor=compressor, dedup=dedup,
+                     validator=validator)
+        sink = writer.add
+        mode = "batch"
+    if spool is not None:
+        mode += f", spool={INGEST_SPOOL_DIR}"
+    capture = CaptureWriter(INGEST_CAPTURE_PATH) if INGEST_CAPTURE_PATH else None
+    if capture is not None:
+        mode += f", captura={INGEST_CAPTURE_PATH}"
+
+    partition = parse_partition(INGEST_PARTITION)
+    if partition:
+        mode += f", partição {partition[0]}/{partition[1]}"
+
+    protocol = mqtt.MQTTv5 if MQTT_PROTOCOL == "5" else mqtt.MQTTv311
+    client = mqtt.Client(client_id=MQTT_CLIENT_ID, protocol=protocol,
+                         userdata={"conn": conn, "device_id": device_id, "sink": sink, "partition": partition,
+                                   "capture": capture, "compressor": compressor, "dedup": dedup,
+                                   "validator": validator})
     client.on_message = on_message
     client.connect(MQTT_HOST, MQTT_PORT, 60)
     client.subscribe(MQTT_TOPIC)
-    print(f"[worker] Subscribed to {MQTT_TOPIC} @ {MQTT_HOST}:{MQTT_PORT}")
-    client.loop_forever()
+    print(f"[worker] Subscribed to {MQTT_TOPIC} @ {MQTT_HOST}:{MQTT_PORT} [{mode}] "
+          f"(batch={INGEST_BATCH_SIZE} rows / {INGEST_FLUSH_MS} ms, {len(registry)} sensores em cache)")
+    try:
+        client.loop_forever()
+    finally:
+        # pontos retidos pelo swinging door vão no último lote
+        held = compressor.flush() if compressor is not None else None
+        if held is not None:
+            sink(held)
+        writer.stop()
+        if replayer is not None:
+            replayer.stop()
+            spool.close()
+        if capture is not None:
+            capture.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,251 @@
+"""
+Gravação e reprodução de tráfego MQTT real da ingestão.
+
+Arquivo de captura (.etacap): gzip com o cabeçalho MAGIC seguido de
+registros `<d H I B` (instante de recebimento em epoch s, tamanho do
+tópico, tamanho do payload, qos) + tópico + payload, exatamente como
+chegaram do broker (JSON, MessagePack ou CBOR).
+
+  record: assina o tópico e grava até --duration s / --max-messages
+          (a mesma captura pode ser feita pelo próprio worker com
+          INGEST_CAPTURE_PATH, ver main.py);
+  replay: republica no broker preservando os intervalos originais
+          (--speed 1, 10, 100...; 0 = o mais rápido possível). Com
+          --retime, os campos `ts` dos payloads são deslocados para que a
+          primeira mensagem caia em "agora" e os seguintes acompanhem o
+          cronograma acelerado (sem isso, leituras já gravadas batem no
+          ON CONFLICT e somem);
+  info:   resumo da captura (mensagens, duração, tópicos, taxa de pico).
+
+Uso:
+  python mqtt_capture.py record --out incidente.etacap --duration 600
+  python mqtt_capture.py replay incidente.etacap --speed 10 --retime
+"""
+
+import argparse
+import gzip
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import paho.mqtt.client as mqtt
+
+import ingest_codecs
+from ingest_parse import parse_ts
+
+MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "eta/leituras/#")
+
+MAGIC = b"ETACAP1\n"
+RECORD = struct.Struct("<dHIB")
+
+
+class CaptureWriter:
+    """
+    Grava mensagens num arquivo de captura; `write` pode vir de qualquer thread.
+    O gzip é sincronizado a cada `flush_s` segundos, então um processo morto
+    sem `close` perde no máximo esse intervalo.
+    """
+
+    def __init__(self, path, flush_s=1.0):
+        self._f = gzip.open(path, "wb", compresslevel=6)
+        self._f.write(MAGIC)
+        self._f.flush()
+        self._lock = threading.Lock()
+        self._flush_s = flush_s
+        self._next_flush = time.monotonic() + flush_s
+        self.count = 0
+
+    def write(self, topic, payload, qos=0, ts=None):
+        t = topic.encode("utf-8")
+        rec = RECORD.pack(ts if ts is not None else time.time(), len(t), len(payload), qos) + t + bytes(payload)
+        with self._lock:
+            self._f.write(rec)
+            self.count += 1
+            if time.monotonic() >= self._next_flush:
+                self._f.flush()
+                self._next_flush = time.monotonic() + self._flush_s
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+def read_capture(path):
+    """
+    Gera (instante, tópico, payload, qos) na ordem de gravação. Uma captura
+    interrompida (processo morto sem fechar o gzip) é lida até onde der.
+    """
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: não é um arquivo de captura")
+        while True:
+            try:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                ts, tlen, plen, qos = RECORD.unpack(head)
+                topic = f.read(tlen)
+                payload = f.read(plen)
+            except EOFError:
+                return
+            if len(topic) < tlen or len(payload) < plen:
+                return
+            yield ts, topic.decode("utf-8"), payload, qos
+
+
+# -- retime -----------------------------------------------------------------
+
+def _shift(value, delta):
+    if isinstance(value, datetime):
+        return value + delta
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value + int(delta.total_seconds() * 1000)
+    if isinstance(value, str):
+        return (parse_ts(value) + delta).isoformat()
+    return value
+
+
+def _shift_payload(obj, delta):
+    if isinstance(obj, list):
+        return [_shift_payload(o, delta) for o in obj]
+    if isinstance(obj, dict) and "ts" in obj:
+        return dict(obj, ts=_shift(obj["ts"], delta))
+    return obj
+
+
+def retime(topic, payload, delta):
+    """Desloca os `ts` do payload em `delta`, mantendo o codec; falha -> payload original."""
+    codec, _ = ingest_codecs.pick_codec(topic, payload)
+    try:
+        obj = _shift_payload(ingest_codecs.decode(codec, payload), delta)
+        if codec == "msgpack":
+            return ingest_codecs.msgpack.packb(obj, datetime=True)
+        if codec == "cbor":
+            return ingest_codecs.CBOR_MAGIC + ingest_codecs.cbor2.dumps(obj)
+        return ingest_codecs.json_dumps(obj).encode("utf-8")
+    except Exception:
+        return payload
+
+
+# -- comandos ---------------------------------------------------------------
+
+def record(args):
+    writer = CaptureWriter(args.out)
+    done = threading.Event()
+
+    def on_message(client, userdata, msg):
+        writer.write(msg.topic, msg.payload, msg.qos)
+        if args.max_messages and writer.count >= args.max_messages:
+            done.set()
+
+    client = mqtt.Client(client_id=f"eta-capture-{os.getpid()}")
+    client.on_message = on_message
+    client.connect(MQTT_HOST, MQTT_PORT, 60)
+    client.subscribe(args.topic, qos=1)
+    client.loop_start()
+    print(f"[capture] gravando {args.topic} @ {MQTT_HOST}:{MQTT_PORT} em {args.out}")
+    try:
+        done.wait(args.duration or None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        writer.close()
+    print(f"[capture] {writer.count} mensagens gravadas")
+
+
+def replay(args):
+    client = mqtt.Client(client_id=f"eta-replay-{os.getpid()}")
+    client.connect(MQTT_HOST, MQTT_PORT, 60)
+    client.loop_start()
+
+    sent, behind = 0, 0.0
+    t_start = time.monotonic()
+    try:
+        for _ in range(args.loops):
+            first = None
+            t0 = time.monotonic()
+            for ts, topic, payload, qos in read_capture(args.capture):
+                if first is None:
+                    first = ts
+                    delta = timedelta(seconds=time.time() - ts)
+                if args.speed > 0:
+                    due = t0 + (ts - first) / args.speed
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    else:
+                        behind = max(behind, -wait)
+                if args.retime:
+                    # o deslocamento acompanha a aceleração: intervalos entre ts encolhem junto
+                    shift = delta if args.speed <= 0 else delta - timedelta(seconds=(ts - first) * (1 - 1 / args.speed))
+                    payload = retime(topic, payload, shift)
+                client.publish(topic, payload, qos=args.qos if args.qos is not None else qos)
+                sent += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    elapsed = time.monotonic() - t_start
+    print(f"[replay] {sent} mensagens em {elapsed:.1f}s ({sent / elapsed if elapsed else 0:.0f} msg/s), "
+          f"atraso máximo em relação ao cronograma: {behind * 1000:.0f} ms")
+
+
+def info(args):
+    n, nbytes, topics = 0, 0, Counter()
+    first = last = None
+    per_second = Counter()
+    for ts, topic, payload, _ in read_capture(args.capture):
+        n += 1
+        nbytes += len(payload)
+        topics[topic] += 1
+        per_second[int(ts)] += 1
+        first = ts if first is None else first
+        last = ts
+    if not n:
+        print("captura vazia")
+        return
+    print(f"{n} mensagens, {nbytes} bytes de payload, {len(topics)} tópicos, "
+          f"{last - first:.1f}s ({datetime.fromtimestamp(first).isoformat()} -> "
+          f"{datetime.fromtimestamp(last).isoformat()}), pico {max(per_second.values())} msg/s")
+    for topic, count in topics.most_common(args.top):
+        print(f"  {count:8d}  {topic}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("record")
+    r.add_argument("--out", required=True)
+    r.add_argument("--topic", default=MQTT_TOPIC)
+    r.add_argument("--duration", type=float, default=0, help="segundos (0 = até Ctrl+C)")
+    r.add_argument("--max-messages", type=int, default=0)
+    r.set_defaults(func=record)
+
+    p = sub.add_parser("replay")
+    p.add_argument("capture")
+    p.add_argument("--speed", type=float, default=1.0, help="1, 10, 100...; 0 = o mais rápido possível")
+    p.add_argument("--retime", action="store_true", help="desloca os ts dos payloads para o presente")
+    p.add_argument("--loops", type=int, default=1)
+    p.add_argument("--qos", type=int, choices=(0, 1), default=None, help="padrão: o qos gravado")
+    p.set_defaults(func=replay)
+
+    i = sub.add_parser("info")
+    i.add_argument("capture")
+    i.add_argument("--top", type=int, default=10)
+    i.set_defaults(func=info)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
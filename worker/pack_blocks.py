@@ -0,0 +1,263 @@
+"""
+Compactação de dias fechados de eta.measurement em blocos por sensor.
+
+Para cada dia UTC anterior ao corte, numa transação REPEATABLE READ:
+  1. lê as leituras do dia em ordem (sensor_id, ts) por um cursor no servidor;
+  2. codifica cada sensor num bloco (block_codec: ts delta-of-delta, valores
+     XOR), mesclando com um bloco já existente do dia (leituras atrasadas);
+  3. decodifica o bloco e confere bit a bit com as leituras de origem;
+  4. grava em eta.measurement_block e apaga as leituras do dia com os
+     triggers de rollup desligados (eta.rollup_skip), para os rollups
+     manterem o dia;
+  5. depois do COMMIT, desfaz o resumo do BRIN em ts nas páginas liberadas
+     (measurement_brin_forget, ver 13_measurement_indexes.sql). Ao final, um
+     VACUUM devolve o espaço e resume de novo essas faixas só com o que
+     sobrou, para que as leituras novas gravadas ali não as estiquem do dia
+     compactado até hoje.
+
+Relatórios e séries decodificam os blocos direto (ver blocks_to_frame e
+api/services/block_service.py); archive_measurements.py leva os blocos
+junto com as linhas ao arquivar o mês.
+
+Uso:
+  python pack_blocks.py                       # dias antes de BLOCK_KEEP_DAYS
+  python pack_blocks.py --before 2025-06-01
+  python pack_blocks.py --dry-run
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from block_codec import decode_block, encode_block
+from main import pg_conn
+
+# dias mais recentes que ficam como linhas em eta.measurement
+BLOCK_KEEP_DAYS = int(os.getenv("BLOCK_KEEP_DAYS", "7"))
+FETCH_ROWS = 100_000
+
+BLOCK_COLUMNS = "sensor_id, n, ts_data, value_data, quality_data, meta_data"
+
+# apaga um período de eta.measurement e retorna as páginas liberadas por tabela
+# (measurement, partição ou chunk), em listas paralelas para measurement_brin_forget
+DELETE_MEASUREMENT_SQL = """
+    WITH d AS (DELETE FROM eta.measurement WHERE ts >= %s AND ts < %s RETURNING tableoid, ctid),
+         p AS (SELECT DISTINCT tableoid::regclass::text AS rel, (ctid::text::point)[0]::int8 AS page FROM d)
+    SELECT COALESCE(array_agg(rel), '{}'), COALESCE(array_agg(page), '{}') FROM p
+"""
+
+
+def utc(d):
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def _from_us(us):
+    return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=us)
+
+
+def _utc_us(dt):
+    """µs desde a época; datas sem fuso são tratadas como UTC."""
+    ts = pd.Timestamp(dt)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return ts.value // 1000
+
+
+def blocks_to_frame(blocks, start_dt=None, end_dt=None, meta_as_text=False):
+    """
+    Decodifica linhas (BLOCK_COLUMNS) de eta.measurement_block num DataFrame
+    sensor_id, ts (UTC), value, quality, meta, só com start_dt <= ts < end_dt.
+    """
+    lo = None if start_dt is None else _utc_us(start_dt)
+    hi = None if end_dt is None else _utc_us(end_dt)
+    frames = []
+    for sensor_id, n, ts_data, value_data, quality_data, meta_data in blocks:
+        ts_us, values, quality, metas = decode_block(n, ts_data, value_data, quality_data, meta_data)
+        keep = np.ones(n, dtype=bool)
+        if lo is not None:
+            keep &= ts_us >= lo
+        if hi is not None:
+            keep &= ts_us < hi
+        if not keep.any():
+            continue
+        metas = [m for m, k in zip(metas, keep) if k]
+        if meta_as_text:
+            metas = [json.dumps(m) if m is not None else None for m in metas]
+        frames.append(pd.DataFrame({
+            "sensor_id": sensor_id,
+            "ts": pd.to_datetime(ts_us[keep], unit="us", utc=True),
+            "value": values[keep],
+            "quality": quality[keep],
+            "meta": metas,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["sensor_id", "ts", "value", "quality", "meta"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _merge(old, new):
+    """Junta (ts, value, quality, meta) de dois conjuntos; no mesmo ts vale `new`."""
+    ts, values, quality, metas = (np.concatenate([o, n]) if k < 3 else list(o) + list(n)
+                                  for k, (o, n) in enumerate(zip(old, new)))
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    keep = np.append(ts[1:] != ts[:-1], True)
+    idx = order[keep]
+    return ts[keep], values[idx], quality[idx], [metas[i] for i in idx]
+
+
+def _encode(sensor_id, cols, existing):
+    """Codifica um sensor/dia (mesclando com o bloco existente) e confere a decodificação."""
+    if existing is not None:
+        n, ts_data, value_data, quality_data, meta_data = existing
+        old = decode_block(n, ts_data, value_data, quality_data, meta_data)
+        old = (old[0], old[1], old[2], [json.dumps(m) if m is not None else None for m in old[3]])
+        cols = _merge(old, cols)
+    ts_us, values, quality, metas = cols
+    block = encode_block(ts_us, values, quality, metas)
+    back = decode_block(block["n"], block["ts_data"], block["value_data"], block["quality_data"],
+                        block["meta_data"])
+    if not ((back[0] == ts_us).all() and (back[1].view(np.uint64) == values.view(np.uint64)).all()
+            and (back[2] == quality).all()
+            and back[3] == [json.loads(m) if m else None for m in metas]):
+        raise RuntimeError(f"bloco do sensor {sensor_id} não confere com as leituras de origem")
+    return block
+
+
+def forget_brin_ranges(conn, freed):
+    """Desfaz o resumo do BRIN nas páginas de DELETE_MEASUREMENT_SQL (já commitado); retorna as faixas."""
+    rels, pages = freed
+    if not pages:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT eta.measurement_brin_forget(%s::regclass[], %s::int8[])", (rels, pages))
+        n = cur.fetchone()[0]
+    conn.commit()
+    return n
+
+
+def vacuum_measurement(conn):
+    """VACUUM ANALYZE em eta.measurement: devolve o espaço apagado e resume as faixas do BRIN desfeitas."""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = 0")
+            cur.execute("VACUUM ANALYZE eta.measurement")
+            cur.execute("RESET statement_timeout")
+    finally:
+        conn.autocommit = False
+
+
+def pack_day(conn, day, dry_run=False):
+    """Compacta um dia; retorna (sensores, leituras)."""
+    lo, hi = utc(day), utc(day + timedelta(days=1))
+    blocks = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute("SET LOCAL statement_timeout = 0")
+            cur.execute(f"""SELECT {BLOCK_COLUMNS} FROM eta.measurement_block
+                            WHERE ts_first >= %s AND ts_first < %s""", (lo, hi))
+            existing = {r[0]: r[1:] for r in cur.fetchall()}
+
+        rows_read = 0
+        with conn.cursor(name="pack_day") as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute("""SELECT sensor_id, (extract(epoch FROM ts) * 1000000)::int8, value, quality, meta::text
+                           FROM eta.measurement WHERE ts >= %s AND ts < %s
+                           ORDER BY sensor_id, ts""", (lo, hi))
+            sid, buf = None, []
+
+            def flush():
+                if buf:
+                    ts_us, values, quality, metas = zip(*buf)
+                    cols = (np.asarray(ts_us, dtype=np.int64), np.asarray(values, dtype=np.float64),
+                            np.asarray([q is not False for q in quality]), list(metas))
+                    blocks.append((sid, _encode(sid, cols, existing.get(sid))))
+
+            while True:
+                rows = cur.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                rows_read += len(rows)
+                if dry_run:
+                    continue
+                for r in rows:
+                    if r[0] != sid:
+                        flush()
+                        sid, buf = r[0], []
+                    buf.append(r[1:])
+            flush()
+
+        if dry_run or not blocks:
+            conn.rollback()
+            return len({b[0] for b in blocks}), rows_read
+
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM eta.measurement_block WHERE sensor_id = ANY(%s) AND ts_first >= %s AND ts_first < %s",
+                        ([b[0] for b in blocks], lo, hi))
+            execute_values(cur, """INSERT INTO eta.measurement_block
+                                        (sensor_id, ts_first, ts_last, n, value_min, value_max, value_sum,
+                                         ts_data, value_data, quality_data, meta_data)
+                                    VALUES %s""",
+                           [(s, _from_us(b["ts_first_us"]), _from_us(b["ts_last_us"]),
+                             b["n"], b["value_min"], b["value_max"], b["value_sum"], b["ts_data"],
+                             b["value_data"], b["quality_data"], b["meta_data"]) for s, b in blocks])
+            cur.execute("SET LOCAL eta.rollup_skip = 'on'")
+            cur.execute(DELETE_MEASUREMENT_SQL, (lo, hi))
+            freed = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    forget_brin_ranges(conn, freed)
+    return len(blocks), rows_read
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compacta dias fechados de eta.measurement em blocos por sensor")
+    ap.add_argument("--before", default=None,
+                    help="compacta dias anteriores a AAAA-MM-DD (padrão: hoje - BLOCK_KEEP_DAYS; dias mais "
+                         "recentes que isso só voltam às séries brutas da API se BLOCK_KEEP_DAYS dela também baixar)")
+    ap.add_argument("--dry-run", action="store_true", help="só conta o que seria compactado")
+    args = ap.parse_args()
+
+    if args.before:
+        before = datetime.strptime(args.before, "%Y-%m-%d").date()
+    else:
+        before = datetime.now(timezone.utc).date() - timedelta(days=BLOCK_KEEP_DAYS)
+
+    conn = pg_conn()
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(ts) FROM eta.measurement WHERE ts < %s", (utc(before),))
+        first = cur.fetchone()[0]
+    conn.commit()
+    if first is None:
+        print(f"OK: nada anterior a {before} no banco")
+        return
+
+    t0 = time.monotonic()
+    day = first.astimezone(timezone.utc).date()
+    total = 0
+    while day < before:
+        sensors, rows = pack_day(conn, day, dry_run=args.dry_run)
+        total += rows
+        if rows:
+            verb = "seriam compactadas" if args.dry_run else f"compactadas em {sensors} blocos"
+            print(f"[blocks] {day}: {rows} leituras {verb}")
+        day += timedelta(days=1)
+    if total and not args.dry_run:
+        t1 = time.monotonic()
+        vacuum_measurement(conn)
+        print(f"[blocks] VACUUM de eta.measurement em {time.monotonic() - t1:.1f}s")
+    conn.close()
+    print(f"OK: {total} leituras anteriores a {before} em {time.monotonic() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
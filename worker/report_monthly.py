@@ -4,8 +4,13 @@ from datetime import date
 import pandas as pd
 from sqlalchemy import create_engine, text
 
+from archive_measurements import ARCHIVE_DIR, read_archive
+from pack_blocks import BLOCK_COLUMNS, blocks_to_frame
+
 LOCAL_TZ = os.getenv("LOCAL_TZ", "America/Fortaleza")
 FEED_INTERVAL = int(os.getenv("FEED_INTERVAL", "5"))
+# aba Bruto só quando o mês tem até isso de leituras (o resto vem do rollup horário)
+REPORT_RAW_MAX_ROWS = int(os.getenv("REPORT_RAW_MAX_ROWS", "200000"))
 
 def month_bounds_local_to_utc(year: int, month: int):
     start_local = pd.Timestamp(year=year, month=month, day=1, tz=LOCAL_TZ)
@@ -13,19 +18,53 @@ def month_bounds_local_to_utc(year: int, month: int):
     return start_local.tz_convert("UTC").to_pydatetime(), end_local.tz_convert("UTC").to_pydatetime()
 
 def fetch_period(db_url, start_utc, end_utc):
+    """Rollup horário do período (eta.measurement_1h) e, se couber, as leituras brutas (banco + blocos + arquivo)."""
     eng = create_engine(db_url, pool_pre_ping=True)
     with eng.connect() as c:
         q = text("""
-            SELECT m.ts, s.tag, m.value, s.unit, m.quality, m.meta
-            FROM eta.measurement m
-            JOIN eta.sensor s ON s.id = m.sensor_id
-            WHERE m.ts >= :start_dt AND m.ts < :end_dt
-            ORDER BY m.ts ASC;
+            SELECT r.bucket AS ts, s.tag, s.unit, r.n, r.sum_value, r.min_value, r.max_value,
+                   r.last_ts, r.last_value
+            FROM eta.measurement_1h r
+            JOIN eta.sensor s ON s.id = r.sensor_id
+            WHERE r.bucket >= :start_dt AND r.bucket < :end_dt;
         """)
-        df = pd.read_sql(q, c, params={"start_dt": start_utc, "end_dt": end_utc})
-    df["ts"] = (pd.to_datetime(df["ts"], utc=True)
-                .dt.tz_convert(LOCAL_TZ).dt.tz_localize(None))
-    return df
+        hourly = pd.read_sql(q, c, params={"start_dt": start_utc, "end_dt": end_utc})
+        raw = None
+        if 0 < hourly["n"].sum() <= REPORT_RAW_MAX_ROWS:
+            q = text("""
+                SELECT m.ts, s.tag, m.value, s.unit, m.quality, m.meta
+                FROM eta.measurement m
+                JOIN eta.sensor s ON s.id = m.sensor_id
+                WHERE m.ts >= :start_dt AND m.ts < :end_dt
+                ORDER BY m.ts ASC;
+            """)
+            raw = pd.read_sql(q, c, params={"start_dt": start_utc, "end_dt": end_utc})
+            # meses já arquivados em Parquet (ver archive_measurements.py)
+            files = c.execute(text("""
+                SELECT a.path, s.tag, s.unit
+                FROM eta.measurement_archive a
+                JOIN eta.sensor s ON s.id = a.sensor_id
+                WHERE a.ts_min < :end_dt AND a.ts_max >= :start_dt;
+            """), {"start_dt": start_utc, "end_dt": end_utc}).fetchall()
+            if files:
+                archived = read_archive([(f.path, {"tag": f.tag, "unit": f.unit}) for f in files],
+                                        start_utc, end_utc, root=ARCHIVE_DIR)
+                raw = pd.concat([archived, raw], ignore_index=True).sort_values("ts")
+            # dias compactados em eta.measurement_block (ver pack_blocks.py)
+            blocks = c.execute(text(f"""
+                SELECT {BLOCK_COLUMNS} FROM eta.measurement_block
+                WHERE ts_first < :end_dt AND ts_first >= CAST(:start_dt AS timestamptz) - interval '1 day';
+            """), {"start_dt": start_utc, "end_dt": end_utc}).fetchall()
+            if blocks:
+                sensors = pd.read_sql(text("SELECT id AS sensor_id, tag, unit FROM eta.sensor"), c)
+                packed = blocks_to_frame(blocks, start_utc, end_utc).merge(sensors, on="sensor_id")
+                raw = pd.concat([packed[raw.columns], raw], ignore_index=True).sort_values("ts")
+            raw["ts"] = (pd.to_datetime(raw["ts"], utc=True)
+                         .dt.tz_convert(LOCAL_TZ).dt.tz_localize(None))
+    for col in ("ts", "last_ts"):
+        hourly[col] = (pd.to_datetime(hourly[col], utc=True)
+                       .dt.tz_convert(LOCAL_TZ).dt.tz_localize(None))
+    return hourly, raw
 
 def _autosize(ws, df):
     for i, col in enumerate(df.columns):
@@ -35,42 +74,44 @@ def _autosize(ws, df):
             max_len = 18
         ws.set_column(i, i, min(max_len + 2, 40))
 
-def build_excel(df, month_label):
+def _agg(hourly, keys):
+    g = (hourly.groupby(keys, as_index=False)
+               .agg(pontos=("n","sum"), total=("sum_value","sum"),
+                    minimo=("min_value","min"), maximo=("max_value","max")))
+    g["media"] = g["total"] / g["pontos"]
+    return g[keys + ["pontos","media","minimo","maximo"]].sort_values(keys)
+
+def build_excel(hourly, raw, month_label):
     import xlsxwriter  # garante que o pacote está disponível
     buf = io.BytesIO()
     with pd.ExcelWriter(buf, engine="xlsxwriter", datetime_format="yyyy-mm-dd HH:MM:SS") as xw:
-        if df.empty:
+        if hourly.empty:
             out = pd.DataFrame({"aviso":[f"Sem dados para {month_label}."]})
             out.to_excel(xw, sheet_name="Resumo", index=False)
             _autosize(xw.sheets["Resumo"], out)
             return buf.getvalue()
 
-        df["data"] = df["ts"].dt.date
-        df["hora"] = df["ts"].dt.floor("h")
+        hourly["data"] = hourly["ts"].dt.date
+        hourly["hora"] = hourly["ts"].dt.floor("h")
 
-        last = df.sort_values("ts").groupby("tag", as_index=False).tail(1)
-        resumo = (df.groupby("tag").agg(pontos=("value","count"),
-                                        media=("value","mean"),
-                                        minimo=("value","min"),
-                                        maximo=("value","max")).reset_index()
-                  .merge(last[["tag","value","ts","unit"]], on="tag", how="left")
-                 ).rename(columns={"value":"ultimo_valor","ts":"ultimo_ts","unit":"unidade"})
+        last = hourly.sort_values("last_ts").groupby("tag", as_index=False).tail(1)
+        resumo = (_agg(hourly, ["tag"])
+                  .merge(last[["tag","last_value","last_ts","unit"]], on="tag", how="left")
+                 ).rename(columns={"last_value":"ultimo_valor","last_ts":"ultimo_ts","unit":"unidade"})
 
         # completude (aprox.) em relação ao mês inteiro
         # obs: se gerar para um mês ainda em curso, o % será baixo por design
-        total_seconds = (pd.Timestamp(resumo["ultimo_ts"].max()) - pd.Timestamp(df["ts"].min())).total_seconds()
+        total_seconds = (pd.Timestamp(resumo["ultimo_ts"].max()) - pd.Timestamp(hourly["ts"].min())).total_seconds()
         esperado = max(1, int(total_seconds // FEED_INTERVAL))
         resumo["completude_%"] = (resumo["pontos"]/esperado*100).clip(upper=100).round(1)
 
-        diario = (df.groupby(["tag","data"], as_index=False)
-                    .agg(pontos=("value","count"), media=("value","mean"),
-                         minimo=("value","min"), maximo=("value","max"))
-                    .sort_values(["tag","data"]))
-        horario = (df.groupby(["tag","hora"], as_index=False)
-                    .agg(pontos=("value","count"), media=("value","mean"),
-                         minimo=("value","min"), maximo=("value","max"))
-                    .sort_values(["tag","hora"]))
-        bruto = df[["ts","tag","unit","value","quality","meta"]].sort_values("ts")
+        diario = _agg(hourly, ["tag","data"])
+        horario = _agg(hourly, ["tag","hora"])
+        if raw is not None:
+            bruto = raw[["ts","tag","unit","value","quality","meta"]].sort_values("ts")
+        else:
+            bruto = pd.DataFrame({"aviso":[f"{int(hourly['n'].sum())} leituras no mês; "
+                                           f"aba bruta limitada a {REPORT_RAW_MAX_ROWS} (REPORT_RAW_MAX_ROWS)."]})
 
         resumo.to_excel(xw, sheet_name="Resumo", index=False)
         diario.to_excel(xw, sheet_name="Diario", index=False)
@@ -98,8 +139,8 @@ def main():
     db_url = f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{db}"
 
     start_utc, end_utc = month_bounds_local_to_utc(args.year, args.month)
-    df = fetch_period(db_url, start_utc, end_utc)
-    data = build_excel(df, f"{args.month:02d}/{args.year}")
+    hourly, raw = fetch_period(db_url, start_utc, end_utc)
+    data = build_excel(hourly, raw, f"{args.month:02d}/{args.year}")
 
     os.makedirs(args.outdir, exist_ok=True)
     fname = os.path.join(args.outdir, f"relatorio_ETA_{args.year}-{args.month:02d}.xlsx")
@@ -0,0 +1,62 @@
+"""
+Aplicação manual das políticas de retenção (eta.retention_policy).
+
+O trabalho é do procedimento eta.retention_enforce
+(eta-stack/db/12_retention.sql): partições de measurement vencidas são
+descartadas inteiras e o resto sai em lotes pequenos por sensor, em ordem de
+ts, com COMMIT a cada lote. O worker (main.py) roda a mesma coisa a cada
+RETENTION_H horas; aqui dá para rodar na hora e ver o relatório.
+
+Uso:
+  python retention.py                  # aplica e mostra linhas/tempo por tabela
+  python retention.py --batch 20000
+  python retention.py --dry-run        # só conta o que seria apagado
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+from main import RETENTION_BATCH, enforce_retention, pg_conn
+
+
+def _report(runs):
+    by_target = defaultdict(lambda: [0, 0, 0, 0.0])
+    for target, _sensor_id, rows, partitions, elapsed in runs:
+        t = by_target[target]
+        t[0] += rows
+        t[1] += partitions
+        t[2] += 1
+        t[3] += elapsed.total_seconds()
+    for target, (rows, partitions, sensors, secs) in sorted(by_target.items()):
+        extra = f", {partitions} partições" if partitions else ""
+        print(f"[retention] {target}: {rows} linhas{extra} ({sensors} cortes) em {secs:.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Aplica as políticas de retenção de eta.retention_policy")
+    ap.add_argument("--batch", type=int, default=RETENTION_BATCH, help="linhas por lote (e por COMMIT)")
+    ap.add_argument("--dry-run", action="store_true", help="só conta o que seria apagado")
+    args = ap.parse_args()
+
+    if args.dry_run:
+        conn = pg_conn()
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = 0")
+            cur.execute("SELECT target, sensor_id, cutoff, rows FROM eta.retention_preview() WHERE rows > 0")
+            rows = cur.fetchall()
+        conn.close()
+        for target, sensor_id, cutoff, n in rows:
+            who = f"sensor {sensor_id}" if sensor_id is not None else "tabela"
+            print(f"[retention] {target} ({who}): {n} linhas anteriores a {cutoff:%Y-%m-%d %H:%M}")
+        print(f"OK: {sum(r[3] for r in rows)} linhas seriam apagadas")
+        return
+
+    t0 = time.monotonic()
+    runs = enforce_retention(args.batch)
+    _report(runs)
+    print(f"OK: {sum(r[2] for r in runs)} linhas apagadas em {time.monotonic() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
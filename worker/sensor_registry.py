@@ -0,0 +1,145 @@
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+# canal NOTIFY disparado pelo trigger de eta.sensor (db/02_sensor_notify.sql)
+SENSOR_CHANNEL = "eta_sensor"
+
+# tag, id, configuração de compressão (meta.compression, ver ingest_compress)
+# e de validação (faixa, decimais e meta.validation, ver ingest_validate)
+SENSOR_SQL = ("SELECT tag, id, meta->'compression', min_valid, max_valid, decimals, meta->'validation' "
+              "FROM eta.sensor")
+
+
+class SensorRegistry:
+    """
+    Cache em memória tag -> sensor_id usado pelo caminho de ingestão.
+
+    Carrega todos os sensores no início, cadastra tags desconhecidas em lote
+    (INSERT ... ON CONFLICT ... RETURNING) e acompanha sensores criados por
+    outros processos via LISTEN no canal `eta_sensor` ou, na falta dele, por
+    um refresh incremental (id > maior id conhecido) a cada `refresh_s`.
+    Guarda também a configuração de compressão e de validação de cada tag.
+    """
+
+    def __init__(self, device_id, refresh_s=300):
+        self.device_id = device_id
+        self.refresh_s = refresh_s
+        self._ids = {}
+        self._compression = {}
+        self._validity = {}
+        self._max_id = 0
+        self._next_refresh = 0.0
+        self._listen_conn = None
+        self._lock = threading.Lock()
+        # sensores cadastrados na transação ainda aberta de cada thread
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, tag):
+        return self._ids.get(tag)
+
+    def compression(self, tag):
+        return self._compression.get(tag)
+
+    def validity(self, tag):
+        """(min_valid, max_valid, decimals, meta.validation) da tag, ou None."""
+        return self._validity.get(tag)
+
+    def _store(self, rows, replace=False):
+        ids = {row[0]: row[1] for row in rows}
+        compression = {row[0]: row[2] for row in rows if row[2] is not None}
+        validity = {row[0]: row[3:] for row in rows if any(v is not None for v in row[3:])}
+        if replace:
+            self._ids, self._compression, self._validity = ids, compression, validity
+        else:
+            self._ids.update(ids)
+            self._compression.update(compression)
+            self._validity.update(validity)
+        self._max_id = max(self._ids.values(), default=0)
+
+    def load(self, conn, listen=True):
+        """
+        Carga completa. Com `listen`, assina o canal de mudanças nesta conexão,
+        que pode ser a mesma usada pelo writer ou uma conexão ociosa.
+        """
+        with conn.cursor() as cur:
+            if listen:
+                cur.execute(f"LISTEN {SENSOR_CHANNEL}")
+                self._listen_conn = conn
+            cur.execute(SENSOR_SQL)
+            rows = cur.fetchall()
+        conn.commit()
+        with self._lock:
+            self._store(rows, replace=True)
+            self._next_refresh = time.monotonic() + self.refresh_s
+        return self
+
+    def _pending_notifies(self, cur):
+        conn = self._listen_conn
+        if conn is None or conn.closed:
+            return []
+        if cur.connection is not conn:
+            # conexão ociosa: notificações só chegam após um poll()
+            conn.poll()
+        return conn.notifies
+
+    def _refresh(self, cur, notifies):
+        ops = {n.payload for n in notifies}
+        del notifies[:]
+        if ops - {"INSERT"}:
+            # remoção/renomeação de tag ou mudança de meta: recarrega tudo
+            cur.execute(SENSOR_SQL)
+            self._store(cur.fetchall(), replace=True)
+        else:
+            cur.execute(SENSOR_SQL + " WHERE id > %s", (self._max_id,))
+            self._store(cur.fetchall())
+        self._next_refresh = time.monotonic() + self.refresh_s
+
+    def resolve(self, cur, units_by_tag):
+        """
+        Retorna {tag: sensor_id} para as tags informadas ({tag: unit}).
+        Tags ausentes do cache são cadastradas em lote no cursor recebido; os
+        ids novos só entram no cache compartilhado em `commit()`, para que
+        outras threads não usem um sensor ainda não visível para elas.
+        """
+        with self._lock:
+            notifies = self._pending_notifies(cur)
+            if notifies or time.monotonic() >= self._next_refresh:
+                self._refresh(cur, notifies)
+
+            missing = [(self.device_id, tag, unit) for tag, unit in units_by_tag.items() if tag not in self._ids]
+            if missing:
+                created = execute_values(
+                    cur,
+                    """INSERT INTO eta.sensor (device_id, tag, unit) VALUES %s
+                       ON CONFLICT (tag) DO NOTHING
+                       RETURNING tag, id""",
+                    missing,
+                    fetch=True,
+                )
+                self._local.pending = dict(created)
+                # criados (e já commitados) em paralelo por outra thread/processo
+                raced = [tag for _, tag, _ in missing if tag not in self._local.pending]
+                if raced:
+                    cur.execute("SELECT tag, id FROM eta.sensor WHERE tag = ANY(%s)", (raced,))
+                    self._ids.update(cur.fetchall())
+                    self._max_id = max(self._ids.values(), default=0)
+
+            pending = getattr(self._local, "pending", {})
+            return {tag: self._ids.get(tag) or pending[tag] for tag in units_by_tag}
+
+    def commit(self):
+        """Publica no cache os sensores cadastrados pela transação desta thread."""
+        pending = getattr(self._local, "pending", None)
+        if pending:
+            with self._lock:
+                self._ids.update(pending)
+                self._max_id = max(self._ids.values(), default=0)
+        self._local.pending = {}
+
+    def rollback(self):
+        self._local.pending = {}
@@ -0,0 +1,159 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import ingest_async
+import ingest_batch
+from ingest_batch import write_batch
+from ingest_parse import parse_message
+
+
+class Cursor:
+    def __init__(self):
+        self.copied = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, buf):
+        self.copied = buf.getvalue()
+
+
+class Conn:
+    def __init__(self):
+        self.cur = Cursor()
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    closed = False
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class Registry:
+    def resolve(self, cur, units_by_tag):
+        return {tag: i + 1 for i, tag in enumerate(sorted(units_by_tag))}
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_write_batch_com_fusos_misturados(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ingest_batch, "execute_values", lambda cur, sql, rows, **kw: calls.append((sql, rows)))
+    batch = [parse_message("eta/leituras/x", json.dumps({"tag": "a", "value": v, "ts": ts}).encode())
+             for v, ts in ((1, "2025-01-01T00:00:01Z"), (2, "2025-01-01T00:00:02"), (3, "2025-01-01T00:00:00Z"))]
+    conn = Conn()
+    write_batch(conn, Registry(), batch)
+    assert conn.commits == 1
+    latest = [rows for sql, rows in calls if "sensor_latest" in sql]
+    assert latest == [[(1, datetime(2025, 1, 1, 0, 0, 2, tzinfo=timezone.utc), 2.0, True, "{}")]]
+
+
+class AsyncCM:
+    def __init__(self, value=None):
+        self.value = value
+
+    async def __aenter__(self):
+        return self.value
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class AsyncCopy:
+    def set_types(self, types):
+        pass
+
+    async def write_row(self, row):
+        pass
+
+
+class AsyncConn:
+    def __init__(self):
+        self.calls = []
+
+    def transaction(self):
+        return AsyncCM()
+
+    def cursor(self):
+        class Cur:
+            def copy(self, sql):
+                return AsyncCM(AsyncCopy())
+        return Cur()
+
+    async def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+
+class AsyncPool:
+    def __init__(self):
+        self.conn = AsyncConn()
+
+    def connection(self):
+        return AsyncCM(self.conn)
+
+
+class AsyncRegistry:
+    async def resolve(self, conn, units_by_tag):
+        return {tag: i + 1 for i, tag in enumerate(sorted(units_by_tag))}, {}
+
+    def publish(self, created):
+        pass
+
+
+def test_write_batch_async_com_fusos_misturados():
+    batch = [parse_message("eta/leituras/x", json.dumps({"tag": "a", "value": v, "ts": ts}).encode())
+             for v, ts in ((1, "2025-01-01T00:00:01Z"), (2, "2025-01-01T00:00:02"))]
+    pool = AsyncPool()
+    asyncio.run(ingest_async.write_batch(pool, AsyncRegistry(), batch))
+    latest = [params for sql, params in pool.conn.calls if "sensor_latest" in sql]
+    assert latest[0][:3] == ([1], [datetime(2025, 1, 1, 0, 0, 2, tzinfo=timezone.utc)], [2.0])
+
+
+def test_batch_writer_isola_mensagem_recusada(monkeypatch):
+    written = []
+
+    def fake_write(conn, registry, batch):
+        if len(batch) > 1 or batch[0]["payload_json"] == "ruim":
+            raise ValueError("recusada")
+        written.append(batch[0])
+
+    monkeypatch.setattr(ingest_batch, "write_batch", fake_write)
+    msgs = [dict(parse_message("eta/leituras/x", json.dumps({"tag": "a", "value": i}).encode())) for i in range(3)]
+    msgs[1]["payload_json"] = "ruim"
+    writer = ingest_batch.BatchWriter(Conn(), Registry(), max_rows=3)
+    for m in msgs:
+        writer.add(m)
+    assert [m["status"] for m in written] == ["parsed", "failed", "parsed"]
+    assert written[1]["err"] == "recusada" and written[1]["readings"] == []
+    assert (writer.batches_failed, writer.rejected, writer.dropped) == (1, 1, 0)
+
+
+def test_writer_async_isola_mensagem_recusada(monkeypatch):
+    written = []
+
+    async def fake_write(pool, registry, batch):
+        if len(batch) > 1 or batch[0]["payload_json"] == "ruim":
+            raise ValueError("recusada")
+        written.append(batch[0])
+
+    monkeypatch.setattr(ingest_async, "write_batch", fake_write)
+    msgs = [dict(parse_message("eta/leituras/x", json.dumps({"tag": "a", "value": i}).encode())) for i in range(3)]
+    msgs[1]["payload_json"] = "ruim"
+    stats = ingest_async.Stats()
+    asyncio.run(ingest_async.write_each(None, None, msgs, stats, None))
+    assert [m["status"] for m in written] == ["parsed", "failed", "parsed"]
+    assert (stats.written, stats.rejected, stats.dropped) == (2, 1, 0)
@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta, timezone
+
+from ingest_compress import Compressor
+
+
+class Registry:
+    def compression(self, tag):
+        return {"method": "swinging_door", "abs": 0.5}
+
+
+def msg(i, value):
+    ts = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i)
+    return {"readings": [{"tag": "a", "ts": ts, "value": value, "meta": None}]}
+
+
+def test_flush_grava_o_ponto_retido():
+    c = Compressor(Registry())
+    kept = [r["value"] for i, v in enumerate([1.0, 1.1, 1.2]) for r in c.apply(msg(i, v))["readings"]]
+    assert kept == [1.0]
+    held = c.flush()
+    assert held["no_raw"] and [r["value"] for r in held["readings"]] == [1.2]
+    assert c.flush() is None
+    assert c.stats()["out"] == 2
@@ -0,0 +1,29 @@
+import json
+from datetime import datetime, timezone
+
+from ingest_parse import parse_message, parse_ts
+from ingest_validate import Validator
+
+
+class Registry:
+    def validity(self, tag):
+        return None
+
+
+def test_parse_ts_sem_fuso_vira_utc():
+    utc = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert parse_ts("2025-01-01T00:00:00") == utc
+    assert parse_ts("2025-01-01T00:00:00Z") == utc
+    assert parse_ts("20250101T000000") == utc  # só o dateutil entende
+    assert parse_ts(datetime(2025, 1, 1)) == utc
+    assert parse_ts(None, datetime(2025, 1, 1)) == utc
+
+
+def test_payload_com_fusos_misturados_valida():
+    payload = json.dumps([{"tag": "a", "value": 1, "ts": "2025-01-01T00:00:00"},
+                          {"tag": "a", "value": 2, "ts": "2025-01-01T00:00:01Z"}]).encode()
+    parsed = parse_message("eta/leituras/x", payload)
+    assert parsed["status"] == "parsed"
+    assert all(r["ts"].tzinfo is not None for r in parsed["readings"])
+    Validator(Registry()).apply([parsed])
+    assert [r["value"] for r in sorted(parsed["readings"], key=lambda r: r["ts"])] == [1.0, 2.0]